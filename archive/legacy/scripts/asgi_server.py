@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+ASGI Signature Server
+Serves the signature service on an event loop. The I/O-bound routes that get
+hit in bursts (PDF viewing, job progress events, AI parsing, email and
+signature submission) are handled natively here. Their blocking pieces (file
+reads, SQLite, the model SDK, PIL/pypdf stamping) run on bounded executors,
+so a slow call never holds up other requests. Every other route is served by
+the Flask app (signature_server.py) through asgiref's WSGI adapter. DOCX
+filling and PDF conversion already run on the job queue and the LibreOffice
+pool.
+
+Run it with run_server.py (or any ASGI server: uvicorn asgi_server:app).
+
+Settings (environment):
+  OFFER_ASGI_IO_WORKERS   threads for blocking I/O (default 32)
+  OFFER_ASGI_CPU_WORKERS  threads for signature stamping (default: CPU count)
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from urllib.parse import parse_qs, quote
+
+from asgiref.wsgi import WsgiToAsgi
+
+import profiling
+import signature_server
+from batch_parse import MAX_BATCH_BYTES, BatchInputError, iter_batch, split_blurbs
+from candidate_parser import get_parser
+from http_files import conditional_status, file_etag, open_first
+from jobs import get_job_queue
+from offer_store import VIEWED, get_offer_store
+from signature_server import queue_offer_email
+from signature_store import MAX_REQUEST_BYTES, MAX_SIGNATURE_BYTES, SignatureTooLarge, decode_data_url
+from signing import sign_offer
+
+IO_WORKERS = int(os.getenv('OFFER_ASGI_IO_WORKERS', '32'))
+CPU_WORKERS = int(os.getenv('OFFER_ASGI_CPU_WORKERS', str(os.cpu_count() or 2)))
+MAX_JSON_BYTES = 1024 * 1024
+CHUNK_SIZE = 256 * 1024
+SSE_POLL_SECONDS = 0.25
+SSE_KEEPALIVE_SECONDS = 15
+
+IO_EXECUTOR = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='asgi-io')
+CPU_EXECUTOR = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix='asgi-cpu')
+
+_routes = []
+_wsgi = WsgiToAsgi(signature_server.app)
+
+
+class BodyTooLarge(Exception):
+    """Raised when a request body exceeds its limit"""
+
+
+class Request:
+    """The parts of an ASGI HTTP request the native routes use"""
+
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                        for name, value in scope['headers']}
+        self.args = {key: values[0] for key, values in
+                     parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+
+    @property
+    def mimetype(self):
+        return self.headers.get('content-type', '').split(';')[0].strip().lower()
+
+    async def body(self, limit):
+        """The whole body, failing as soon as it grows past `limit` bytes"""
+        if int(self.headers.get('content-length') or 0) > limit:
+            raise BodyTooLarge(f'Request body larger than {limit // 1024} KB')
+        chunks, size = [], 0
+        while True:
+            message = await self.receive()
+            if message['type'] == 'http.disconnect':
+                raise ConnectionError('Client disconnected')
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > limit:
+                raise BodyTooLarge(f'Request body larger than {limit // 1024} KB')
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def json(self, limit=MAX_JSON_BYTES):
+        return json.loads(await self.body(limit) or b'{}')
+
+
+def route(method, pattern):
+    """Register a native handler for METHOD /path (regex groups become keyword arguments)"""
+    def decorate(handler):
+        _routes.append((method, re.compile(f'^{pattern}$'), handler))
+        return handler
+    return decorate
+
+
+def run_io(func, *args):
+    return asyncio.get_running_loop().run_in_executor(IO_EXECUTOR, func, *args)
+
+
+def run_cpu(func, *args):
+    return asyncio.get_running_loop().run_in_executor(CPU_EXECUTOR, func, *args)
+
+
+async def respond(send, status, body=b'', content_type='application/json', headers=()):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type.encode()),
+                            (b'content-length', str(len(body)).encode())]
+                           + [(name.encode(), value.encode('latin-1')) for name, value in headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def respond_json(send, body, status=200, headers=()):
+    await respond(send, status, json.dumps(body).encode(), headers=headers)
+
+
+async def respond_stream(send, status, content_type, chunks, headers=()):
+    """Send an async iterator of bytes as a chunked response"""
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type.encode())]
+                           + [(name.encode(), value.encode('latin-1')) for name, value in headers]})
+    async for chunk in chunks:
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def _content_disposition(kind, filename):
+    fallback = filename.encode('ascii', 'replace').decode().replace('"', '')
+    return f"{kind}; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+
+async def respond_pdf(request, send, path, download_name=None, as_attachment=False):
+    """Conditional, range-capable PDF response read off the event loop; the status, or None if missing"""
+    found = await run_io(open_first, [path] if path else [])
+    if found is None:
+        return None
+    f, path, stat = found
+    try:
+        etag = f'"{file_etag(stat)}"'
+        headers = [
+            ('etag', etag),
+            ('last-modified', formatdate(int(stat.st_mtime), usegmt=True)),
+            ('cache-control', 'no-cache'),
+            ('content-disposition', _content_disposition('attachment' if as_attachment else 'inline',
+                                                         download_name or path.name)),
+        ]
+        # Same decisions as the Flask app's make_conditional (see http_files.py)
+        x_sendfile = signature_server.app.config.get('USE_X_SENDFILE')
+        status, byte_range = conditional_status(request.headers, stat, ranges=not x_sendfile)
+        if status in (304, 412):
+            await respond(send, status, content_type='application/pdf', headers=headers)
+            return status
+        if status == 416:
+            await respond(send, 416, content_type='application/pdf',
+                          headers=[('content-range', f'bytes */{stat.st_size}')])
+            return 416
+        if x_sendfile:
+            # The front-end server streams the file (and handles ranges itself)
+            await respond(send, 200, content_type='application/pdf',
+                          headers=headers + [('x-sendfile', str(os.path.abspath(path)))])
+            return 200
+
+        start, end = 0, stat.st_size - 1
+        if byte_range:
+            start, end = byte_range[0], byte_range[1] - 1
+            headers.append(('content-range', f'bytes {start}-{end}/{stat.st_size}'))
+
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/pdf'), (b'accept-ranges', b'bytes'),
+                                (b'content-length', str(end - start + 1).encode())]
+                               + [(name.encode(), value.encode('latin-1')) for name, value in headers]})
+        remaining = end - start + 1
+        if start:
+            await run_io(f.seek, start)
+        while remaining > 0:
+            chunk = await run_io(f.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': remaining > 0})
+        if remaining > 0:
+            # File shrank underneath us; end the response rather than hang
+            await send({'type': 'http.response.body', 'body': b''})
+        return status
+    finally:
+        f.close()
+
+
+# --- native routes ----------------------------------------------------------
+
+@route('GET', r'/api/offer-pdf/(?P<candidate_name>[^/]+)')
+async def offer_pdf(request, send, candidate_name):
+    profile_name = request.args.get('profile', 'melange')
+    store = get_offer_store()
+    pdf_file = await run_io(store.artifact, profile_name, candidate_name, 'pdf')
+    status = await respond_pdf(request, send, pdf_file)
+    if status is None:
+        await respond_json(send, {'success': False, 'message': f'PDF for {candidate_name} not found'}, 404)
+    elif status == 200 and request.args.get('view') == 'candidate':
+        # Admin previews use the same route; only the signing page's request is a view
+        await run_io(store.advance, profile_name, candidate_name, VIEWED)
+
+
+@route('GET', r'/api/signed-pdf/(?P<candidate_name>[^/]+)')
+async def signed_pdf(request, send, candidate_name):
+    profile_name = request.args.get('profile', 'melange')
+    pdf_file = await run_io(get_offer_store().artifact, profile_name, candidate_name, 'signed_pdf')
+    if await respond_pdf(request, send, pdf_file, as_attachment=True,
+                         download_name=f'offer_letter_{candidate_name}_signed.pdf') is None:
+        await respond_json(send, {'success': False, 'message': 'Signed PDF not found'}, 404)
+
+
+@route('GET', r'/api/jobs/(?P<job_id>[0-9a-f]+)/events')
+async def job_events(request, send, job_id):
+    """Server-sent events without a thread per open connection"""
+    job = get_job_queue().get(job_id)
+    if not job:
+        await respond_json(send, {'success': False, 'message': 'Job not found'}, 404)
+        return
+
+    async def events():
+        stage = None
+        idle = 0.0
+        while True:
+            if job.stage != stage:
+                stage = job.stage
+                idle = 0.0
+                yield f"event: {stage}\ndata: {json.dumps(job.to_dict())}\n\n".encode()
+                if job.done:
+                    return
+            elif idle >= SSE_KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield b": keep-alive\n\n"
+            await asyncio.sleep(SSE_POLL_SECONDS)
+            idle += SSE_POLL_SECONDS
+
+    await respond_stream(send, 200, 'text/event-stream', events(),
+                         headers=[('cache-control', 'no-cache'), ('x-accel-buffering', 'no')])
+
+
+@route('POST', r'/api/ai-parse')
+async def ai_parse(request, send):
+    data = await request.json()
+    prompt = data.get('prompt')
+    if not prompt:
+        await respond_json(send, {'success': False, 'message': 'No prompt provided'}, 400)
+        return
+    result = await run_io(lambda: get_parser().parse(prompt))
+    if result['error']:
+        print(f"AI Error (using local fields only): {result['error']}")
+    await respond_json(send, {'success': True, 'data': result['data'], 'sources': result['sources'],
+                              'warning': result['error']})
+
+
+@route('POST', r'/api/ai-parse/batch')
+async def ai_parse_batch(request, send):
+    try:
+        texts = split_blurbs(await request.body(MAX_BATCH_BYTES), request.mimetype)
+    except BodyTooLarge:
+        await respond_json(send, {'success': False, 'message': 'Batch too large'}, 413)
+        return
+    except BatchInputError as e:
+        await respond_json(send, {'success': False, 'message': str(e)}, 400)
+        return
+
+    async def lines():
+        async for item in iter_batch(texts):
+            yield (json.dumps(item) + '\n').encode()
+
+    await respond_stream(send, 200, 'application/x-ndjson', lines(),
+                         headers=[('cache-control', 'no-cache'), ('x-accel-buffering', 'no')])
+
+
+@route('POST', r'/api/send-email')
+async def send_email(request, send):
+    data = await request.json()
+    body, status = await run_io(queue_offer_email, data, request.headers.get('idempotency-key'))
+    await respond_json(send, body, status)
+
+
+@route('POST', r'/api/submit-signature')
+async def submit_signature(request, send):
+    if request.mimetype.startswith('multipart/'):
+        # Form uploads go through werkzeug's multipart parser
+        await _wsgi(request.scope, request.receive, send)
+        return
+    try:
+        if request.mimetype.startswith('image/'):
+            data = request.args
+            signature_bytes = await request.body(MAX_SIGNATURE_BYTES)
+        else:
+            data = await request.json(MAX_REQUEST_BYTES)
+            signature_bytes = decode_data_url(data.get('signature', ''))
+    except (BodyTooLarge, SignatureTooLarge) as e:
+        await respond_json(send, {'success': False, 'message': str(e)}, 413)
+        return
+    except ValueError as e:
+        await respond_json(send, {'success': False, 'message': str(e)}, 400)
+        return
+
+    flag = request.headers.get(profiling.PROFILE_HEADER.lower()) or request.args.get(profiling.PROFILE_PARAM)
+    request_id = profiling.new_request_id(request.headers.get('x-request-id')) if profiling.wanted(flag) else None
+
+    def work():
+        if request_id is None:
+            return sign_offer(data, signature_bytes)
+        with profiling.profile(request_id):
+            return sign_offer(data, signature_bytes)
+
+    try:
+        body, status = await run_cpu(work)
+    except SignatureTooLarge as e:
+        body, status = {'success': False, 'message': str(e)}, 413
+    except ValueError as e:
+        body, status = {'success': False, 'message': str(e)}, 400
+    await respond_json(send, body, status, headers=[('x-request-id', request_id)] if request_id else ())
+
+
+# --- application ------------------------------------------------------------
+
+def _with_cors(request, send):
+    """Match flask-cors on native routes (preflights still go to the Flask app)"""
+    if 'origin' not in request.headers:
+        return send
+
+    async def send_with_cors(message):
+        if message['type'] == 'http.response.start':
+            message = {**message, 'headers': message['headers'] + [(b'access-control-allow-origin', b'*')]}
+        await send(message)
+    return send_with_cors
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, signature_server.startup)
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            print(f"🚀 Signature server (ASGI) ready in process {os.getpid()}")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            IO_EXECUTOR.shutdown(wait=False)
+            CPU_EXECUTOR.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI entry point: native routes first, then the Flask app"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] == 'http':
+        for method, pattern, handler in _routes:
+            match = pattern.match(scope['path'])
+            if match and scope['method'] == method:
+                request = Request(scope, receive)
+                send = _with_cors(request, send)
+                started = time.perf_counter()
+                try:
+                    await handler(request, send, **match.groupdict())
+                except BodyTooLarge as e:
+                    await respond_json(send, {'success': False, 'message': str(e)}, 413)
+                except ValueError as e:
+                    # Malformed JSON body
+                    await respond_json(send, {'success': False, 'message': str(e)}, 400)
+                except ConnectionError:
+                    pass
+                except Exception as e:
+                    print(f"❌ {scope['method']} {scope['path']} failed after "
+                          f"{time.perf_counter() - started:.2f}s: {e}")
+                    await respond_json(send, {'success': False, 'message': str(e)}, 500)
+                return
+    await _wsgi(scope, receive, send)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Parallel Bulk Offer Generation
+Fans candidates out over a process pool (each worker caches its profile and
+compiled template) and pipes every filled letter into the shared PDF converter pool.
+Profiles with a letter spec draw their PDFs natively inside the workers instead.
+With --merge, letters are converted OFFER_MERGE_SIZE at a time as one merged
+document and split back into per-letter PDFs (mail_merge.py).
+Usage: python3 offer.py batch <profile> <candidate.json>... [--workers N] [--no-pdf] [--merge]
+"""
+
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import pdf_pool
+from generate_offer import (build_replacements, fill_offer_letter, index_letter, letter_spec,
+                            load_profile, offer_docx_path, record_anchor)
+from template_engine import load_template
+
+# Per-worker state, set once by _init_worker
+_worker_profile = None
+
+
+def _init_worker(profile_name, profile):
+    """Cache the profile and compile its template once per worker process"""
+    global _worker_profile
+    _worker_profile = (profile_name, profile)
+    load_template(profile['template_docx'])
+    letter_spec(profile)
+
+
+def _fill_candidate(candidate_file, pdf=False):
+    """Fill one letter inside a worker; returns (candidate data, docx path, native PDF path or None)"""
+    profile_name, profile = _worker_profile
+    with open(candidate_file, 'r') as f:
+        data = json.load(f)
+    docx_out = offer_docx_path(profile_name, data)
+    fill_offer_letter(profile['template_docx'], data, profile, docx_out)
+    spec = letter_spec(profile) if pdf else None
+    if spec is None:
+        return data, docx_out, None
+    pdf_out = spec.render(build_replacements(data, profile), docx_out.with_suffix('.pdf'))
+    record_anchor(pdf_out)
+    return data, docx_out, pdf_out
+
+
+def run_batch(profile_name, candidate_files, workers=None, pdf=True, merge=False):
+    """Generate letters for many candidates; returns one result dict per input file, in order"""
+    profile = load_profile(profile_name)
+    if not Path(profile['template_docx']).exists():
+        raise FileNotFoundError(f"Template not found: {profile['template_docx']}")
+
+    workers = workers or os.cpu_count() or 1
+    # One result per input, even when a file is listed twice or two files name the same candidate
+    results = [{'file': str(f), 'name': None, 'docx': None, 'pdf': None, 'error': None, 'data': None}
+               for f in candidate_files]
+    # Letters that would land on the same output file would race; only the first one is generated
+    outputs = {}
+    for result in results:
+        try:
+            with open(result['file'], 'r') as f:
+                target = offer_docx_path(profile_name, json.load(f))
+        except Exception:
+            continue  # Reported by the worker when it fails to fill
+        if target in outputs:
+            result['error'] = f"same output as {outputs[target]}: {target}"
+        else:
+            outputs[target] = result['file']
+
+    native = letter_spec(profile) is not None
+    pool = None
+    if pdf and not native:
+        try:
+            pool = pdf_pool.get_pool()
+        except pdf_pool.ConversionError as e:
+            print(f"⚠️  PDF conversion disabled: {e}")
+
+    conversions = {}
+    # Merged conversions block on the pool, so they wait in threads (one per soffice worker)
+    merger = ThreadPoolExecutor(max_workers=pool.size, thread_name_prefix='mail-merge') if pool and merge else None
+    chunk = []
+    if merger:
+        import mail_merge
+
+    def submit_chunk():
+        conversions[merger.submit(mail_merge.convert_merged, [result['docx'] for result in chunk], pool)] = list(chunk)
+        chunk.clear()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(profile_name, profile)) as executor:
+        fills = {executor.submit(_fill_candidate, result['file'], pdf and native): result
+                 for result in results if not result['error']}
+        for future in as_completed(fills):
+            result = fills[future]
+            try:
+                data, result['docx'], result['pdf'] = future.result()
+            except Exception as e:
+                result['error'] = f"fill failed: {e}"
+                continue
+            result['name'] = data['name']
+            result['data'] = data
+            index_letter(profile_name, data, docx=result['docx'], pdf=result['pdf'])
+            # Conversions start as soon as each letter (or each merge-sized chunk) is filled
+            if merger:
+                chunk.append(result)
+                if len(chunk) >= mail_merge.MERGE_SIZE:
+                    submit_chunk()
+            elif pool:
+                conversions[pool.submit(result['docx'], result['docx'].with_suffix('.pdf'))] = [result]
+    if chunk:
+        submit_chunk()
+
+    for future in as_completed(conversions):
+        batch = conversions[future]
+        try:
+            pdfs = future.result() if merger else [future.result()]
+        except Exception as e:
+            pdfs = [e] * len(batch)
+        for result, pdf_path in zip(batch, pdfs):
+            if isinstance(pdf_path, Exception):
+                result['error'] = f"PDF conversion failed: {pdf_path}"
+                continue
+            result['pdf'] = pdf_path
+            record_anchor(pdf_path)
+            index_letter(profile_name, result['data'], pdf=result['pdf'])
+    if merger:
+        merger.shutdown()
+
+    for result in results:
+        del result['data']
+    return results
+
+
+def main(argv):
+    workers = None
+    pdf = True
+    merge = False
+    args = []
+    i = 0
+    while i < len(argv):
+        if argv[i] == '--workers' and i + 1 < len(argv):
+            workers = int(argv[i + 1])
+            i += 2
+            continue
+        if argv[i] == '--no-pdf':
+            pdf = False
+        elif argv[i] == '--merge':
+            merge = True
+        else:
+            args.append(argv[i])
+        i += 1
+
+    wants_help = '-h' in args or '--help' in args
+    if len(args) < 2 or wants_help:
+        print("Usage: python3 offer.py batch <profile> <candidate.json>... [--workers N] [--no-pdf] [--merge]")
+        return 0 if wants_help else 1
+
+    profile_name, candidate_files = args[0], args[1:]
+    print(f"📋 Batch for profile {profile_name}: {len(candidate_files)} candidate(s), "
+          f"{workers or os.cpu_count()} worker(s)")
+
+    started = time.perf_counter()
+    try:
+        results = run_batch(profile_name, candidate_files, workers=workers, pdf=pdf, merge=merge)
+    except FileNotFoundError as e:
+        print(f"❌ {e}")
+        return 1
+    elapsed = time.perf_counter() - started
+
+    failed = 0
+    for result in results:
+        if result['error']:
+            failed += 1
+            print(f"❌ {result['file']}: {result['error']}")
+        else:
+            print(f"✅ {result['name']}: {result['pdf'] or result['docx']}")
+
+    succeeded = len(results) - failed
+    rate = succeeded / elapsed if elapsed else 0.0
+    print(f"\n🎉 {succeeded}/{len(results)} letters in {elapsed:.2f}s ({rate:.1f} letters/s)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
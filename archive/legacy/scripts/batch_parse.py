@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Batch Candidate Parsing
+Splits a pasted spreadsheet (TSV/CSV with a header row), a JSON list, JSONL or
+blank-line separated text into candidate blurbs and parses them concurrently.
+The local tier and cache run inline; model calls run on asyncio with bounded
+concurrency and a rate limit, optionally packing several blurbs into one
+request. Results are yielded per item as they complete, with per-item errors.
+
+Settings (environment):
+  OFFER_AI_CONCURRENCY      model requests in flight (default 4)
+  OFFER_AI_RATE_PER_MINUTE  model requests per minute (default 60, 0 = unlimited)
+  OFFER_AI_PACK_SIZE        blurbs per model request (default 1 = no packing)
+  OFFER_AI_MAX_BATCH        largest accepted batch (default 500)
+"""
+
+import asyncio
+import csv
+import io
+import json
+import os
+import queue
+import threading
+
+import metrics
+from candidate_parser import get_parser
+from mailer import RateLimiter
+
+AI_CONCURRENCY = int(os.getenv('OFFER_AI_CONCURRENCY', '4'))
+AI_RATE_PER_MINUTE = float(os.getenv('OFFER_AI_RATE_PER_MINUTE', '60'))
+AI_PACK_SIZE = int(os.getenv('OFFER_AI_PACK_SIZE', '1'))
+MAX_BATCH_ITEMS = int(os.getenv('OFFER_AI_MAX_BATCH', '500'))
+MAX_BATCH_BYTES = 2 * 1024 * 1024
+
+
+class BatchInputError(ValueError):
+    """Raised when a batch body cannot be split into blurbs"""
+
+
+def _item_text(item):
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict):
+        if isinstance(item.get('prompt') or item.get('text'), str):
+            return item.get('prompt') or item.get('text')
+        # Structured rows read like a labelled form
+        return '\n'.join(f'{key}: {value}' for key, value in item.items() if value not in (None, ''))
+    raise BatchInputError(f'Unsupported batch item: {type(item).__name__}')
+
+
+def _table_rows(text, delimiter):
+    reader = csv.DictReader(io.StringIO(text), delimiter=delimiter)
+    return [{key.strip(): (value or '').strip() for key, value in row.items() if key}
+            for row in reader]
+
+
+def split_blurbs(body, mimetype=''):
+    """Candidate texts from a batch body (JSON list, JSONL, TSV/CSV or plain text)"""
+    text = body.decode('utf-8-sig') if isinstance(body, bytes) else body
+    stripped = text.strip()
+    if not stripped:
+        raise BatchInputError('Empty batch')
+    first_line = stripped.splitlines()[0]
+
+    try:
+        if mimetype == 'application/json' or stripped.startswith('['):
+            items = json.loads(stripped)
+            if isinstance(items, dict):
+                items = items.get('prompts') or items.get('items') or []
+            if not isinstance(items, list):
+                raise BatchInputError('Expected a JSON list of candidate texts')
+        elif mimetype in ('application/x-ndjson', 'application/jsonl') or stripped.startswith(('{', '"')):
+            items = [json.loads(line) for line in stripped.splitlines() if line.strip()]
+        elif mimetype == 'text/tab-separated-values' or '\t' in first_line:
+            items = _table_rows(stripped, '\t')
+        elif mimetype == 'text/csv':
+            items = _table_rows(stripped, ',')
+        else:
+            items = [block for block in stripped.split('\n\n') if block.strip()]
+    except ValueError as e:
+        if isinstance(e, BatchInputError):
+            raise
+        raise BatchInputError(f'Invalid batch body: {e}')
+
+    texts = [_item_text(item) for item in items]
+    if len(texts) > MAX_BATCH_ITEMS:
+        raise BatchInputError(f'Batch of {len(texts)} exceeds the limit of {MAX_BATCH_ITEMS}')
+    return texts
+
+
+def _call_model(model, limiter, chunk):
+    """Answers (or exceptions) for a chunk of pending parses, in order"""
+    if limiter:
+        limiter.acquire()
+    try:
+        with metrics.span('ai_model'):
+            return model.extract_many([(pending.text, pending.missing) for pending in chunk])
+    except Exception as e:
+        if len(chunk) == 1:
+            return [e]
+    # A packed reply that did not line up: ask for each blurb on its own
+    answers = []
+    for pending in chunk:
+        if limiter:
+            limiter.acquire()
+        try:
+            with metrics.span('ai_model'):
+                answers.append(model.extract(pending.text, pending.missing))
+        except Exception as e:
+            answers.append(e)
+    return answers
+
+
+async def parse_batch(texts, emit, parser=None, concurrency=AI_CONCURRENCY,
+                      rate_per_minute=AI_RATE_PER_MINUTE, pack_size=AI_PACK_SIZE):
+    """Parse texts, calling emit(index, result, error) once per text as it completes"""
+    parser = parser or get_parser()
+
+    # Identical (normalized) blurbs share one model call
+    waiting = {}
+    for index, text in enumerate(texts):
+        try:
+            pending = parser.start(text)
+        except Exception as e:
+            emit(index, None, e)
+            continue
+        if pending.needs_model:
+            waiting.setdefault(pending.key, []).append((index, pending))
+        else:
+            emit(index, parser.finish(pending), None)
+
+    limiter = RateLimiter(rate_per_minute) if rate_per_minute > 0 else None
+    in_flight = asyncio.Semaphore(max(1, concurrency))
+    pack_size = max(1, pack_size)
+    unique = [group[0][1] for group in waiting.values()]
+
+    async def run(chunk):
+        async with in_flight:
+            answers = await asyncio.to_thread(_call_model, parser.model, limiter, chunk)
+        for first, answer in zip(chunk, answers):
+            for index, pending in waiting[first.key]:
+                if not isinstance(answer, Exception):
+                    emit(index, parser.finish(pending, answer), None)
+                elif pending.local:
+                    emit(index, parser.finish(pending, error=answer), None)
+                else:
+                    emit(index, None, answer)
+
+    await asyncio.gather(*(run(unique[start:start + pack_size])
+                           for start in range(0, len(unique), pack_size)))
+
+
+def batch_item(index, result, error):
+    """Wire form of one parse outcome"""
+    if error is None:
+        return {'index': index, 'success': True, 'data': result['data'],
+                'sources': result['sources'], 'warning': result['error']}
+    return {'index': index, 'success': False, 'message': str(error)}
+
+
+async def iter_batch(texts, **options):
+    """Async iterator of per-item results (then a summary) for ASGI streaming"""
+    results = asyncio.Queue()
+    done = object()
+
+    async def run():
+        try:
+            await parse_batch(texts, lambda *outcome: results.put_nowait(batch_item(*outcome)), **options)
+        except Exception as e:
+            results.put_nowait({'success': False, 'message': f'Batch aborted: {e}'})
+        finally:
+            results.put_nowait(done)
+
+    task = asyncio.create_task(run())
+    failed = 0
+    try:
+        while True:
+            item = await results.get()
+            if item is done:
+                break
+            failed += not item['success']
+            yield item
+    finally:
+        # Client went away: stop issuing model calls
+        task.cancel()
+    yield {'done': True, 'total': len(texts), 'failed': failed}
+
+
+def stream_batch(texts, **options):
+    """Blocking iterator of per-item results (then a summary) for WSGI streaming"""
+    results = queue.Queue()
+    done = object()
+
+    def run():
+        try:
+            asyncio.run(parse_batch(texts, lambda *outcome: results.put(batch_item(*outcome)), **options))
+        except Exception as e:
+            results.put({'success': False, 'message': f'Batch aborted: {e}'})
+        finally:
+            results.put(done)
+
+    threading.Thread(target=run, daemon=True, name='ai-batch').start()
+    failed = 0
+    while True:
+        item = results.get()
+        if item is done:
+            break
+        failed += not item['success']
+        yield item
+    yield {'done': True, 'total': len(texts), 'failed': failed}
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Generation Pipeline Benchmarks
+Times every stage of letter generation for every template in templates/
+against the sample candidates in data/: python-docx load, the legacy
+replace_in_runs fill, Document.save, template compile, slot fill, package
+render and PDF conversion (skipped when LibreOffice is absent, or stubbed
+with --stub-convert). Each stage reports median wall time, median CPU time
+and peak traced memory; --baseline compares against a stored run and fails
+on regressions beyond the threshold. Runs fully offline.
+
+--startup instead times importing each `offer` CLI entry point in a fresh
+interpreter and fails if one exceeds its budget or loads a heavy dependency
+it defers (python-docx, pypdf, PIL, Flask, the Gemini SDK).
+
+Usage: python3 benchmark.py [--templates DIR] [--data DIR] [--repeat N]
+                            [--only NAME] [--baseline FILE] [--save-baseline]
+                            [--threshold 0.25] [--stub-convert] [--json FILE]
+       python3 benchmark.py --startup [--repeat N]
+"""
+
+import argparse
+import gc
+import json
+import shutil
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+
+from docx import Document
+
+import pdf_pool
+from generate_offer import build_replacements, replace_in_runs
+from template_engine import CompiledTemplate
+
+# Stand-in profile: build_replacements only reads these two keys
+BENCH_PROFILE = {'offer_validity_days': 7, 'probation_months': 3}
+# Differences below this are noise whatever the ratio
+NOISE_FLOOR_MS = 2.0
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+HEAVY_MODULES = ('docx', 'pypdf', 'PIL', 'flask', 'google.generativeai')
+# module -> (import budget in ms, heavy modules it may load at import)
+STARTUP_BUDGETS = {
+    'offer': (15, ()),
+    'signing': (40, ()),
+    'send_email': (120, ()),
+    'run_server': (200, ()),
+    'generate_offer': (250, ('docx',)),
+    'batch_generate': (280, ('docx',)),
+}
+STARTUP_PROBE = (
+    'import json, sys, time\n'
+    'started = time.perf_counter()\n'
+    'import {module}\n'
+    'print(json.dumps([(time.perf_counter() - started) * 1000, sorted(sys.modules)]))\n'
+)
+
+
+def legacy_fill(doc, replacements):
+    """The python-docx fill used before compiled templates (kept as the reference point)"""
+    paragraphs = list(doc.paragraphs)
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                paragraphs.extend(cell.paragraphs)
+    for paragraph in paragraphs:
+        for find_text, replace_text in replacements.items():
+            if find_text in paragraph.text and not replace_in_runs(paragraph, find_text, str(replace_text)):
+                if paragraph.runs:
+                    paragraph.runs[0].text = paragraph.text.replace(find_text, str(replace_text))
+                    for run in paragraph.runs[1:]:
+                        run.text = ''
+
+
+def load_candidates(data_dir):
+    candidates = []
+    for path in sorted(Path(data_dir).glob('*.json')):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        if isinstance(data, dict) and data.get('name'):
+            candidates.append(data)
+    return candidates
+
+
+def measure(func, repeat):
+    """Median wall/CPU milliseconds over `repeat` runs, plus peak traced KB of one extra run"""
+    func()  # warm-up: imports, caches, first-touch allocations
+    walls, cpus = [], []
+    for _ in range(repeat):
+        gc.collect()
+        wall, cpu = time.perf_counter(), time.process_time()
+        func()
+        walls.append((time.perf_counter() - wall) * 1000)
+        cpus.append((time.process_time() - cpu) * 1000)
+    # Memory is traced separately so tracing overhead does not skew the timings
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'wall_ms': round(statistics.median(walls), 3),
+        'cpu_ms': round(statistics.median(cpus), 3),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def template_stages(template_path, candidates, workdir, convert):
+    """(stage name, callable) pairs for one template; each call processes every candidate"""
+    replacement_sets = [build_replacements(data, BENCH_PROFILE) for data in candidates]
+    compiled = CompiledTemplate(template_path)
+    docx_out = workdir / 'bench.docx'
+    compiled.render(replacement_sets[0], docx_out)
+
+    def legacy_all():
+        for replacements in replacement_sets:
+            legacy_fill(Document(template_path), replacements)
+
+    def save_all():
+        doc = Document(template_path)
+        for _ in replacement_sets:
+            doc.save(BytesIO())
+
+    def fill_all():
+        for replacements in replacement_sets:
+            compiled.fill(replacements)
+
+    def render_all():
+        for replacements in replacement_sets:
+            compiled.render(replacements, docx_out)
+
+    stages = [
+        ('docx_load', lambda: [Document(template_path) for _ in replacement_sets]),
+        ('legacy_replace_in_runs', legacy_all),
+        ('docx_save', save_all),
+        ('compile', lambda: CompiledTemplate(template_path)),
+        ('fill', fill_all),
+        ('render', render_all),
+    ]
+    if convert == 'real':
+        stages.append(('convert', lambda: pdf_pool.convert_to_pdf(docx_out, workdir / 'bench.pdf')))
+    elif convert == 'stub':
+        # Only the file handling around conversion; LibreOffice itself is not measured
+        stages.append(('convert_stub', lambda: shutil.copyfile(docx_out, workdir / 'bench.pdf')))
+    return stages
+
+
+def startup_check(repeat):
+    """Median import time of every CLI entry point in a fresh interpreter, against its budget"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(SCRIPTS_DIR), os.getenv('PYTHONPATH')])))
+    print(f"{'entry point':<20}{'import ms':>10}{'budget ms':>10}  heavy modules loaded")
+    failures = []
+    for module, (budget, allowed) in STARTUP_BUDGETS.items():
+        times = []
+        for _ in range(max(1, repeat)):
+            output = subprocess.run([sys.executable, '-c', STARTUP_PROBE.format(module=module)], env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            elapsed, loaded = json.loads(output.strip().splitlines()[-1])
+            times.append(elapsed)
+        heavy = [name for name in HEAVY_MODULES if name in loaded]
+        median = statistics.median(times)
+        print(f"{module:<20}{median:>10.1f}{budget:>10}  {', '.join(heavy) or '-'}")
+        if median > budget:
+            failures.append(f"{module} imports in {median:.0f} ms (budget {budget} ms)")
+        unexpected = [name for name in heavy if name not in allowed]
+        if unexpected:
+            failures.append(f"{module} loads {', '.join(unexpected)} at import")
+    if failures:
+        print("\n❌ Start-up over budget:")
+        for failure in failures:
+            print(f"   {failure}")
+        return 1
+    print("\n✅ Every entry point within its start-up budget")
+    return 0
+
+
+def compare(results, baseline, threshold):
+    """Stage keys whose wall time regressed past the threshold"""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if not previous:
+            continue
+        delta = current['wall_ms'] - previous['wall_ms']
+        if delta > NOISE_FLOOR_MS and current['wall_ms'] > previous['wall_ms'] * (1 + threshold):
+            regressions.append((key, previous['wall_ms'], current['wall_ms']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark offer generation stages')
+    parser.add_argument('--templates', default='templates', help='directory searched for *.docx')
+    parser.add_argument('--data', default='data', help='directory of candidate JSON files')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', help='only templates whose path contains this text')
+    parser.add_argument('--baseline', help='baseline JSON to compare against (or write)')
+    parser.add_argument('--save-baseline', action='store_true', help='write results to --baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown (0.25 = 25%%)')
+    parser.add_argument('--stub-convert', action='store_true', help='stub PDF conversion instead of skipping it')
+    parser.add_argument('--json', help='also write results to this file')
+    parser.add_argument('--startup', action='store_true', help='check CLI start-up time instead')
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        return startup_check(args.repeat)
+
+    templates = sorted(p for p in Path(args.templates).rglob('*.docx') if not p.name.startswith('~$'))
+    if args.only:
+        templates = [p for p in templates if args.only in str(p)]
+    candidates = load_candidates(args.data)
+    if not templates or not candidates:
+        print(f"❌ Need templates in {args.templates}/ and candidates in {args.data}/")
+        return 1
+
+    if shutil.which(pdf_pool.SOFFICE_BIN):
+        convert = 'real'
+    else:
+        convert = 'stub' if args.stub_convert else None
+        print(f"⚠️  {pdf_pool.SOFFICE_BIN} not found: PDF conversion {'stubbed' if convert else 'skipped'}")
+
+    print(f"📋 {len(templates)} templates × {len(candidates)} candidates, {args.repeat} runs per stage\n")
+    print(f"{'template / stage':<58}{'wall ms':>10}{'cpu ms':>10}{'peak KB':>10}")
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='offer-bench-') as tmp:
+        for template_path in templates:
+            name = str(template_path.relative_to(args.templates))
+            print(f"📄 {name}")
+            try:
+                stages = template_stages(template_path, candidates, Path(tmp), convert)
+            except Exception as e:
+                print(f"   ❌ could not prepare: {e}")
+                continue
+            for stage, func in stages:
+                key = f'{name}::{stage}'
+                try:
+                    results[key] = measure(func, args.repeat)
+                except Exception as e:
+                    print(f"   ❌ {stage}: {e}")
+                    continue
+                r = results[key]
+                print(f"   {stage:<55}{r['wall_ms']:>10.2f}{r['cpu_ms']:>10.2f}{r['peak_kb']:>10.1f}")
+
+    if convert == 'real':
+        pdf_pool.get_pool().shutdown()
+
+    report = {'created_at': time.time(), 'candidates': len(candidates), 'repeat': args.repeat,
+              'results': results}
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+
+    if args.baseline and args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(report, indent=2))
+        print(f"\n✅ Baseline saved to {args.baseline}")
+    elif args.baseline:
+        try:
+            baseline = json.loads(Path(args.baseline).read_text())['results']
+        except FileNotFoundError:
+            print(f"\n⚠️  No baseline at {args.baseline}; run with --save-baseline first")
+            return 0
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} stage(s) slower than baseline by more than {args.threshold:.0%}:")
+            for key, before, after in regressions:
+                print(f"   {key}: {before:.2f} ms -> {after:.2f} ms ({after / before - 1:+.0%})")
+            return 1
+        print(f"\n✅ No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Candidate Text Parsing
+Two-tier extraction for the admin "AI Smart Fill": a local pattern extractor
+fills every field it recognizes confidently (email, phone, labelled dates,
+salary, name, role), and the language model is asked only for the fields
+still missing. Model answers are cached by a normalized prompt hash with a
+TTL and LRU eviction.
+
+Settings (environment):
+  OFFER_AI_MODEL        'gemini' (default) or 'fake' for a local stand-in
+  OFFER_AI_FAKE_DELAY_MS  latency of each fake model call (default 0)
+  OFFER_AI_CACHE_TTL    seconds a model answer is reused (default 86400)
+  OFFER_AI_CACHE_SIZE   cached answers kept (default 512)
+  GEMINI_API_KEY        required for the gemini model
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import metrics
+
+FIELDS = ('name', 'email', 'phone', 'position', 'start_date', 'salary', 'test_date')
+FIELD_DESCRIPTIONS = {
+    'name': 'Full name',
+    'email': 'Email address',
+    'phone': 'Phone number',
+    'position': 'Job title/role',
+    'start_date': 'Joining date (e.g. 5 January, 2026)',
+    'salary': 'Monthly salary (numeric or range)',
+    'test_date': 'Interview date',
+}
+
+AI_MODEL = os.getenv('OFFER_AI_MODEL', 'gemini')
+FAKE_DELAY = float(os.getenv('OFFER_AI_FAKE_DELAY_MS', '0')) / 1000
+GEMINI_MODEL_NAME = 'gemini-1.5-flash'
+CACHE_TTL = float(os.getenv('OFFER_AI_CACHE_TTL', '86400'))
+CACHE_SIZE = int(os.getenv('OFFER_AI_CACHE_SIZE', '512'))
+
+MONTHS = r'(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?'
+DATE_RE = re.compile(
+    rf'\b(?:\d{{1,2}}(?:st|nd|rd|th)?\s+{MONTHS},?\s+\d{{4}}'
+    rf'|{MONTHS}\s+\d{{1,2}}(?:st|nd|rd|th)?,?\s+\d{{4}}'
+    r'|\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4})\b', re.I)
+EMAIL_RE = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+PHONE_RE = re.compile(r'(?<![\w+])(?:\+?\d{1,3}[\s-]?)?(?:\d[\s-]?){9}\d(?!\w)')
+SALARY_RE = re.compile(
+    r'\b(?:salary|stipend|ctc|compensation|pay)\b[^\d\n]{0,30}?'
+    r'((?:₹|rs\.?|inr)?\s*\d[\d,]*(?:\.\d+)?\s*(?:k\b)?'
+    r'(?:\s*(?:-|to)\s*(?:₹|rs\.?|inr)?\s*\d[\d,]*(?:\.\d+)?\s*(?:k\b)?)?)', re.I)
+START_CONTEXT_RE = re.compile(r'\b(?:join|joining|start|starting|doj|commence|onboard)', re.I)
+TEST_CONTEXT_RE = re.compile(r'\b(?:test|interview|assessment)', re.I)
+LABEL_RE = {
+    'name': re.compile(r'^\s*(?:candidate\s+)?name\s*[:\-]\s*(.+?)\s*$', re.I | re.M),
+    'position': re.compile(r'^\s*(?:position|role|designation|job\s+title|post)\s*[:\-]\s*(.+?)\s*$',
+                           re.I | re.M),
+}
+
+_parser = None
+_parser_lock = threading.Lock()
+
+
+class ModelError(Exception):
+    """Raised when the model is unavailable or returns something unusable"""
+
+
+def normalize_text(text):
+    """NFKC, single spaces, no blank lines (line breaks are kept for labels)"""
+    lines = (' '.join(line.split()) for line in unicodedata.normalize('NFKC', text).splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def _clean_amount(text):
+    return re.sub(r'^(?:₹|rs\.?|inr)\s*', '', text.strip(), flags=re.I).strip()
+
+
+def extract_local(text):
+    """Fields recognized with certainty by patterns alone (missing ones are omitted)"""
+    found = {}
+    email = EMAIL_RE.search(text)
+    if email:
+        found['email'] = email.group(0)
+
+    phone_text = EMAIL_RE.sub(' ', text)
+    for phone in PHONE_RE.finditer(phone_text):
+        # Skip dates such as 01-02-2026 that happen to contain ten digits
+        if not DATE_RE.fullmatch(phone.group(0).strip()):
+            found['phone'] = phone.group(0).strip()
+            break
+
+    salary = SALARY_RE.search(text)
+    if salary:
+        found['salary'] = _clean_amount(salary.group(1))
+
+    # A date counts only when its own line/sentence says what it is for
+    for sentence in re.split(r'[\n;]|\.\s', text):
+        for date in DATE_RE.finditer(sentence):
+            before = sentence[:date.start()]
+            if 'test_date' not in found and TEST_CONTEXT_RE.search(before):
+                found['test_date'] = date.group(0)
+            elif 'start_date' not in found and START_CONTEXT_RE.search(before):
+                found['start_date'] = date.group(0)
+
+    for field, pattern in LABEL_RE.items():
+        match = pattern.search(text)
+        if match:
+            found[field] = match.group(1)
+    return found
+
+
+def parse_model_json(text):
+    """JSON object from a model reply, tolerating ```json fences"""
+    text = text.strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+    if text.endswith('```'):
+        text = text[:-3]
+    try:
+        data = json.loads(text.strip())
+    except ValueError as e:
+        raise ModelError(f'Model returned invalid JSON: {e}')
+    if not isinstance(data, (dict, list)):
+        raise ModelError('Model returned JSON that is not an object or list')
+    return data
+
+
+def extraction_prompt(text, fields):
+    lines = '\n'.join(f'- {field}: {FIELD_DESCRIPTIONS[field]}' for field in fields)
+    return (
+        'Extract candidate information from the following text and return it in JSON format.\n'
+        f'Fields to extract:\n{lines}\n\n'
+        "If a field is not found, leave it as an empty string. Output ONLY the JSON.\n\n"
+        f'Candidate Text: {text}'
+    )
+
+
+class CandidateModel(ABC):
+    """Interface for the remote extractor"""
+
+    @abstractmethod
+    def extract(self, text, fields):
+        """Return {field: value} for the requested fields"""
+
+    def extract_many(self, items):
+        """Answer several (text, fields) pairs; models that can pack them into one request override this"""
+        return [self.extract(text, fields) for text, fields in items]
+
+
+class GeminiModel(CandidateModel):
+    """Google Gemini, configured on first use"""
+
+    def __init__(self, api_key=None, model_name=GEMINI_MODEL_NAME):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                api_key = self.api_key or os.getenv('GEMINI_API_KEY')
+                if not api_key:
+                    raise ModelError('GEMINI_API_KEY not configured')
+                import google.generativeai as genai
+                genai.configure(api_key=api_key)
+                self._model = genai.GenerativeModel(self.model_name)
+            return self._model
+
+    def generate(self, prompt):
+        """Raw text reply for a prompt"""
+        return self._get_model().generate_content(prompt).text
+
+    def extract(self, text, fields):
+        data = parse_model_json(self.generate(extraction_prompt(text, fields)))
+        if not isinstance(data, dict):
+            raise ModelError('Model returned JSON that is not an object')
+        return {field: str(data.get(field) or '') for field in fields}
+
+    def extract_many(self, items):
+        """One request for all items: numbered texts in, a JSON array out"""
+        if len(items) == 1:
+            return [self.extract(*items[0])]
+        fields = [field for field in FIELDS if any(field in wanted for _, wanted in items)]
+        lines = '\n'.join(f'- {field}: {FIELD_DESCRIPTIONS[field]}' for field in fields)
+        texts = '\n\n'.join(f'### Text {number}\n{text}' for number, (text, _) in enumerate(items, start=1))
+        prompt = (
+            f'Extract candidate information from each of the {len(items)} numbered texts below.\n'
+            f'Return a JSON array with exactly one object per text, in the same order, with fields:\n{lines}\n\n'
+            "If a field is not found, leave it as an empty string. Output ONLY the JSON array.\n\n"
+            f'{texts}'
+        )
+        data = parse_model_json(self.generate(prompt))
+        if not isinstance(data, list) or len(data) != len(items) or not all(isinstance(d, dict) for d in data):
+            raise ModelError(f'Model returned {type(data).__name__} instead of {len(items)} objects')
+        return [{field: str(answer.get(field) or '') for field in wanted}
+                for answer, (_, wanted) in zip(data, items)]
+
+
+class FakeModel(CandidateModel):
+    """Deterministic stand-in: canned answers keyed by normalized text, else empty fields"""
+
+    def __init__(self, answers=None, delay=0.0):
+        self.answers = answers or {}
+        self.delay = delay
+        self.calls = 0
+
+    def extract(self, text, fields):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        answer = self.answers.get(text, {})
+        return {field: answer.get(field, '') for field in fields}
+
+
+class ResponseCache:
+    """In-memory TTL + LRU cache of model answers"""
+
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text, fields):
+        """Hash of a normalized prompt and the fields asked for"""
+        payload = json.dumps([normalize_text(text), sorted(fields)], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, dict(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+
+class PendingParse:
+    """One text after the local tier and the cache lookup"""
+
+    def __init__(self, text, local):
+        self.text = text
+        self.local = local
+        self.missing = [field for field in FIELDS if field not in local]
+        self.key = None
+        self.remote = None
+        self.source = None
+
+    @property
+    def needs_model(self):
+        return self.key is not None and self.remote is None
+
+
+class CandidateParser:
+    """Local extractor first, model (cached) only for what is left"""
+
+    def __init__(self, model=None, cache=None):
+        self.model = model
+        self.cache = cache if cache is not None else ResponseCache()
+
+    def start(self, text):
+        """Run the local tier and the cache lookup"""
+        text = normalize_text(text)
+        pending = PendingParse(text, extract_local(text))
+        if pending.missing and self.model is not None:
+            pending.key = self.cache.key(text, pending.missing)
+            pending.remote = self.cache.get(pending.key)
+            pending.source = 'cache'
+        return pending
+
+    def finish(self, pending, remote=None, error=None):
+        """Merge a model answer (or failure) into the result
+
+        Returns {'data': every field as a string, 'sources': tier per filled field,
+        'error': model failure message or None}.
+        """
+        if remote is not None:
+            self.cache.put(pending.key, remote)
+            pending.remote, pending.source = remote, 'model'
+        data = {field: '' for field in FIELDS}
+        data.update(pending.local)
+        sources = {field: 'local' for field in pending.local}
+        for field in pending.missing:
+            if pending.remote and pending.remote.get(field):
+                data[field] = pending.remote[field]
+                sources[field] = pending.source
+        return {'data': data, 'sources': sources, 'error': str(error) if error else None}
+
+    def parse(self, text):
+        """Parse one text; a model failure is only raised when the local tier found nothing either"""
+        pending = self.start(text)
+        if not pending.needs_model:
+            return self.finish(pending)
+        try:
+            with metrics.span('ai_model'):
+                remote = self.model.extract(pending.text, pending.missing)
+        except Exception as e:
+            if not pending.local:
+                raise
+            return self.finish(pending, error=e)
+        return self.finish(pending, remote)
+
+
+def create_model(kind=AI_MODEL):
+    """Model named by OFFER_AI_MODEL ('gemini' or 'fake')"""
+    if kind == 'fake':
+        return FakeModel(delay=FAKE_DELAY)
+    if kind == 'gemini':
+        return GeminiModel()
+    raise ValueError(f'Unknown OFFER_AI_MODEL: {kind}')
+
+
+def get_parser():
+    """Process-wide parser"""
+    global _parser
+    with _parser_lock:
+        if _parser is None:
+            _parser = CandidateParser(create_model())
+            metrics.counter('offer_ai_cache_hits_total', 'AI parse answers served from cache',
+                            read=lambda: _parser.cache.hits)
+            metrics.counter('offer_ai_cache_misses_total', 'AI parse cache misses',
+                            read=lambda: _parser.cache.misses)
+        return _parser
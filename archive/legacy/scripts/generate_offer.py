@@ -1,27 +1,22 @@
 #!/usr/bin/env python3
 """
 Format-preserving Offer Letter Generation
-Uses simple text replacement within runs to preserve formatting
+Fills compiled template slots (see template_engine.py) to preserve formatting
 """
 
 import json
+import os
 import sys
+import time
+from contextlib import ExitStack
 from pathlib import Path
-from docx import Document
-import subprocess
-
-
-def load_profile(profile_name):
-    """Load company profile configuration"""
-    profile_path = Path('profiles') / profile_name / 'config.json'
-    
-    if not profile_path.exists():
-        print(f"❌ Profile '{profile_name}' not found!")
-        print(f"Available profiles: melange, urbanmistrii, decoarte")
-        sys.exit(1)
-    
-    with open(profile_path, 'r') as f:
-        return json.load(f)
+import metrics
+import pdf_pool
+import profiling
+from offer_store import get_offer_store
+from profile_registry import get_registry, load_profile
+from render_cache import get_render_cache, render_key
+from template_engine import load_template
 
 
 def replace_in_runs(paragraph, find_text, replace_text):
@@ -33,12 +28,9 @@ def replace_in_runs(paragraph, find_text, replace_text):
     return False
 
 
-def fill_offer_letter(template_path, data, profile, output_path):
-    """Fill offer letter template with candidate data - preserving formatting"""
-    doc = Document(template_path)
-    
-    # Map JSON data fields to template placeholders
-    replacements = {
+def build_replacements(data, profile):
+    """Map JSON data fields to template placeholders"""
+    return {
         '{{Candidate Name}}': data.get('name', ''),
         '{{CANDIDATE_NAME}}': data.get('name', ''),
         '{{Interview Date}}': data.get('test_date', ''),
@@ -57,78 +49,121 @@ def fill_offer_letter(template_path, data, profile, output_path):
         '{{CURRENT_DATE}}': data.get('current_date', ''),
         '{{OFFER_EXPIRY_DAYS}}': str(profile['offer_validity_days']),
     }
-    
-    # Replace in paragraphs - try run-level first, then fall back to paragraph-level
-    for paragraph in doc.paragraphs:
-        for find_text, replace_text in replacements.items():
-            if find_text in paragraph.text:
-                # Try run-level replacement first (preserves formatting)
-                replaced = replace_in_runs(paragraph, find_text, str(replace_text))
-                if not replaced:
-                    # Fall back to rebuilding runs if placeholder spans multiple runs
-                    inline = paragraph.runs
-                    for i, run in enumerate(inline):
-                        if find_text in run.text:
-                            run.text = run.text.replace(find_text, str(replace_text))
-    
-    # Replace in tables - need special handling for split placeholders
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    for find_text, replace_text in replacements.items():
-                        if find_text in paragraph.text:
-                            # Try run-level first
-                            replaced = replace_in_runs(paragraph, find_text, str(replace_text))
-                            if not replaced and paragraph.runs:
-                                # Placeholder is split across runs - rebuild
-                                full_text = paragraph.text
-                                new_text = full_text.replace(find_text, str(replace_text))
-                                # Keep first run's formatting, put all text there
-                                paragraph.runs[0].text = new_text
-                                for run in paragraph.runs[1:]:
-                                    run.text = ""
-    
-    doc.save(output_path)
+
+
+def fill_offer_letter(template_path, data, profile, output_path):
+    """Fill offer letter template with candidate data - preserving formatting"""
+    # The template is parsed once; every letter writes straight into its placeholder slots
+    # (body, tables, text boxes, headers and footers)
+    template = load_template(template_path)
+    template.render(build_replacements(data, profile), output_path)
     return output_path
 
 
 def convert_to_pdf(docx_path, pdf_path):
-    """Convert DOCX to PDF using LibreOffice"""
+    """Convert DOCX to PDF on the persistent LibreOffice pool"""
     try:
-        subprocess.run([
-            'soffice',
-            '--headless',
-            '--convert-to', 'pdf',
-            '--outdir', str(pdf_path.parent),
-            str(docx_path)
-        ], check=True)
-        return pdf_path
+        return pdf_pool.convert_to_pdf(docx_path, pdf_path)
     except Exception as e:
         print(f"❌ PDF conversion failed: {e}")
         return None
 
 
-def generate_offer_internal(profile_name, data):
-    """Programmatic interface for offer generation"""
-    profile = load_profile(profile_name)
-    
-    # Prepare paths
+def letter_spec(profile):
+    """The profile's letter spec, or None for DOCX-only profiles"""
+    if not profile.get('template_spec'):
+        return None
+    from native_render import load_spec
+    return load_spec(profile['template_spec'])
+
+
+def render_offer_pdf(profile, replacements, docx_path, pdf_path):
+    """Draw the PDF natively for spec profiles, otherwise convert the filled DOCX"""
+    spec = letter_spec(profile)
+    if spec is not None:
+        return spec.render(replacements, pdf_path)
+    return pdf_pool.convert_to_pdf(docx_path, pdf_path)
+
+
+def offer_docx_path(profile_name, data):
+    """Output DOCX path for a candidate (creates output/<profile>/)"""
     name_clean = data['name'].replace(' ', '_')
     output_dir = Path('output') / profile_name
     output_dir.mkdir(exist_ok=True, parents=True)
+    return output_dir / f'offer_letter_{name_clean}.docx'
+
+
+def index_letter(profile_name, data, docx=None, pdf=None):
+    """Index a rendered letter in the offer store (never fails generation)"""
+    try:
+        get_offer_store().record_generated(profile_name, data, docx=docx, pdf=pdf)
+    except Exception as e:
+        print(f"⚠️  Could not update offer store: {e}")
+
+
+def record_anchor(pdf_path):
+    """Record where the signature goes on a rendered PDF (never fails generation)"""
+    from pdf_stamp import record_signature_anchor
+    try:
+        record_signature_anchor(pdf_path)
+        return True
+    except Exception as e:
+        print(f"⚠️  Could not record signature anchor: {e}")
+        return False
+
+
+def generate_offer_internal(profile_name, data, on_stage=None):
+    """Programmatic interface for offer generation
+    
+    on_stage(stage, path) is called with ('filled', docx) and then ('converted', pdf).
+    Raises on a missing profile/template or a failed conversion.
+    """
+    profile = get_registry().get(profile_name)
     
-    docx_out = output_dir / f'offer_letter_{name_clean}.docx'
+    docx_out = offer_docx_path(profile_name, data)
     template_path = Path(profile['template_docx'])
     
     if not template_path.exists():
         raise FileNotFoundError(f"Template not found: {template_path}")
     
-    fill_offer_letter(template_path, data, profile, docx_out)
+    template = load_template(template_path)
+    replacements = build_replacements(data, profile)
+    spec = letter_spec(profile)
+    
+    # Identical template + values + renderer version = identical letter; reuse it
+    cache = get_render_cache()
+    template_hash = f'{template.content_hash}:{spec.content_hash}' if spec else template.content_hash
+    key = render_key(template_hash, replacements) if cache else None
+    
+    rendered = False
+    if not (cache and cache.restore(key, 'docx', docx_out)):
+        rendered = True
+        template.render(replacements, docx_out)
+        if cache:
+            cache.store(key, 'docx', docx_out)
+    index_letter(profile_name, data, docx=docx_out)
+    if on_stage:
+        on_stage('filled', docx_out)
     
     # Convert to PDF
     pdf_out = docx_out.with_suffix('.pdf')
-    convert_to_pdf(docx_out, pdf_out)
+    if not (cache and cache.restore(key, 'pdf', pdf_out)):
+        rendered = True
+        render_offer_pdf(profile, replacements, docx_out, pdf_out)
+        if cache:
+            cache.store(key, 'pdf', pdf_out)
+    
+    # Remember where the signature goes so signing can stamp this PDF directly
+    from pdf_stamp import anchor_path
+    if not (cache and cache.restore(key, 'anchor', anchor_path(pdf_out))):
+        if record_anchor(pdf_out) and cache:
+            cache.store(key, 'anchor', anchor_path(pdf_out))
+    if cache:
+        # One hit or miss per letter, not per artifact
+        cache.record(not rendered)
+    index_letter(profile_name, data, pdf=pdf_out)
+    if on_stage:
+        on_stage('converted', pdf_out)
     
     return {
         'docx': docx_out,
@@ -136,20 +171,43 @@ def generate_offer_internal(profile_name, data):
     }
 
 
-def main():
-    if len(sys.argv) < 3:
-        print("Usage: python3 generate_offer.py <profile> <candidate.json>")
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == '--batch':
+        from batch_generate import main as batch_main
+        sys.exit(batch_main(argv[1:]))
+    
+    # --cprofile is an alias of --profile (cProfile), which is easy to misread as the company profile
+    flags = {'--timings', '--profile', '--cprofile'}
+    args = [arg for arg in argv if arg not in flags]
+    wants_help = '-h' in argv or '--help' in argv
+    unknown = [arg for arg in args if arg.startswith('-') and arg not in ('-h', '--help')]
+    if unknown:
+        print(f"❌ Unknown option: {unknown[0]}\n")
+    if len(args) != 2 or wants_help or unknown:
+        print("Usage: python3 offer.py generate <profile> <candidate.json> [--timings] [--profile|--cprofile]")
+        print("       python3 offer.py batch <profile> <candidate.json>... [--workers N] [--no-pdf] [--merge]")
         print("\nProfiles:")
         print("  melange      - The Melange Studio")
         print("  urbanmistrii - Urban Mistrii")
         print("  decoarte     - Deco Arte")
         print("\nExample:")
-        print("  python3 generate_offer.py melange examples/sample_candidate.json")
-        sys.exit(1)
-    
-    profile_name = sys.argv[1]
-    candidate_file = sys.argv[2]
-    
+        print("  python3 offer.py generate melange examples/sample_candidate.json")
+        print("  python3 offer.py batch melange data/*.json")
+        sys.exit(0 if wants_help and not unknown else 1)
+    
+    with ExitStack() as stack:
+        if '--profile' in argv or '--cprofile' in argv:
+            # Same output as a profiled server request (profiling.py)
+            stack.enter_context(profiling.profile(f"cli-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"))
+        if '--timings' in argv:
+            recorded = stack.enter_context(metrics.recording())
+            stack.callback(lambda: print(f"\n⏱️  Stage timings:\n{metrics.format_breakdown(recorded)}"))
+        generate_from_cli(*args[:2])
+
+
+def generate_from_cli(profile_name, candidate_file):
+    """Single-letter generation with progress output"""
     # Load profile and candidate data
     print(f"📋 Loading profile: {profile_name}")
     profile = load_profile(profile_name)
@@ -158,13 +216,6 @@ def main():
     with open(candidate_file, 'r') as f:
         data = json.load(f)
     
-    # Prepare paths
-    name_clean = data['name'].replace(' ', '_')
-    output_dir = Path('output') / profile_name
-    output_dir.mkdir(exist_ok=True, parents=True)
-    
-    docx_out = output_dir / f'offer_letter_{name_clean}.docx'
-    
     # Generate offer letter
     print(f"📝 Filling offer letter for {profile['company_name']}...")
     template_path = Path(profile['template_docx'])
@@ -174,14 +225,19 @@ def main():
         print(f"💡 Please add the template to: {template_path}")
         sys.exit(1)
     
-    fill_offer_letter(template_path, data, profile, docx_out)
-    print(f"✅ Created: {docx_out}")
+    def progress(stage, path):
+        if stage == 'filled':
+            print(f"✅ Created: {path}")
+            print(f"\n📄 {'Rendering' if letter_spec(profile) is not None else 'Converting to'} PDF...")
+        else:
+            print(f"✅ PDF created: {path}")
     
-    # Convert to PDF
-    pdf_out = docx_out.with_suffix('.pdf')
-    print(f"\n📄 Converting to PDF...")
-    convert_to_pdf(docx_out, pdf_out)
-    print(f"✅ PDF created: {pdf_out}")
+    # Same path as the server: render cache, signature anchor and offer store index
+    try:
+        pdf_out = generate_offer_internal(profile_name, data, on_stage=progress)['pdf']
+    except Exception as e:
+        print(f"❌ Generation failed: {e}")
+        sys.exit(1)
     
     print(f"\n🎉 Success! Offer letter ready for {data['name']}")
     print(f"   Company: {profile['company_name']}")
@@ -9,7 +9,7 @@ import json
 import sys
 from pathlib import Path
 from datetime import datetime
-from docx import Document
+from template_engine import load_template
 
 
 def replace_in_runs(paragraph, find_text, replace_text):
@@ -35,12 +35,9 @@ def replace_in_runs(paragraph, find_text, replace_text):
     return False
 
 
-def fill_offer_letter(template_path, data, output_path):
-    """Fill offer letter template with candidate data"""
-    doc = Document(template_path)
-
-    # Build replacements map
-    replacements = {
+def build_replacements(data):
+    """Map candidate JSON fields to template placeholders"""
+    return {
         '{{Candidate Name}}': data.get('name', ''),
         '{{CANDIDATE_NAME}}': data.get('name', ''),
         '{{Interview Date}}': data.get('test_date', data.get('current_date', '')),
@@ -64,34 +61,24 @@ def fill_offer_letter(template_path, data, output_path):
         '{{COMPANY}}': data.get('company', ''),
     }
 
-    # Replace in paragraphs
-    for paragraph in doc.paragraphs:
-        for find_text, replace_text in replacements.items():
-            if find_text in paragraph.text:
-                replace_in_runs(paragraph, find_text, str(replace_text))
 
-    # Replace in tables
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    for find_text, replace_text in replacements.items():
-                        if find_text in paragraph.text:
-                            replace_in_runs(paragraph, find_text, str(replace_text))
-
-    doc.save(output_path)
+def fill_offer_letter(template_path, data, output_path):
+    """Fill offer letter template with candidate data"""
+    template = load_template(template_path)
+    template.render(build_replacements(data), output_path)
     print(f"✅ Created: {output_path}")
     return output_path
 
 
-def main():
-    if len(sys.argv) < 2:
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 1:
         print("Usage: python generate_simple.py <candidate.json> [template.docx] [output_dir]")
         sys.exit(1)
 
-    candidate_file = sys.argv[1]
-    template_path = sys.argv[2] if len(sys.argv) > 2 else "templates/offer_template.docx"
-    output_dir = sys.argv[3] if len(sys.argv) > 3 else "output"
+    candidate_file = argv[0]
+    template_path = argv[1] if len(argv) > 1 else "templates/offer_template.docx"
+    output_dir = argv[2] if len(argv) > 2 else "output"
 
     with open(candidate_file, 'r') as f:
         data = json.load(f)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Efficient PDF Responses
+Serves generated PDFs with a strong validator, conditional GET (304), byte
+ranges (206) for incremental PDF viewers, and zero-copy sendfile when the WSGI
+server provides wsgi.file_wrapper (or X-Sendfile when USE_X_SENDFILE is set
+behind a proxy). Each request opens the file once and does a single fstat.
+"""
+
+import os
+from datetime import datetime, timezone
+
+from flask import current_app, request
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.http import parse_etags, parse_range_header
+from werkzeug.sansio.http import is_resource_modified
+from werkzeug.wsgi import wrap_file
+
+
+def file_etag(stat):
+    """Strong ETag for one version of a file
+
+    Letters are always replaced atomically (new inode), so inode + mtime + size
+    identify the content without reading it.
+    """
+    return f'{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+
+def file_last_modified(stat):
+    """Last-Modified value of a file, in whole seconds as HTTP dates carry"""
+    return datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc)
+
+
+def conditional_status(headers, stat, ranges=True):
+    """Status and byte range for a GET of a file, decided as Response.make_conditional does
+
+    headers holds the request headers with lower-case names. Returns (status,
+    (start, stop) or None): 206 with the range to send, 304/412 for a
+    satisfied condition, 416 for an unsatisfiable range, otherwise 200.
+    Ranges are ignored when ranges is False (X-Sendfile serves them itself).
+    """
+    etag, last_modified = file_etag(stat), file_last_modified(stat)
+
+    def modified(ignore_if_range=True):
+        return is_resource_modified(
+            http_range=headers.get('range'), http_if_range=headers.get('if-range'),
+            http_if_modified_since=headers.get('if-modified-since'),
+            http_if_none_match=headers.get('if-none-match'), http_if_match=headers.get('if-match'),
+            etag=etag, last_modified=last_modified, ignore_if_range=ignore_if_range,
+        )
+
+    if ranges and stat.st_size and 'range' in headers and ('if-range' not in headers or not modified(ignore_if_range=False)):
+        parsed = parse_range_header(headers['range'])
+        byte_range = parsed.range_for_length(stat.st_size) if parsed else None
+        return (206, byte_range) if byte_range else (416, None)
+    if not modified():
+        return (412 if parse_etags(headers.get('if-match')) else 304), None
+    return 200, None
+
+
+def open_first(paths):
+    """Open the first existing path; returns (file, path, stat) or None"""
+    for path in paths:
+        try:
+            f = open(path, 'rb')
+        except (FileNotFoundError, IsADirectoryError):
+            continue
+        return f, path, os.fstat(f.fileno())
+    return None
+
+
+def pdf_response(paths, download_name=None, as_attachment=False):
+    """Conditional, range-capable PDF response for the first existing path, or None"""
+    found = open_first(paths)
+    if found is None:
+        return None
+    f, path, stat = found
+
+    x_sendfile = current_app.config.get('USE_X_SENDFILE')
+    if x_sendfile:
+        # The front-end server streams the file (and handles ranges itself)
+        f.close()
+        rv = current_app.response_class(mimetype='application/pdf')
+        rv.headers['X-Sendfile'] = str(os.path.abspath(path))
+    else:
+        rv = current_app.response_class(wrap_file(request.environ, f), mimetype='application/pdf',
+                                        direct_passthrough=True)
+    rv.content_length = stat.st_size
+    rv.set_etag(file_etag(stat))
+    rv.last_modified = file_last_modified(stat)
+    # Browsers may keep the PDF but must revalidate (cheap 304) before reuse
+    rv.cache_control.no_cache = True
+    rv.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline',
+                   filename=download_name or path.name)
+    try:
+        return rv.make_conditional(request.environ, accept_ranges=not x_sendfile,
+                                   complete_length=stat.st_size)
+    except RequestedRangeNotSatisfiable as e:
+        # A 416 with Content-Range: bytes */<size>, not an error for the view to turn into a 500
+        rv.close()
+        return e.get_response()
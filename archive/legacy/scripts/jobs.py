@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Background Offer Generation Jobs
+Runs fill + PDF conversion on a bounded worker pool so HTTP requests return a
+job ID immediately. Each job moves through queued -> filled -> converted (or
+failed); callers poll the job or wait on its stage changes for server-sent events.
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import metrics
+import profiling
+
+JOB_WORKERS = int(os.getenv('OFFER_JOB_WORKERS', '4'))
+MAX_PENDING_JOBS = int(os.getenv('OFFER_MAX_PENDING_JOBS', '100'))
+# Finished jobs kept for status queries
+JOB_RETENTION = 1000
+
+QUEUED, FILLED, CONVERTED, FAILED = 'queued', 'filled', 'converted', 'failed'
+FINAL_STAGES = (CONVERTED, FAILED)
+
+JOBS_FINISHED = metrics.counter('offer_jobs_finished_total', 'Generation jobs by final stage', ('stage',))
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+class QueueFull(Exception):
+    """Raised when too many jobs are waiting"""
+
+
+class Job:
+    """One offer generation request"""
+
+    def __init__(self, profile_name, candidate, profiled=False):
+        self.id = uuid.uuid4().hex
+        self.profile = profile_name
+        self.candidate = candidate
+        self.profiled = profiled
+        self.stage = QUEUED
+        self.error = None
+        self.docx = None
+        self.pdf = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    @property
+    def done(self):
+        return self.stage in FINAL_STAGES
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'profile': self.profile,
+            'candidate': self.candidate.get('name'),
+            'stage': self.stage,
+            'error': self.error,
+            'profiled': self.profiled,
+            'docx_ready': self.docx is not None,
+            'pdf_ready': self.stage == CONVERTED,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+        }
+
+
+class JobQueue:
+    """Bounded pool of generation workers with in-memory job tracking"""
+
+    def __init__(self, workers=JOB_WORKERS, max_pending=MAX_PENDING_JOBS):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='offer-job')
+        self._jobs = OrderedDict()
+        self._changed = threading.Condition()
+
+    def _pending_locked(self):
+        return sum(1 for job in self._jobs.values() if not job.done)
+
+    def pending(self):
+        """Number of queued or running jobs"""
+        with self._changed:
+            return self._pending_locked()
+
+    def submit(self, profile_name, candidate, profiled=False):
+        """Enqueue a job and return it (raises QueueFull); profiled jobs dump a profile named by job ID"""
+        job = Job(profile_name, candidate, profiled)
+        with self._changed:
+            if self._pending_locked() >= self.max_pending:
+                raise QueueFull(f'{self.max_pending} jobs already pending')
+            self._jobs[job.id] = job
+            # Forget the oldest finished jobs
+            while len(self._jobs) > JOB_RETENTION:
+                oldest = next(iter(self._jobs.values()))
+                if not oldest.done:
+                    break
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._changed:
+            return self._jobs.get(job_id)
+
+    def wait_for_change(self, job, stage, timeout=None):
+        """Block until the job leaves `stage` (or timeout); returns the current stage"""
+        with self._changed:
+            self._changed.wait_for(lambda: job.stage != stage, timeout=timeout)
+            return job.stage
+
+    def _update(self, job, stage, **fields):
+        with self._changed:
+            job.stage = stage
+            job.updated_at = time.time()
+            for name, value in fields.items():
+                setattr(job, name, value)
+            self._changed.notify_all()
+
+    def _run(self, job):
+        # The generation stack loads with the first job, not at server import
+        from generate_offer import generate_offer_internal
+
+        def on_stage(stage, path):
+            if stage == FILLED:
+                self._update(job, FILLED, docx=Path(path).resolve())
+            elif stage == CONVERTED:
+                self._update(job, CONVERTED, pdf=Path(path).resolve())
+
+        try:
+            if job.profiled:
+                with profiling.profile(job.id):
+                    generate_offer_internal(job.profile, job.candidate, on_stage=on_stage)
+            else:
+                generate_offer_internal(job.profile, job.candidate, on_stage=on_stage)
+        except Exception as e:
+            print(f"❌ Job {job.id} failed: {e}")
+            self._update(job, FAILED, error=str(e))
+        JOBS_FINISHED.inc(stage=job.stage)
+
+
+def get_job_queue():
+    """Process-wide job queue"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+            metrics.gauge('offer_jobs_pending', 'Generation jobs queued or running', read=_queue.pending)
+        return _queue
@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+"""
+End-to-End Load Test
+Drives the real HTTP API with the generate -> email -> sign flow at fixed
+arrival rates (open loop, Poisson arrivals) and reports throughput, latency
+percentiles per endpoint and error rates for each rate.
+
+By default the server (run_server.py) is started in a scratch directory with
+copies of the profiles, against local stand-ins: a fake SMTP server that
+accepts and counts every message, the fake candidate model behind
+/api/ai-parse, and a converter stub that sleeps --convert-ms and draws the
+letter's text, signature line included, into a PDF (--real-convert uses
+soffice). --url drives a server that is already running instead; its own
+mail, model and converter settings apply.
+
+Each flow: POST /api/ai-parse (for --ai-parse of the flows), POST
+/api/generate-offer, poll the job until the PDF is ready, POST
+/api/send-email, POST /api/submit-signature. Candidates come from --data,
+renamed per flow so no letter is served from the render cache.
+
+Usage: python3 load_test.py [--rate 30]... [--duration 60] [--mix melange=3,decoarte=1]
+                            [--ai-parse 0.5] [--data DIR] [--profiles DIR]
+                            [--convert-ms 800 | --real-convert] [--ai-ms 300] [--smtp-ms 50]
+                            [--server-workers 1] [--url URL] [--max-error-rate 0.01]
+                            [--json FILE]
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import quote
+
+from PIL import Image, ImageDraw
+
+from benchmark import load_candidates
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+POLL_SECONDS = 0.2
+JOB_TIMEOUT = 300
+READY_TIMEOUT = 60
+FLOW = 'flow (arrival -> signed)'
+JOB = 'job (queued -> converted)'
+
+CONVERTER_STUB = '''#!{python}
+# Draws the DOCX's paragraph text as plain Helvetica lines, so the signature
+# anchor is found as in a real conversion; a "Signature:" line is added if missing
+import html, os, re, sys, time, zipfile
+args = sys.argv[1:]
+if '--terminate_after_init' in args:
+    sys.exit(0)
+time.sleep({delay!r})
+docx = args[-1]
+with zipfile.ZipFile(docx) as package:
+    xml = package.read('word/document.xml').decode('utf-8')
+lines = []
+for paragraph in re.findall(r'<w:p[ >].*?</w:p>', xml, re.S):
+    text = html.unescape(''.join(re.findall(r'<w:t(?: [^>]*)?>([^<]*)</w:t>', paragraph)))
+    lines.append(text[:95])
+if not any(re.search(r'Signature\\s*:', line, re.I) for line in lines):
+    lines += ['', 'Signature: ______________________________']
+pages = [lines[i:i + 50] for i in range(0, len(lines), 50)] or [[]]
+objects = ['<< /Type /Catalog /Pages 2 0 R >>', None,
+           '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>']
+kids = []
+for page in pages:
+    content = b'BT /F1 10 Tf 14 TL 56 790 Td '
+    for line in page:
+        data = line.encode('cp1252', errors='replace')
+        content += b'(' + data.replace(b'\\\\', b'\\\\\\\\').replace(b'(', b'\\\\(').replace(b')', b'\\\\)') + b") '\\n"
+    content += b'ET'
+    objects.append(('<< /Length %d >>' % len(content), content))
+    kids.append(len(objects) + 1)
+    objects.append('<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >>'
+                   ' /Contents %d 0 R >>' % len(objects))
+objects[1] = '<< /Type /Pages /Kids [%s] /Count %d >>' % (' '.join('%d 0 R' % kid for kid in kids), len(kids))
+out = bytearray(b'%PDF-1.4\\n')
+offsets = []
+for number, obj in enumerate(objects, start=1):
+    offsets.append(len(out))
+    out += b'%d 0 obj\\n' % number
+    if isinstance(obj, tuple):
+        out += obj[0].encode() + b'\\nstream\\n' + obj[1] + b'\\nendstream'
+    else:
+        out += obj.encode()
+    out += b'\\nendobj\\n'
+xref = len(out)
+out += b'xref\\n0 %d\\n0000000000 65535 f \\n' % (len(objects) + 1)
+out += b''.join(b'%010d 00000 n \\n' % offset for offset in offsets)
+out += b'trailer\\n<< /Size %d /Root 1 0 R >>\\nstartxref\\n%d\\n%%%%EOF\\n' % (len(objects) + 1, xref)
+with open(os.path.join(args[args.index('--outdir') + 1], os.path.basename(docx)[:-5] + '.pdf'), 'wb') as f:
+    f.write(out)
+'''
+
+
+# --- stand-ins --------------------------------------------------------------
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: EHLO, AUTH PLAIN, MAIL, RCPT, DATA (every login is accepted)"""
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.reply('220 offer-loadtest ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('latin-1').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self.wfile.write(b'250-offer-loadtest\r\n250-8BITMIME\r\n250 AUTH PLAIN\r\n')
+            elif verb == 'HELO':
+                self.reply('250 offer-loadtest')
+            elif verb == 'AUTH':
+                if len(command.split()) == 2:
+                    # Credentials follow on their own line
+                    self.reply('334 ')
+                    self.rfile.readline()
+                self.reply('235 Authentication successful')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                if self.server.delay:
+                    time.sleep(self.server.delay)
+                with self.server.lock:
+                    self.server.delivered += 1
+                self.reply('250 Queued')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self.reply('250 OK')
+            else:
+                self.reply('502 Command not implemented')
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """Local SMTP sink that counts delivered messages"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, delay=0.0):
+        super().__init__(('127.0.0.1', 0), FakeSMTPHandler)
+        self.delay = delay
+        self.delivered = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True, name='fake-smtp').start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def prepare_workdir(workdir, profiles_dir, convert_delay):
+    """Scratch copies of the profiles (absolute template paths, plain SMTP) and the converter stub"""
+    for profile_dir in sorted(Path(profiles_dir).iterdir()):
+        config_path = profile_dir / 'config.json'
+        if not config_path.exists():
+            continue
+        config = json.loads(config_path.read_text())
+        for key in ('template_docx', 'template_spec'):
+            if key in config:
+                # Same lookup as the registry: working directory first, then the profile directory
+                path = Path(config[key])
+                if not path.is_absolute() and not path.exists() and (profile_dir / path).exists():
+                    path = profile_dir / path
+                config[key] = str(path.resolve())
+        config['smtp_starttls'] = False
+        target = workdir / 'profiles' / profile_dir.name
+        target.mkdir(parents=True)
+        (target / 'config.json').write_text(json.dumps(config, indent=2))
+    if convert_delay is None:
+        return None
+    stub = workdir / 'soffice_stub'
+    stub.write_text(CONVERTER_STUB.format(python=sys.executable, delay=convert_delay))
+    stub.chmod(0o755)
+    return stub
+
+
+def start_server(workdir, port, workers, env):
+    """Start run_server.py in workdir and wait until it answers"""
+    log = open(workdir / 'server.log', 'w')
+    process = subprocess.Popen(
+        [sys.executable, str(SCRIPTS_DIR / 'run_server.py'), '--port', str(port), '--workers', str(workers)],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            urllib.request.urlopen(f'{url}/metrics', timeout=2).close()
+            return process, url
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'Server did not start; see {workdir / "server.log"}')
+
+
+# --- client -----------------------------------------------------------------
+
+class Recorder:
+    """Latencies and errors per endpoint"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, seconds, error=None):
+        with self._lock:
+            self.samples[endpoint].append((seconds, error is None))
+            if error is not None:
+                self.errors[f'{endpoint}: {error}'[:160]] += 1
+
+    def summary(self):
+        endpoints = {}
+        with self._lock:
+            for endpoint, samples in self.samples.items():
+                times = sorted(seconds * 1000 for seconds, _ in samples)
+                errors = sum(1 for _, ok in samples if not ok)
+                endpoints[endpoint] = {
+                    'count': len(samples),
+                    'errors': errors,
+                    'error_rate': round(errors / len(samples), 4),
+                    **{f'p{q}_ms': round(percentile(times, q), 1) for q in (50, 95, 99)},
+                    'max_ms': round(times[-1], 1),
+                }
+        return endpoints
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of sorted values"""
+    return values[max(0, min(len(values) - 1, -(-len(values) * q // 100) - 1))]
+
+
+class Client:
+    """Runs flows against one server and records every request"""
+
+    def __init__(self, url, recorder, timeout=60):
+        self.url = url.rstrip('/')
+        self.recorder = recorder
+        self.timeout = timeout
+        self.signature = self._signature_png()
+
+    @staticmethod
+    def _signature_png():
+        image = Image.new('RGB', (300, 100), 'white')
+        ImageDraw.Draw(image).line([(20, 70), (90, 30), (160, 75), (280, 25)], fill='black', width=4)
+        buffer = BytesIO()
+        image.save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def request(self, endpoint, path, body=None, content_type='application/json', headers=None,
+                record=True, ok=(200, 201, 202, 206)):
+        """(status, parsed JSON or bytes); failures are recorded and raised"""
+        if isinstance(body, dict):
+            body = json.dumps(body).encode()
+        req = urllib.request.Request(f'{self.url}{path}', data=body, method='POST' if body is not None else 'GET',
+                                     headers={**({'Content-Type': content_type} if body is not None else {}),
+                                              **(headers or {})})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                status, raw, kind = response.status, response.read(), response.headers.get_content_type()
+        except urllib.error.HTTPError as e:
+            status, raw, kind = e.code, e.read(), e.headers.get_content_type()
+        except OSError as e:
+            self.recorder.add(endpoint, time.perf_counter() - started, type(e).__name__)
+            raise
+        elapsed = time.perf_counter() - started
+        payload = json.loads(raw) if kind == 'application/json' else raw
+        if status not in ok:
+            message = payload.get('message', '') if isinstance(payload, dict) else ''
+            self.recorder.add(endpoint, elapsed, f'{status} {message}'.strip())
+            raise RuntimeError(f'{endpoint}: {status}')
+        if record:
+            self.recorder.add(endpoint, elapsed)
+        return status, payload
+
+    def wait_for_letter(self, job):
+        """Poll the job (or, if another worker process owns it, the PDF) until the letter is ready"""
+        started = time.perf_counter()
+        deadline = time.monotonic() + JOB_TIMEOUT
+        by_pdf = False
+        while time.monotonic() < deadline:
+            if not by_pdf:
+                try:
+                    _, state = self.request('GET /api/jobs/<id>', job['status_url'], ok=(200, 404))
+                except RuntimeError:
+                    state = {}
+                if state.get('message') == 'Job not found':
+                    by_pdf = True
+                elif state.get('stage') == 'converted':
+                    break
+                elif state.get('stage') == 'failed':
+                    self.recorder.add(JOB, time.perf_counter() - started, f"failed: {state.get('error')}")
+                    raise RuntimeError('job failed')
+            else:
+                # A one-byte range read does not mark the offer as viewed
+                status, _ = self.request('GET /api/offer-pdf/<name>', job['pdf_url'], ok=(200, 206, 404),
+                                         headers={'Range': 'bytes=0-0'})
+                if status == 206:
+                    break
+            time.sleep(POLL_SECONDS)
+        else:
+            self.recorder.add(JOB, time.perf_counter() - started, 'timed out')
+            raise RuntimeError('job timed out')
+        self.recorder.add(JOB, time.perf_counter() - started)
+
+    def flow(self, seq, profile, candidate, ai_parse, arrival):
+        """One candidate from smart fill to signature; True if every step succeeded"""
+        candidate = dict(candidate, name=f"{candidate['name']} Lt{seq:05d}",
+                         email=f'loadtest+{seq}@example.com')
+        try:
+            if ai_parse:
+                prompt = (f"{candidate['name']}, {candidate['email']}, joining {candidate.get('start_date', '')} "
+                          f"as {candidate.get('position', '')} (ref {seq})")
+                self.request('POST /api/ai-parse', '/api/ai-parse', {'prompt': prompt})
+            _, job = self.request('POST /api/generate-offer', '/api/generate-offer',
+                                  {'profile': profile, 'candidate': candidate})
+            self.wait_for_letter(job)
+            self.request('POST /api/send-email', '/api/send-email',
+                         {'profile': profile, 'candidate_name': candidate['name'],
+                          'candidate_email': candidate['email']},
+                         headers={'Idempotency-Key': f'loadtest-{seq}'})
+            slug = quote(candidate['name'].replace(' ', '_'))
+            self.request('POST /api/submit-signature',
+                         f'/api/submit-signature?candidate={slug}&profile={quote(profile)}',
+                         self.signature, content_type='image/png')
+        except (OSError, RuntimeError, ValueError) as e:
+            self.recorder.add(FLOW, time.monotonic() - arrival, type(e).__name__)
+            return False
+        self.recorder.add(FLOW, time.monotonic() - arrival)
+        return True
+
+
+# --- runs -------------------------------------------------------------------
+
+def parse_mix(text, profiles):
+    """{profile: weight} from 'name=weight,...' (default: every profile equally)"""
+    if not text:
+        return {name: 1.0 for name in profiles}
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def run_rate(client, rate, duration, mix, candidates, ai_ratio, concurrency, rng, seq_start):
+    """Open-loop arrivals at `rate` flows/minute for `duration` seconds; returns the stage report"""
+    profiles, weights = zip(*mix.items())
+    started_flows = 0
+    results = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='load') as executor:
+        start = time.monotonic()
+        arrival = start + rng.expovariate(rate / 60)
+        while arrival < start + duration:
+            time.sleep(max(0.0, arrival - time.monotonic()))
+            results.append(executor.submit(client.flow, seq_start + started_flows,
+                                           rng.choices(profiles, weights)[0], rng.choice(candidates),
+                                           rng.random() < ai_ratio, arrival))
+            started_flows += 1
+            arrival += rng.expovariate(rate / 60)
+        completed = sum(1 for future in results if future.result())
+        elapsed = time.monotonic() - start
+    return {
+        'rate_per_min': rate,
+        'duration_s': round(elapsed, 1),
+        'started': started_flows,
+        'completed': completed,
+        'throughput_per_min': round(completed / elapsed * 60, 1),
+    }
+
+
+def print_report(stage, endpoints, errors, delivered):
+    print(f"\n📈 {stage['rate_per_min']:g} flows/min: {stage['started']} started, {stage['completed']} completed "
+          f"in {stage['duration_s']}s -> {stage['throughput_per_min']:g} flows/min sustained")
+    print(f"   {'endpoint':<34}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, r in sorted(endpoints.items(), key=lambda item: item[0] == FLOW):
+        print(f"   {name:<34}{r['count']:>7}{r['error_rate']:>8.1%}{r['p50_ms']:>10.0f}"
+              f"{r['p95_ms']:>10.0f}{r['p99_ms']:>10.0f}{r['max_ms']:>10.0f}")
+    if delivered is not None:
+        # Profiles keep their smtp_rate_per_minute, so the outbox may still hold some
+        print(f"   ✉️  {delivered}/{stage['completed']} email(s) delivered to the fake SMTP server")
+    for message, count in errors.most_common(5):
+        print(f"   ❌ {count} × {message}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test the generate -> email -> sign flow')
+    parser.add_argument('--rate', type=float, action='append', help='arrivals per minute (repeat for steps)')
+    parser.add_argument('--duration', type=float, default=60, help='seconds per rate')
+    parser.add_argument('--mix', help='profile weights, e.g. melange=3,decoarte=1 (default: all equally)')
+    parser.add_argument('--ai-parse', type=float, default=0.5, help='share of flows that start with AI parse')
+    parser.add_argument('--data', default='data', help='directory of candidate JSON files')
+    parser.add_argument('--profiles', default='profiles', help='profiles copied into the scratch server')
+    parser.add_argument('--convert-ms', type=float, default=800, help='converter stub latency')
+    parser.add_argument('--real-convert', action='store_true', help='use soffice instead of the stub')
+    parser.add_argument('--ai-ms', type=float, default=300, help='fake model latency')
+    parser.add_argument('--smtp-ms', type=float, default=50, help='fake SMTP latency per message')
+    parser.add_argument('--server-workers', type=int, default=1, help='run_server.py worker processes')
+    parser.add_argument('--concurrency', type=int, default=200, help='most flows in flight at once')
+    parser.add_argument('--url', help='drive this running server instead of starting one')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help='exit 1 above this flow error rate')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch directory')
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args(argv)
+
+    candidates = load_candidates(args.data)
+    if not candidates:
+        print(f"❌ Need candidates in {args.data}/")
+        return 1
+    rates = args.rate or [30]
+
+    smtp = server = None
+    workdir = Path(tempfile.mkdtemp(prefix='offer-load-'))
+    try:
+        if args.url:
+            url = args.url
+            profiles = [p.name for p in Path(args.profiles).iterdir() if (p / 'config.json').exists()]
+        else:
+            smtp = FakeSMTPServer(args.smtp_ms / 1000)
+            stub = prepare_workdir(workdir, args.profiles, None if args.real_convert else args.convert_ms / 1000)
+            profiles = sorted(p.name for p in (workdir / 'profiles').iterdir())
+            env = dict(os.environ, OFFER_SMTP_HOST='127.0.0.1', OFFER_SMTP_PORT=str(smtp.port),
+                       OFFER_AI_MODEL='fake', OFFER_AI_FAKE_DELAY_MS=str(args.ai_ms),
+                       PYTHONPATH=os.pathsep.join(filter(None, [str(SCRIPTS_DIR), os.getenv('PYTHONPATH')])))
+            if stub:
+                env['SOFFICE_BIN'] = str(stub)
+            elif not shutil.which(env.get('SOFFICE_BIN', 'soffice')):
+                print("❌ --real-convert needs soffice in PATH (or SOFFICE_BIN)")
+                return 1
+            server, url = start_server(workdir, _free_port(), args.server_workers, env)
+        mix = parse_mix(args.mix, profiles)
+
+        converter = 'soffice' if args.real_convert or args.url else f'stub {args.convert_ms:g} ms'
+        print(f"🎯 {url}: {len(candidates)} candidate(s), mix "
+              f"{', '.join(f'{name}={weight:g}' for name, weight in mix.items())}, "
+              f"{args.ai_parse:.0%} with AI parse, converter {converter}")
+
+        rng = random.Random(args.seed)
+        stages = []
+        seq = 0
+        failed = False
+        for rate in rates:
+            recorder = Recorder()
+            client = Client(url, recorder)
+            delivered_before = smtp.delivered if smtp else None
+            stage = run_rate(client, rate, args.duration, mix, candidates, args.ai_parse,
+                             args.concurrency, rng, seq)
+            seq += stage['started']
+            delivered = None
+            if smtp:
+                # Emails leave through the outbox in the background; give them a moment to land
+                deadline = time.monotonic() + 30
+                while smtp.delivered - delivered_before < stage['completed'] and time.monotonic() < deadline:
+                    time.sleep(0.2)
+                delivered = smtp.delivered - delivered_before
+            stage['endpoints'] = recorder.summary()
+            stage['emails_delivered'] = delivered
+            stages.append(stage)
+            print_report(stage, stage['endpoints'], recorder.errors, delivered)
+            flow_errors = stage['endpoints'].get(FLOW, {}).get('error_rate', 0)
+            failed = failed or flow_errors > args.max_error_rate
+
+        if args.json:
+            Path(args.json).write_text(json.dumps({
+                'created_at': time.time(), 'url': url if args.url else None, 'mix': mix,
+                'ai_parse': args.ai_parse, 'converter': converter, 'server_workers': args.server_workers,
+                'stages': stages}, indent=2))
+        if failed:
+            print(f"\n❌ Flow error rate above {args.max_error_rate:.0%}")
+            return 1
+        print(f"\n✅ Flow error rate within {args.max_error_rate:.0%} at every rate")
+        return 0
+    finally:
+        if server:
+            server.terminate()
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        if smtp:
+            smtp.shutdown()
+        if args.keep:
+            print(f"📁 Scratch directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
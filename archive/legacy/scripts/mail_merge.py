@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Mail-Merge PDF Conversion
+Converts many filled letters of one template with a single LibreOffice run.
+The letters' bodies are concatenated into one DOCX, each in its own section
+(so it starts on a new page and its page numbers restart at 1) and each
+opening with an invisible split marker (1pt white text). The merged document
+is converted once, and the PDF is split back into one file per letter at the
+pages where the markers landed. The markers must come back once per letter,
+in merge order; if they do not, the batch is converted letter by letter
+instead. Each marker's glyphs are then cut from its page's content stream
+(its advance is kept, so nothing moves), so delivered PDFs carry no marker
+text for copy/paste, search or screen readers.
+
+Settings (environment):
+  OFFER_MERGE_SIZE  letters per merged document (default 20)
+"""
+
+import copy
+import os
+import re
+import threading
+import zipfile
+from pathlib import Path
+
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.oxml.ns import qn
+from lxml import etree
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, ByteStringObject, ContentStream, FloatObject
+
+import metrics
+import pdf_pool
+from metrics import span
+from template_engine import CONTENT_TYPES_PART, CT_OVERRIDE, write_package
+
+MERGE_SIZE = int(os.getenv('OFFER_MERGE_SIZE', '20'))
+MARKER_PREFIX = 'OFFERSPLIT'
+MARKER_RE = re.compile(MARKER_PREFIX + r'(\d{4})')
+# Fields that count pages across sections; a merged document would get them wrong
+PAGE_COUNT_FIELD_RE = re.compile(rb'\b(NUMPAGES|SECTIONPAGES)\b')
+
+W_P = qn('w:p')
+W_PPR = qn('w:pPr')
+W_SECTPR = qn('w:sectPr')
+W_PGNUMTYPE = qn('w:pgNumType')
+# Section properties that follow pgNumType in the schema's element order
+AFTER_PGNUMTYPE = {qn(f'w:{tag}') for tag in ('cols', 'formProt', 'vAlign', 'noEndnote', 'titlePg',
+                                              'textDirection', 'bidi', 'rtlGutter', 'docGrid',
+                                              'printerSettings', 'sectPrChange')}
+
+MERGE_FALLBACKS = metrics.counter('offer_merge_fallbacks_total',
+                                  'Merged conversions redone letter by letter', ('reason',))
+
+
+class MergeError(Exception):
+    """Raised when letters cannot be converted as one document"""
+
+
+def _main_part_name(package):
+    content_types = etree.fromstring(package.read(CONTENT_TYPES_PART))
+    for override in content_types.iter(CT_OVERRIDE):
+        if override.get('ContentType') == CT.WML_DOCUMENT_MAIN:
+            return override.get('PartName').lstrip('/')
+    raise MergeError('No main document part')
+
+
+def _marker_run(index):
+    run = etree.Element(qn('w:r'))
+    props = etree.SubElement(run, qn('w:rPr'))
+    etree.SubElement(props, qn('w:color')).set(qn('w:val'), 'FFFFFF')
+    for tag in ('w:sz', 'w:szCs'):
+        etree.SubElement(props, qn(tag)).set(qn('w:val'), '2')
+    etree.SubElement(run, qn('w:t')).text = f'{MARKER_PREFIX}{index:04d}'
+    return run
+
+
+def _restart_numbering(sect_pr):
+    """Copy of a section's properties whose page numbers start again at 1"""
+    sect_pr = copy.deepcopy(sect_pr)
+    numbering = sect_pr.find(W_PGNUMTYPE)
+    if numbering is None:
+        numbering = etree.Element(W_PGNUMTYPE)
+        following = [child for child in sect_pr if child.tag in AFTER_PGNUMTYPE]
+        if following:
+            following[0].addprevious(numbering)
+        else:
+            sect_pr.append(numbering)
+    numbering.set(qn('w:start'), '1')
+    return sect_pr
+
+
+def merge_letters(docx_paths, output_path):
+    """Concatenate letters filled from one template into a single DOCX (raises MergeError)"""
+    with zipfile.ZipFile(docx_paths[0]) as package:
+        main_part = _main_part_name(package)
+        # Everything but the body must be shared, or the letters are not one template's
+        shared = {info.filename: info.CRC for info in package.infolist() if info.filename != main_part}
+        for info in package.infolist():
+            if info.filename.startswith('word/') and ('header' in info.filename or 'footer' in info.filename) \
+                    and PAGE_COUNT_FIELD_RE.search(package.read(info)):
+                raise MergeError(f'{info.filename} counts pages')
+        root = etree.fromstring(package.read(main_part))
+
+    merged_body = root.find(qn('w:body'))
+    for child in list(merged_body):
+        merged_body.remove(child)
+
+    final_sect_pr = None
+    for index, path in enumerate(docx_paths):
+        with zipfile.ZipFile(path) as package:
+            if {info.filename: info.CRC for info in package.infolist() if info.filename != main_part} != shared:
+                raise MergeError(f'{Path(path).name} differs outside its body')
+            body = etree.fromstring(package.read(main_part)).find(qn('w:body'))
+        children = list(body)
+        if not children or children[-1].tag != W_SECTPR or len(body.findall(f'.//{W_SECTPR}')) != 1:
+            raise MergeError(f'{Path(path).name} is not a single-section letter')
+        if children[0].tag != W_P:
+            raise MergeError(f'{Path(path).name} does not start with a paragraph')
+        sect_pr = children.pop()
+        final_sect_pr = sect_pr
+
+        # Marker goes after the paragraph properties of the letter's first paragraph
+        first = children[0]
+        first.insert(1 if first.find(W_PPR) is not None else 0, _marker_run(index))
+        merged_body.extend(children)
+        if index < len(docx_paths) - 1:
+            # Ending the section on the letter's last paragraph adds no empty line
+            last = children[-1] if children[-1].tag == W_P else etree.SubElement(merged_body, W_P)
+            props = last.find(W_PPR)
+            if props is None:
+                props = etree.Element(W_PPR)
+                last.insert(0, props)
+            props.append(_restart_numbering(sect_pr))
+    merged_body.append(_restart_numbering(final_sect_pr))
+    return write_package(docx_paths[0], {main_part: etree.tostring(root, encoding='UTF-8', standalone=True)},
+                         output_path)
+
+
+def letter_pages(pdf_path, count):
+    """First page of each of `count` letters in a merged PDF (raises MergeError if the markers disagree)"""
+    reader = PdfReader(pdf_path)
+    starts = {}
+    for page_number, page in enumerate(reader.pages):
+        for match in MARKER_RE.finditer(page.extract_text() or ''):
+            starts.setdefault(int(match.group(1)), page_number)
+    ordered = [starts.get(index) for index in range(count)]
+    if len(starts) != count or None in ordered or ordered[0] != 0 or \
+            any(a >= b for a, b in zip(ordered, ordered[1:])):
+        raise MergeError(f'found {len(starts)} of {count} letter markers in order')
+    return reader, ordered + [len(reader.pages)]
+
+
+def _string_bytes(operand):
+    """Raw bytes of a content-stream string operand"""
+    return bytes(operand) if isinstance(operand, bytes) else operand.original_bytes
+
+
+def _without_marker(font, data):
+    """TJ elements showing data minus any split marker, or None if it holds no marker
+
+    The marker's glyphs are replaced by a TJ adjustment of the same width, so
+    whatever follows on the line stays where it was.
+    """
+    if isinstance(font.encoding, str):
+        codes = data.decode(font.encoding, 'surrogatepass')
+    else:
+        codes = ''.join(chr(byte) for byte in data)
+    text = ''.join(font.character_map.get(code, code) for code in codes)
+    match = MARKER_RE.search(text)
+    if match is None:
+        return None
+    if not codes or len(text) != len(codes) or len(data) % len(codes):
+        raise MergeError('split marker text does not map one character per glyph')
+    size = len(data) // len(codes)
+    start, end = match.start(), match.end()
+    # TJ numbers move the pen back by n/1000 of the font size
+    parts = [FloatObject(-font.get_text_width(codes[start:end]))]
+    if start:
+        parts.insert(0, ByteStringObject(data[:start * size]))
+    if end < len(codes):
+        parts.append(ByteStringObject(data[end * size:]))
+    return parts
+
+
+def _font_class():
+    """pypdf's font model (ToUnicode map and widths), or None when this pypdf has none
+
+    It is a private class in pypdf 6.x (pypdf.generic._font); without it the
+    markers cannot be located in the content stream, so letters are not merged.
+    """
+    try:
+        from pypdf.generic._font import Font
+    except ImportError:
+        return None
+    return Font
+
+
+def strip_markers(page):
+    """Cut split-marker text out of a page's content stream; returns how many were removed"""
+    Font = _font_class()
+    if Font is None:
+        raise MergeError('this pypdf cannot decode fonts to remove split markers')
+
+    contents = page.get_contents()
+    if contents is None:
+        return 0
+    resources = page.get('/Resources')
+    fonts = resources.get_object().get('/Font') if resources else None
+    fonts = fonts.get_object() if fonts else {}
+    content = ContentStream(contents, page.pdf)
+    loaded = {}
+    font, saved = None, []
+    operations = []
+    removed = 0
+    for operands, operator in content.operations:
+        if operator == b'q':
+            saved.append(font)
+        elif operator == b'Q' and saved:
+            font = saved.pop()
+        elif operator == b'Tf' and operands and operands[0] in fonts:
+            if operands[0] not in loaded:
+                loaded[operands[0]] = Font.from_font_resource(fonts[operands[0]].get_object())
+            font = loaded[operands[0]]
+        elif operator in (b'Tj', b'TJ', b"'", b'"') and font is not None:
+            strings = operands[0] if operator == b'TJ' else operands[-1:]
+            shown = ArrayObject()
+            found = False
+            for item in strings:
+                if isinstance(item, (bytes, str)):
+                    parts = _without_marker(font, _string_bytes(item))
+                    if parts is not None:
+                        shown.extend(parts)
+                        found = True
+                        continue
+                shown.append(item)
+            if found:
+                removed += 1
+                if operator == b"'":
+                    operations.append(([], b'T*'))
+                elif operator == b'"':
+                    operations += [([operands[0]], b'Tw'), ([operands[1]], b'Tc'), ([], b'T*')]
+                operations.append(([shown], b'TJ'))
+                continue
+        operations.append((operands, operator))
+    if removed:
+        content.operations = operations
+        page.replace_contents(content)
+    return removed
+
+
+def split_pdf(pdf_path, pdf_targets):
+    """Split a merged PDF into one file per letter at the recorded page ranges"""
+    with span('split_pdf'):
+        reader, bounds = letter_pages(pdf_path, len(pdf_targets))
+        for target, start, end in zip(pdf_targets, bounds, bounds[1:]):
+            target = Path(target)
+            writer = PdfWriter()
+            for page in reader.pages[start:end]:
+                writer.add_page(page)
+            # The marker sits on the letter's first page
+            if not strip_markers(writer.pages[0]) or MARKER_RE.search(writer.pages[0].extract_text() or ''):
+                raise MergeError(f'could not remove the split marker from {target.name}')
+            tmp = target.with_name(f'.{target.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+            try:
+                with open(tmp, 'wb') as f:
+                    writer.write(f)
+                os.replace(tmp, target)
+            finally:
+                tmp.unlink(missing_ok=True)
+    return [Path(target).resolve() for target in pdf_targets]
+
+
+def convert_merged(docx_paths, pool=None):
+    """Convert letters of one template with a single conversion
+
+    Returns one PDF path or exception per letter, next to each DOCX. Falls back
+    to converting each letter on its own when the letters cannot be merged or
+    the merged PDF does not split cleanly.
+    """
+    pool = pool or pdf_pool.get_pool()
+    docx_paths = [Path(path) for path in docx_paths]
+    pdf_paths = [path.with_suffix('.pdf') for path in docx_paths]
+    if len(docx_paths) > 1:
+        directory = docx_paths[0].parent
+        merged_docx = directory / f'.merge_{os.getpid()}_{threading.get_ident()}.docx'
+        merged_pdf = merged_docx.with_suffix('.pdf')
+        try:
+            if _font_class() is None:
+                # Checked up front so no merged conversion is wasted
+                raise MergeError('this pypdf cannot decode fonts to remove split markers')
+            with span('merge_letters'):
+                merge_letters(docx_paths, merged_docx)
+            pool.convert(merged_docx, merged_pdf)
+            return split_pdf(merged_pdf, pdf_paths)
+        except MergeError as e:
+            print(f"⚠️  Mail merge of {len(docx_paths)} letters fell back to one conversion each: {e}")
+            MERGE_FALLBACKS.inc(reason='mismatch')
+        except pdf_pool.ConversionError as e:
+            print(f"⚠️  Merged conversion failed, converting {len(docx_paths)} letters one by one: {e}")
+            MERGE_FALLBACKS.inc(reason='conversion')
+        finally:
+            merged_docx.unlink(missing_ok=True)
+            merged_pdf.unlink(missing_ok=True)
+
+    futures = [pool.submit(docx, pdf) for docx, pdf in zip(docx_paths, pdf_paths)]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append(e)
+    return results
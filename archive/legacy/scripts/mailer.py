@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Pooled SMTP Delivery
+Keeps a small pool of authenticated SMTP connections per sending account,
+reuses them across messages, reconnects when the server drops them and paces
+each account to its rate limit.
+
+Profile keys (all optional):
+  smtp_host             default smtp.gmail.com (env OFFER_SMTP_HOST overrides)
+  smtp_port             default 587 (env OFFER_SMTP_PORT overrides)
+  smtp_starttls         default true
+  smtp_pool_size        connections per account, default 2
+  smtp_rate_per_minute  messages per minute per account, default 20
+"""
+
+import os
+import queue
+import smtplib
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from metrics import span
+
+DEFAULT_HOST = 'smtp.gmail.com'
+DEFAULT_PORT = 587
+DEFAULT_POOL_SIZE = 2
+DEFAULT_RATE_PER_MINUTE = 20
+CONNECT_TIMEOUT = 30
+# Connections idle longer than this are probed with NOOP before reuse
+IDLE_PROBE_SECONDS = 60
+
+# Errors that mean the connection is gone; retried on a fresh one only while
+# connecting, since once sending has started the server may already have the message
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+_mailer = None
+_mailer_lock = threading.Lock()
+
+
+class RateLimiter:
+    """Token bucket allowing `rate_per_minute` sends with bursts up to `burst`"""
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1, int(rate_per_minute) // 4)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a send is allowed"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SMTPPool:
+    """Authenticated connections to one SMTP account"""
+
+    def __init__(self, host, port, username, password, starttls=True,
+                 size=DEFAULT_POOL_SIZE, rate_per_minute=DEFAULT_RATE_PER_MINUTE):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.size = max(1, size)
+        self.limiter = RateLimiter(rate_per_minute)
+        self.connects = 0
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def _connect(self):
+        server = None
+        try:
+            with span('email_connect'):
+                server = smtplib.SMTP(self.host, self.port, timeout=CONNECT_TIMEOUT)
+                if self.starttls:
+                    server.starttls(context=ssl.create_default_context())
+                server.ehlo_or_helo_if_needed()
+            if self.password and server.has_extn('auth'):
+                with span('email_login'):
+                    server.login(self.username, self.password)
+        except Exception:
+            if server is not None:
+                server.close()
+            raise
+        self.connects += 1
+        return server
+
+    @staticmethod
+    def _discard(server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a live connection; it goes back to the pool unless it failed"""
+        self._slots.acquire()
+        server = None
+        try:
+            while server is None:
+                try:
+                    server, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    server = self._connect()
+                    break
+                if time.monotonic() - last_used > IDLE_PROBE_SECONDS:
+                    try:
+                        server.noop()
+                    except Exception:
+                        server.close()
+                        server = None
+            yield server
+        except BaseException:
+            if server is not None:
+                self._discard(server)
+            raise
+        else:
+            self._idle.put((server, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def send(self, message):
+        """Send one message, connecting again once if getting a connection failed
+
+        A failure during send_message is raised, not retried: DATA may already
+        have been accepted, and a second attempt could mail the offer twice
+        (the outbox retries with backoff instead).
+        """
+        self.limiter.acquire()
+        for attempt in (1, 2):
+            sending = False
+            try:
+                with self.connection() as server, span('email_send'):
+                    sending = True
+                    server.send_message(message)
+                return
+            except RECONNECT_ERRORS:
+                if sending or attempt == 2:
+                    raise
+
+    def close(self):
+        """Quit every idle connection"""
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(server)
+
+
+class Mailer:
+    """One SMTPPool per sending account"""
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def pool_for(self, profile):
+        """Return (creating on first use) the pool for a profile's account"""
+        host = os.getenv('OFFER_SMTP_HOST') or profile.get('smtp_host', DEFAULT_HOST)
+        port = int(os.getenv('OFFER_SMTP_PORT') or profile.get('smtp_port', DEFAULT_PORT))
+        key = (host, port, profile['email'])
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = SMTPPool(
+                    host, port, profile['email'], profile['app_password'],
+                    starttls=profile.get('smtp_starttls', True),
+                    size=profile.get('smtp_pool_size', DEFAULT_POOL_SIZE),
+                    rate_per_minute=profile.get('smtp_rate_per_minute', DEFAULT_RATE_PER_MINUTE),
+                )
+                self._pools[key] = pool
+            return pool
+
+    def send(self, profile, message):
+        self.pool_for(profile).send(message)
+
+    def send_batch(self, profile, messages):
+        """Send many messages through the profile's pool; returns [(message, error or None)]"""
+        pool = self.pool_for(profile)
+
+        def deliver(message):
+            try:
+                pool.send(message)
+                return message, None
+            except Exception as e:
+                return message, e
+
+        with ThreadPoolExecutor(max_workers=pool.size) as executor:
+            return list(executor.map(deliver, messages))
+
+    def close(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
+
+
+def get_mailer():
+    """Process-wide mailer"""
+    global _mailer
+    with _mailer_lock:
+        if _mailer is None:
+            _mailer = Mailer()
+        return _mailer
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Pipeline Metrics
+Timing spans, histograms, counters and gauges for the generation, email and
+signing pipeline, rendered in the Prometheus text format for /metrics. The
+same spans can be captured in-process to print a per-stage breakdown from the
+command line (generate_offer.py --timings).
+
+    with span('fill'):
+        ...
+
+    @timed('save')
+    def write_package(...):
+"""
+
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers sub-millisecond fills up to slow LibreOffice conversions
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_metrics = {}
+_recorders = []
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set (or read from a callback at scrape time)"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=(), read=None):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.read = read
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        if self.read is not None:
+            value = self.read()
+            if isinstance(value, dict):
+                # {label value (or tuple of them): number} for labelled callbacks
+                return [(self.name, _format_labels(self.labels, key if isinstance(key, tuple) else (key,)), v)
+                        for key, v in sorted(value.items())]
+            return [] if value is None else [(self.name, '', value)]
+        with self._lock:
+            return [(self.name, _format_labels(self.labels, key), value)
+                    for key, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    """Current value per label set (or read from a callback at scrape time)"""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labels + ('le',), key + (_format_value(bound),))
+                    out.append((f'{self.name}_bucket', labels, cumulative))
+                labels = _format_labels(self.labels, key)
+                out.append((f'{self.name}_sum', labels, round(total, 6)))
+                out.append((f'{self.name}_count', labels, count))
+        return out
+
+
+def _register(metric):
+    """Add a metric, or return the one already registered under its name"""
+    with _lock:
+        existing = _metrics.get(metric.name)
+        if existing is not None and type(existing) is type(metric):
+            if getattr(metric, 'read', None) is not None:
+                existing.read = metric.read
+            return existing
+        _metrics[metric.name] = metric
+        return metric
+
+
+def counter(name, help_text, labels=(), read=None):
+    return _register(Counter(name, help_text, labels, read))
+
+
+def gauge(name, help_text, labels=(), read=None):
+    return _register(Gauge(name, help_text, labels, read))
+
+
+def histogram(name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, help_text, labels, buckets))
+
+
+STAGE_SECONDS = histogram('offer_stage_seconds', 'Time spent in each pipeline stage', ('stage',))
+STAGE_ERRORS = counter('offer_stage_errors_total', 'Pipeline stages that raised', ('stage',))
+
+
+@contextmanager
+def span(stage):
+    """Time a pipeline stage into offer_stage_seconds (and any active recorder)"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if _recorders:
+            with _lock:
+                for recorder in _recorders:
+                    recorder.append((stage, elapsed))
+
+
+def timed(stage):
+    """Decorator form of span()"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def recording():
+    """Collect every span finished in this process while active; yields a list of (stage, seconds)"""
+    recorder = []
+    with _lock:
+        _recorders.append(recorder)
+    try:
+        yield recorder
+    finally:
+        with _lock:
+            _recorders.remove(recorder)
+
+
+def format_breakdown(recorded):
+    """Per-stage table (first-seen order) for CLI output"""
+    totals = {}
+    for stage, seconds in recorded:
+        count, total = totals.get(stage, (0, 0.0))
+        totals[stage] = (count + 1, total + seconds)
+    lines = [f"{'stage':<20}{'count':>7}{'total ms':>11}"]
+    for stage, (count, total) in totals.items():
+        lines.append(f"{stage:<20}{count:>7}{total * 1000:>11.1f}")
+    return '\n'.join(lines)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    with _lock:
+        metrics = sorted(_metrics.values(), key=lambda m: m.name)
+    lines = []
+    for metric in metrics:
+        try:
+            samples = metric.samples()
+        except Exception:
+            # A broken gauge callback must not take down the whole scrape
+            continue
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in samples:
+            lines.append(f'{name}{labels} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
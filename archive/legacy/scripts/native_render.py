@@ -0,0 +1,595 @@
+#!/usr/bin/env python3
+"""
+Native Letter Rendering
+Renders letters described by a structured spec (JSON) straight to PDF, so
+profiles built this way never need LibreOffice: paragraphs with bold, italic,
+underline and size runs, left/center/right alignment, bullets, grid tables,
+images (e.g. a signature) and page breaks, laid out with the Helvetica metrics
+of the PDF standard fonts. The same spec also produces the DOCX template the
+profile fills for its secondary DOCX artifact.
+
+Spec format (see templates/decoarte/letter_spec.json):
+  {"page": {"size": "A4", "margin": 72}, "font_size": 11, "line_height": 1.2,
+   "blocks": [
+     {"type": "paragraph", "align": "center", "runs": [{"text": "...", "bold": true, "size": 24}]},
+     {"type": "paragraph", "text": "Date: {{Current Date}}", "align": "right"},
+     {"type": "bullet", "text": "..."},
+     {"type": "table", "grid": true, "widths": [1, 2], "rows": [["Label", "{{Value}}"]]},
+     {"type": "image", "path": "logo.png", "width": 120},
+     {"type": "spacer"}, {"type": "page_break"}]}
+
+Usage: python3 native_render.py <spec.json> <output.pdf|output.docx> [candidate.json]
+
+Settings (environment):
+  OFFER_SPEC_TEMPLATE_DIR  generated DOCX templates (default output/.spec_templates)
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import unicodedata
+import zlib
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+from metrics import span, timed
+
+# Bump whenever a change here alters rendered output; it is part of every spec hash
+NATIVE_RENDERER_VERSION = 1
+
+SPEC_TEMPLATE_DIR = Path(os.getenv('OFFER_SPEC_TEMPLATE_DIR', 'output/.spec_templates'))
+
+PAGE_SIZES = {'A4': (595.28, 841.89), 'Letter': (612.0, 792.0)}
+BLOCK_TYPES = ('paragraph', 'bullet', 'table', 'image', 'spacer', 'page_break')
+PLACEHOLDER_RE = re.compile(r'\{\{[^{}]+\}\}')
+TOKEN_RE = re.compile(r'\n|[^\S\n]+|\S+')
+
+BULLET = '•'
+BULLET_INDENT = 18
+CELL_PADDING = 4
+SPACE_AFTER = 4
+# Helvetica ascender, underline position and thickness (per 1000 units of font size)
+ASCENT = 0.718
+UNDERLINE_OFFSET = 0.1
+UNDERLINE_WIDTH = 0.05
+
+# Advance widths of ASCII 32-126 from the Helvetica / Helvetica-Bold AFM files
+# (the oblique faces share them)
+_HELVETICA = (
+    '278 278 355 556 556 889 667 191 333 333 389 584 278 333 278 278 556 556 556 556 556 556 556 556 '
+    '556 556 278 278 584 584 584 556 1015 667 667 722 722 667 611 778 722 278 500 667 556 833 722 778 '
+    '667 778 722 667 611 722 667 944 667 667 611 278 278 278 469 556 333 556 556 500 556 556 278 556 '
+    '556 222 222 500 222 833 556 556 556 556 333 500 278 556 500 722 500 500 500 334 260 334 584')
+_HELVETICA_BOLD = (
+    '278 333 474 556 556 889 722 238 333 333 389 584 278 333 278 278 556 556 556 556 556 556 556 556 '
+    '556 556 333 333 584 584 584 611 975 722 722 722 722 667 611 778 722 278 556 722 611 833 722 778 '
+    '667 778 722 667 611 722 667 944 667 667 611 333 278 333 584 556 333 556 611 556 611 556 333 611 '
+    '611 278 278 556 278 889 611 611 611 611 389 556 333 611 556 778 556 556 500 389 280 389 584')
+# WinAnsi punctuation outside ASCII: (regular, bold)
+_EXTRA_WIDTHS = {
+    '•': (350, 350), '–': (556, 556), '—': (1000, 1000), '‘': (222, 278),
+    '’': (222, 278), '“': (333, 500), '”': (333, 500), '€': (556, 556),
+    '…': (1000, 1000), ' ': (278, 278), '°': (400, 400), '©': (737, 737),
+}
+# Characters WinAnsi cannot encode
+_SUBSTITUTES = {'₹': 'Rs.', '−': '-', '‐': '-', '‑': '-'}
+
+# (bold, italic) -> PDF font resource name and base font
+FONTS = {
+    (False, False): ('F1', 'Helvetica'),
+    (True, False): ('F2', 'Helvetica-Bold'),
+    (False, True): ('F3', 'Helvetica-Oblique'),
+    (True, True): ('F4', 'Helvetica-BoldOblique'),
+}
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class SpecError(ValueError):
+    """Raised for an unreadable or invalid letter spec"""
+
+
+def _width_table(ascii_widths, column):
+    widths = {chr(32 + i): int(w) for i, w in enumerate(ascii_widths.split())}
+    widths.update((char, pair[column]) for char, pair in _EXTRA_WIDTHS.items())
+    return widths
+
+
+WIDTHS = {False: _width_table(_HELVETICA, 0), True: _width_table(_HELVETICA_BOLD, 1)}
+
+
+def pdf_text(text):
+    """Text restricted to what the WinAnsi-encoded standard fonts can show"""
+    out = []
+    for char in text:
+        if char in _SUBSTITUTES:
+            out.append(_SUBSTITUTES[char])
+            continue
+        try:
+            char.encode('cp1252')
+            out.append(char)
+        except UnicodeEncodeError:
+            # Accented letters outside Latin-1 keep their base letter
+            base = unicodedata.normalize('NFKD', char)[:1]
+            out.append(base if base and base.isascii() else '?')
+    return ''.join(out)
+
+
+def text_width(text, bold, size):
+    """Width in points of text set in Helvetica (bold) at size"""
+    table = WIDTHS[bold]
+    total = 0
+    for char in text:
+        width = table.get(char)
+        if width is None:
+            # Latin-1 letters are as wide as their base letter
+            base = unicodedata.normalize('NFKD', char)[:1]
+            width = table.get(base, 556)
+        total += width
+    return total * size / 1000
+
+
+def _escape(text):
+    data = text.encode('cp1252', errors='replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _runs(block, base_size, defaults=None):
+    """Normalized runs of a paragraph or table cell: [(text, bold, italic, underline, size)]"""
+    defaults = dict(defaults or {})
+    if isinstance(block, str):
+        block = {'text': block}
+    defaults.update((key, block[key]) for key in ('bold', 'italic', 'underline', 'size') if key in block)
+    raw = block.get('runs')
+    if raw is None:
+        raw = [block.get('text', '')]
+    runs = []
+    for run in raw:
+        if isinstance(run, str):
+            run = {'text': run}
+        style = dict(defaults, **run)
+        runs.append((str(style.get('text', '')), bool(style.get('bold')), bool(style.get('italic')),
+                     bool(style.get('underline')), float(style.get('size', base_size))))
+    return runs
+
+
+def _fill(text, replacements):
+    if '{{' not in text:
+        return text
+    return PLACEHOLDER_RE.sub(lambda m: str(replacements.get(m.group(0), m.group(0))), text)
+
+
+def wrap(runs, width, base_size, line_height):
+    """Greedy line breaking of styled runs; returns [(pieces, line width, line height)]
+
+    Each piece is (text, bold, italic, underline, size, width); consecutive
+    pieces of one style are merged so every piece is one Tj.
+    """
+    lines = []
+    line = []
+
+    def flush():
+        while line and line[-1][0].isspace():
+            line.pop()
+        merged = []
+        for piece in line:
+            if merged and merged[-1][1:5] == piece[1:5]:
+                last = merged[-1]
+                merged[-1] = (last[0] + piece[0],) + last[1:5] + (last[5] + piece[5],)
+            else:
+                merged.append(piece)
+        size = max((piece[4] for piece in merged), default=max((r[4] for r in runs), default=base_size))
+        lines.append((merged, sum(piece[5] for piece in merged), size * line_height))
+        line.clear()
+
+    used = 0.0
+    for text, bold, italic, underline, size in runs:
+        for token in TOKEN_RE.findall(pdf_text(text)):
+            if token == '\n':
+                flush()
+                used = 0.0
+                continue
+            token_width = text_width(token, bold, size)
+            if token.isspace():
+                if line:
+                    line.append((token, bold, italic, underline, size, token_width))
+                    used += token_width
+                continue
+            if line and used + token_width > width:
+                flush()
+                used = 0.0
+            # A word wider than the line is split wherever it runs out of room
+            while token_width > width and len(token) > 1:
+                cut = len(token) - 1
+                while cut > 1 and text_width(token[:cut], bold, size) > width - used:
+                    cut -= 1
+                part = token[:cut]
+                line.append((part, bold, italic, underline, size, text_width(part, bold, size)))
+                flush()
+                used = 0.0
+                token = token[cut:]
+                token_width = text_width(token, bold, size)
+            line.append((token, bold, italic, underline, size, token_width))
+            used += token_width
+    flush()
+    return lines
+
+
+def _image_objects(path):
+    """(image XObject, soft mask or None) for a picture file"""
+    with Image.open(path) as image:
+        image.load()
+        width, height = image.size
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        rgba = image.convert('RGBA')
+    smask = None
+    header = (f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+              f'/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode')
+    if has_alpha:
+        smask = (f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+                 f'/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode',
+                 zlib.compress(rgba.getchannel('A').tobytes()))
+    return (header, zlib.compress(rgba.convert('RGB').tobytes())), smask, (width, height)
+
+
+class _Layout:
+    """Page cursor and content streams for one rendered letter"""
+
+    def __init__(self, spec):
+        page = spec.get('page', {})
+        self.width, self.height = PAGE_SIZES.get(page.get('size', 'A4'), PAGE_SIZES['A4'])
+        margin = page.get('margin', 72)
+        self.top, self.right, self.bottom, self.left = (
+            margin if isinstance(margin, list) else [margin] * 4)
+        self.content_width = self.width - self.left - self.right
+        self.pages = []
+        self.images = {}
+        self.new_page()
+
+    def new_page(self):
+        self.ops = []
+        self.page_images = set()
+        self.pages.append((self.ops, self.page_images))
+        self.y = self.height - self.top
+
+    def ensure(self, height):
+        """Start a new page unless `height` more points fit on this one"""
+        if self.y - height < self.bottom and self.y < self.height - self.top:
+            self.new_page()
+
+    def draw_line(self, pieces, x, baseline):
+        for text, bold, italic, underline, size, width in pieces:
+            font = FONTS[(bold, italic)][0]
+            self.ops.append(f'BT /{font} {size:g} Tf {x:.2f} {baseline:.2f} Td '.encode()
+                            + _escape(text) + b' Tj ET')
+            if underline and text.strip():
+                self.ops.append(f'{x:.2f} {baseline - size * UNDERLINE_OFFSET:.2f} {width:.2f} '
+                                f'{size * UNDERLINE_WIDTH:.2f} re f'.encode())
+            x += width
+
+    def draw_lines(self, lines, x, width, align, top=None):
+        """Lay lines out from `top` (default: the cursor); returns the y below them"""
+        y = self.y if top is None else top
+        for pieces, line_width, line_height in lines:
+            if top is None:
+                self.ensure(line_height)
+                y = self.y
+            size = max((piece[4] for piece in pieces), default=0)
+            offset = {'center': (width - line_width) / 2, 'right': width - line_width}.get(align, 0)
+            self.draw_line(pieces, x + offset, y - (line_height - size) / 2 - size * ASCENT)
+            y -= line_height
+            if top is None:
+                self.y = y
+        return y
+
+
+class LetterSpec:
+    """A loaded letter spec that renders PDFs directly and generates its DOCX template"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        raw = self.path.read_bytes()
+        try:
+            self.spec = json.loads(raw)
+        except ValueError as e:
+            raise SpecError(f'{self.path}: invalid JSON ({e})')
+        self._validate()
+        self.base_dir = self.path.parent
+        self.font_size = float(self.spec.get('font_size', 11))
+        self.line_height = float(self.spec.get('line_height', 1.2))
+        self.content_hash = hashlib.sha256(raw + f':{NATIVE_RENDERER_VERSION}'.encode()).hexdigest()
+        self._template_lock = threading.Lock()
+
+    def _validate(self):
+        blocks = self.spec.get('blocks') if isinstance(self.spec, dict) else None
+        if not isinstance(blocks, list):
+            raise SpecError(f'{self.path}: expected an object with a "blocks" list')
+        size = self.spec.get('page', {}).get('size', 'A4')
+        if size not in PAGE_SIZES:
+            raise SpecError(f'{self.path}: unknown page size {size!r}')
+        for index, block in enumerate(blocks):
+            kind = block.get('type') if isinstance(block, dict) else None
+            if kind not in BLOCK_TYPES:
+                raise SpecError(f'{self.path}: block {index} has unknown type {kind!r}')
+            if kind == 'table' and not all(isinstance(row, list) for row in block.get('rows', [])):
+                raise SpecError(f'{self.path}: block {index}: table rows must be lists of cells')
+            if kind == 'image' and 'path' not in block:
+                raise SpecError(f'{self.path}: block {index}: image needs a "path"')
+
+    def _filled_runs(self, block, replacements, defaults=None):
+        return [(_fill(text, replacements),) + tuple(style)
+                for text, *style in _runs(block, self.font_size, defaults)]
+
+    def _image_path(self, block, replacements):
+        value = _fill(str(block['path']), replacements)
+        if not value or PLACEHOLDER_RE.search(value):
+            return None
+        path = Path(value)
+        return path if path.is_absolute() else self.base_dir / path
+
+    def layout(self, replacements):
+        """Lay the letter out; returns the _Layout holding each page's operators"""
+        layout = _Layout(self.spec)
+        base = self.font_size
+        for block in self.spec['blocks']:
+            kind = block['type']
+            align = block.get('align', 'left')
+            space_after = block.get('space_after', SPACE_AFTER)
+
+            if kind == 'page_break':
+                layout.new_page()
+            elif kind == 'spacer':
+                layout.y -= block.get('height', base * self.line_height)
+            elif kind in ('paragraph', 'bullet'):
+                indent = block.get('indent', BULLET_INDENT if kind == 'bullet' else 0)
+                runs = self._filled_runs(block, replacements)
+                lines = wrap(runs, layout.content_width - indent, base, self.line_height)
+                if kind == 'bullet' and lines:
+                    layout.ensure(lines[0][2])
+                    size = runs[0][4] if runs else base
+                    bullet_line = [(BULLET, False, False, False, size, text_width(BULLET, False, size))]
+                    layout.draw_lines([(bullet_line, 0, lines[0][2])], layout.left + indent - 12,
+                                      12, 'left', top=layout.y)
+                layout.draw_lines(lines, layout.left + indent, layout.content_width - indent, align)
+                layout.y -= space_after
+            elif kind == 'table':
+                self._layout_table(layout, block, replacements)
+                layout.y -= space_after
+            elif kind == 'image':
+                self._layout_image(layout, block, replacements, align)
+                layout.y -= space_after
+        return layout
+
+    def _layout_table(self, layout, block, replacements):
+        rows = block.get('rows', [])
+        columns = max((len(row) for row in rows), default=0)
+        if not columns:
+            return
+        weights = block.get('widths') or [1] * columns
+        total = float(sum(weights))
+        widths = [layout.content_width * w / total for w in weights]
+        bold_first = block.get('bold_first_column', False)
+        grid = block.get('grid', True)
+
+        for row in rows:
+            cells = []
+            for column, cell in enumerate(row):
+                defaults = {'bold': True} if bold_first and column == 0 else None
+                runs = self._filled_runs(cell, replacements, defaults)
+                cells.append(wrap(runs, widths[column] - 2 * CELL_PADDING, self.font_size, self.line_height))
+            height = max(sum(line[2] for line in lines) for lines in cells) + 2 * CELL_PADDING
+            layout.ensure(height)
+            x = layout.left
+            for column, width in enumerate(widths):
+                if column < len(cells):
+                    cell_align = row[column].get('align', 'left') if isinstance(row[column], dict) else 'left'
+                    layout.draw_lines(cells[column], x + CELL_PADDING, width - 2 * CELL_PADDING,
+                                      cell_align, top=layout.y - CELL_PADDING)
+                if grid:
+                    layout.ops.append(f'0.5 w {x:.2f} {layout.y - height:.2f} {width:.2f} {height:.2f} re S'.encode())
+                x += width
+            layout.y -= height
+
+    def _layout_image(self, layout, block, replacements, align):
+        path = self._image_path(block, replacements)
+        if path is None or not path.exists():
+            # e.g. a signature placeholder before the letter is signed
+            return
+        key = str(path.resolve())
+        if key not in layout.images:
+            layout.images[key] = (f'Im{len(layout.images) + 1}',) + _image_objects(path)
+        name, _, _, (pixel_width, pixel_height) = layout.images[key]
+        width = float(block.get('width', min(layout.content_width, pixel_width * 0.75)))
+        height = float(block.get('height', width * pixel_height / pixel_width))
+        layout.ensure(height)
+        x = layout.left + {'center': (layout.content_width - width) / 2,
+                           'right': layout.content_width - width}.get(align, 0)
+        layout.y -= height
+        layout.ops.append(f'q {width:.2f} 0 0 {height:.2f} {x:.2f} {layout.y:.2f} cm /{name} Do Q'.encode())
+        layout.page_images.add(key)
+
+    def pdf_bytes(self, replacements):
+        """The rendered letter as PDF bytes"""
+        layout = self.layout(replacements)
+
+        objects = [None, None]  # catalog and page tree, filled in last
+        font_refs = {}
+        for name, base_font in FONTS.values():
+            objects.append(f'<< /Type /Font /Subtype /Type1 /BaseFont /{base_font} '
+                           f'/Encoding /WinAnsiEncoding >>'.encode())
+            font_refs[name] = len(objects)
+        image_refs = {}
+        for key, (name, picture, smask, _) in layout.images.items():
+            if smask:
+                objects.append(smask)
+                picture = (picture[0] + f' /SMask {len(objects)} 0 R', picture[1])
+            objects.append(picture)
+            image_refs[key] = (name, len(objects))
+
+        fonts = ' '.join(f'/{name} {ref} 0 R' for name, ref in font_refs.items())
+        kids = []
+        for ops, page_images in layout.pages:
+            objects.append(('<< /Filter /FlateDecode', zlib.compress(b'\n'.join(ops))))
+            contents = len(objects)
+            xobjects = ' '.join(f'/{image_refs[key][0]} {image_refs[key][1]} 0 R' for key in sorted(page_images))
+            resources = f'/Font << {fonts} >>' + (f' /XObject << {xobjects} >>' if xobjects else '')
+            objects.append((f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {layout.width:.2f} {layout.height:.2f}] '
+                            f'/Resources << {resources} >> /Contents {contents} 0 R >>').encode())
+            kids.append(f'{len(objects)} 0 R')
+        objects[0] = b'<< /Type /Catalog /Pages 2 0 R >>'
+        objects[1] = f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {len(kids)} >>'.encode()
+
+        out = BytesIO()
+        out.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        offsets = []
+        for number, obj in enumerate(objects, start=1):
+            offsets.append(out.tell())
+            out.write(f'{number} 0 obj\n'.encode())
+            if isinstance(obj, tuple):
+                header, data = obj
+                out.write(f'{header} /Length {len(data)} >>\nstream\n'.encode())
+                out.write(data + b'\nendstream')
+            else:
+                out.write(obj)
+            out.write(b'\nendobj\n')
+        xref = out.tell()
+        out.write(f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode())
+        for offset in offsets:
+            out.write(f'{offset:010d} 00000 n \n'.encode())
+        out.write(f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode())
+        return out.getvalue()
+
+    @timed('native_render')
+    def render(self, replacements, output_path):
+        """Render the letter to output_path as PDF (written atomically)"""
+        output_path = Path(output_path)
+        data = self.pdf_bytes(replacements)
+        tmp = output_path.with_name(f'.{output_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp.write_bytes(data)
+        os.replace(tmp, output_path)
+        return output_path
+
+    def write_docx(self, output_path, replacements=None):
+        """Write the spec as a DOCX (placeholders kept unless replacements are given)"""
+        from docx import Document
+        from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_BREAK
+        from docx.shared import Pt
+
+        replacements = replacements or {}
+        alignments = {'left': WD_ALIGN_PARAGRAPH.LEFT, 'center': WD_ALIGN_PARAGRAPH.CENTER,
+                      'right': WD_ALIGN_PARAGRAPH.RIGHT}
+        doc = Document()
+        section = doc.sections[0]
+        layout = _Layout(self.spec)
+        section.page_width, section.page_height = Pt(layout.width), Pt(layout.height)
+        section.top_margin, section.right_margin = Pt(layout.top), Pt(layout.right)
+        section.bottom_margin, section.left_margin = Pt(layout.bottom), Pt(layout.left)
+        doc.styles['Normal'].font.size = Pt(self.font_size)
+
+        def add_runs(paragraph, runs):
+            for text, bold, italic, underline, size in runs:
+                run = paragraph.add_run(text)
+                run.bold, run.italic, run.underline = bold or None, italic or None, underline or None
+                if size != self.font_size:
+                    run.font.size = Pt(size)
+
+        for block in self.spec['blocks']:
+            kind = block['type']
+            align = alignments.get(block.get('align', 'left'))
+            if kind == 'page_break':
+                doc.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+            elif kind == 'spacer':
+                doc.add_paragraph()
+            elif kind in ('paragraph', 'bullet'):
+                paragraph = doc.add_paragraph(style='List Bullet' if kind == 'bullet' else None)
+                paragraph.alignment = align
+                add_runs(paragraph, self._filled_runs(block, replacements))
+            elif kind == 'table':
+                rows = block.get('rows', [])
+                columns = max((len(row) for row in rows), default=0)
+                if not columns:
+                    continue
+                table = doc.add_table(rows=len(rows), cols=columns)
+                if block.get('grid', True):
+                    table.style = 'Table Grid'
+                for r, row in enumerate(rows):
+                    for c, cell in enumerate(row):
+                        defaults = {'bold': True} if block.get('bold_first_column') and c == 0 else None
+                        add_runs(table.cell(r, c).paragraphs[0], self._filled_runs(cell, replacements, defaults))
+            elif kind == 'image':
+                path = self._image_path(block, replacements)
+                if path is not None and path.exists():
+                    doc.add_picture(str(path), width=Pt(block['width']) if 'width' in block else None)
+                    doc.paragraphs[-1].alignment = align
+
+        output_path = Path(output_path)
+        tmp = output_path.with_name(f'.{output_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        doc.save(str(tmp))
+        os.replace(tmp, output_path)
+        return output_path
+
+    def template_docx(self):
+        """The DOCX template generated from this spec (built once per spec version)"""
+        path = SPEC_TEMPLATE_DIR / f'{self.content_hash[:16]}.docx'
+        with self._template_lock:
+            if not path.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self.write_docx(path)
+        return path.resolve()
+
+
+def load_spec(spec_path):
+    """Return the loaded spec for a path, reloading if the file changed"""
+    path = Path(spec_path).resolve()
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        raise SpecError(f'Letter spec not found: {path}')
+    version = (stat.st_mtime_ns, stat.st_size)
+
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == version:
+            return cached[1]
+
+    with span('spec_load'):
+        spec = LetterSpec(path)
+    with _cache_lock:
+        _cache[path] = (version, spec)
+    return spec
+
+
+def main(argv):
+    if len(argv) < 2:
+        print("Usage: python3 native_render.py <spec.json> <output.pdf|output.docx> [candidate.json]")
+        return 1
+    try:
+        spec = load_spec(argv[0])
+    except SpecError as e:
+        print(f"❌ {e}")
+        return 1
+
+    replacements = {}
+    if len(argv) > 2:
+        from generate_offer import build_replacements
+        with open(argv[2], 'r') as f:
+            data = json.load(f)
+        replacements = build_replacements(data, {'offer_validity_days': 7, 'probation_months': 3})
+
+    output = Path(argv[1])
+    if output.suffix.lower() == '.docx':
+        spec.write_docx(output, replacements)
+    else:
+        spec.render(replacements, output)
+    print(f"✅ Created: {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
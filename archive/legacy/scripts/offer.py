@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Offer Letter Automation CLI
+One entry point for the everyday tools. A subcommand's module is imported
+only when that subcommand runs, and the modules themselves defer python-docx,
+pypdf, PIL, Flask and the Gemini client to the code paths that use them, so
+short runs from scripts and cron jobs pay only for what they do.
+`python3 benchmark.py --startup` checks start-up time against a fixed budget.
+
+Usage: python3 offer.py generate <profile> <candidate.json> [--timings] [--profile|--cprofile]
+       python3 offer.py batch <profile> <candidate.json>... [--workers N] [--no-pdf] [--merge]
+       python3 offer.py send <profile> <candidate.json>... [--to recipient@email.com]
+       python3 offer.py sign <profile> <Candidate_Name> <signature.png> [--date TEXT]
+       python3 offer.py serve [--host 127.0.0.1] [--port 5001] [--workers N]
+"""
+
+import importlib
+import sys
+
+# subcommand -> (module, summary); each module has main(argv)
+COMMANDS = {
+    'generate': ('generate_offer', 'fill one letter and render its PDF'),
+    'batch': ('batch_generate', 'generate letters for many candidates in parallel'),
+    'send': ('send_email', 'email generated letters'),
+    'sign': ('signing', "stamp a signature onto a candidate's letter"),
+    'serve': ('run_server', 'run the admin and signature server'),
+}
+
+
+def usage():
+    lines = ["Usage: python3 offer.py <command> [args]", "", "Commands:"]
+    lines += [f"  {name:<10}{summary}" for name, (_, summary) in COMMANDS.items()]
+    lines += ["", "Run python3 offer.py <command> --help for a command's arguments."]
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help', 'help'):
+        print(usage())
+        return 0 if argv else 1
+    if argv[0] not in COMMANDS:
+        print(f"❌ Unknown command: {argv[0]}\n\n{usage()}")
+        return 1
+
+    module = importlib.import_module(COMMANDS[argv[0]][0])
+    return module.main(argv[1:]) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
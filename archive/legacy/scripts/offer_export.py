@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Bulk Offer Export
+Streams a ZIP of generated letters (PDFs, optionally the DOCX and signed
+copies) for a profile or a filtered set straight to the HTTP response or a
+file. Entries are stored, not recompressed (PDFs already are), and written
+as they are read, so memory stays flat however many letters are exported.
+
+Over HTTP (/api/export) the whole archive is handed out, so the endpoint is
+off unless OFFER_EXPORT_TOKEN is set and the request carries that token.
+
+Usage: python3 offer_export.py <output.zip|-> [--profile NAME] [--since YYYY-MM-DD]
+                               [--until YYYY-MM-DD] [--signed-only] [--docx] [--signed]
+
+Settings (environment):
+  OFFER_EXPORT_TOKEN  secret required by /api/export (default unset: HTTP export off)
+"""
+
+import argparse
+import hmac
+import os
+import sys
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta
+from pathlib import Path, PurePosixPath
+
+from offer_store import get_offer_store
+
+CHUNK_SIZE = 256 * 1024
+EXPORT_TOKEN = os.getenv('OFFER_EXPORT_TOKEN', '')
+
+
+class ExportError(ValueError):
+    """Raised for invalid export filters"""
+
+
+class _Sink:
+    """Write-only, unseekable target that hands back whatever zipfile wrote since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def export_allowed(token):
+    """Whether an HTTP request presenting token may export letters"""
+    return bool(EXPORT_TOKEN and token) and hmac.compare_digest(token.encode(), EXPORT_TOKEN.encode())
+
+
+def parse_day(value, end=False):
+    """Epoch seconds for the start (or end, exclusive) of a YYYY-MM-DD local date"""
+    if not value:
+        return None
+    try:
+        day = datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ExportError(f'Invalid date {value!r} (expected YYYY-MM-DD)')
+    return (day + timedelta(days=1) if end else day).timestamp()
+
+
+def export_kinds(docx=False, signed=False):
+    """Artifact kinds to export; signed copies keep their _signed file names"""
+    return ['pdf'] + (['docx'] if docx else []) + (['signed_pdf'] if signed else [])
+
+
+def stream_zip(entries):
+    """Yield ZIP bytes for (archive name, path) pairs as each file is read; missing files are skipped"""
+    sink = _Sink()
+    names = set()
+    # Next suffix to try per duplicated name
+    counters = {}
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, path in entries:
+            try:
+                source = open(path, 'rb')
+            except (FileNotFoundError, IsADirectoryError):
+                continue
+            with source:
+                stat = os.fstat(source.fileno())
+                if name in names:
+                    # Never write two entries under one name, even if a renamed one is taken too
+                    base = PurePosixPath(name)
+                    while name in names:
+                        counters[base] = counters.get(base, 1) + 1
+                        name = str(base.with_name(f'{base.stem}_{counters[base]}{base.suffix}'))
+                names.add(name)
+                info = zipfile.ZipInfo(name, time.localtime(max(stat.st_mtime, 315532800))[:6])
+                info.compress_type = zipfile.ZIP_STORED
+                info.external_attr = 0o644 << 16
+                info.file_size = stat.st_size
+                with archive.open(info, 'w', force_zip64=stat.st_size >= zipfile.ZIP64_LIMIT) as target:
+                    while True:
+                        chunk = source.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        target.write(chunk)
+                        yield sink.drain()
+            yield sink.drain()
+    # Central directory
+    yield sink.drain()
+
+
+def offer_entries(profile=None, since=None, until=None, signed_only=False, docx=False, signed=False,
+                  store=None):
+    """(archive name, path) for every exported file, grouped in one folder per profile"""
+    store = store or get_offer_store()
+    for row, kind, path in store.iter_artifacts(export_kinds(docx, signed), profile=profile, since=since,
+                                                until=until, signed_only=signed_only):
+        yield f"{row['profile'] or 'unsorted'}/{path.name}", path
+
+
+def export_offers(**filters):
+    """ZIP bytes of the letters matching the filters, streamed in chunks"""
+    return (chunk for chunk in stream_zip(offer_entries(**filters)) if chunk)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export generated offer letters as a ZIP')
+    parser.add_argument('output', help='ZIP file to write, or - for stdout')
+    parser.add_argument('--profile', help='only this profile')
+    parser.add_argument('--since', help='generated on or after YYYY-MM-DD')
+    parser.add_argument('--until', help='generated on or before YYYY-MM-DD')
+    parser.add_argument('--signed-only', action='store_true', help='only signed offers')
+    parser.add_argument('--docx', action='store_true', help='include the DOCX files')
+    parser.add_argument('--signed', action='store_true', help='include the signed PDFs')
+    args = parser.parse_args(argv)
+
+    try:
+        chunks = export_offers(profile=args.profile, since=parse_day(args.since),
+                               until=parse_day(args.until, end=True), signed_only=args.signed_only,
+                               docx=args.docx, signed=args.signed)
+    except ExportError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    if args.output == '-':
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+        return 0
+
+    output = Path(args.output)
+    tmp = output.with_name(f'.{output.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        with open(tmp, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp, output)
+    finally:
+        tmp.unlink(missing_ok=True)
+    with zipfile.ZipFile(output) as archive:
+        count = len(archive.infolist())
+    print(f"✅ Exported {count} file(s) to {output} ({output.stat().st_size / 1024:.0f} KB)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
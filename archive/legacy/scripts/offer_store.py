@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Offer Lifecycle Store
+Indexed SQLite record of candidates, their generated files and where each
+offer stands (new -> generated -> emailed -> viewed -> signed). The pipeline
+updates it as letters are generated, emailed, opened and signed, so the server
+looks offers up with indexed queries instead of probing output/ for files.
+On first use it is bootstrapped from the existing data/ and output/ trees.
+
+Usage: python3 offer_store.py [--rebuild]
+
+Settings (environment):
+  OFFER_STORE_DB   database path (default output/offers.db)
+  OFFER_DATA_DIRS  candidate JSON directories to import (default data:examples)
+"""
+
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+STORE_DB = Path(os.getenv('OFFER_STORE_DB', 'output/offers.db'))
+DATA_DIRS = [Path(d) for d in os.getenv('OFFER_DATA_DIRS', 'data:examples').split(os.pathsep) if d]
+OUTPUT_DIR = Path('output')
+
+NEW, GENERATED, EMAILED, VIEWED, SIGNED = 'new', 'generated', 'emailed', 'viewed', 'signed'
+STATUS_RANK = {NEW: 0, GENERATED: 1, EMAILED: 2, VIEWED: 3, SIGNED: 4}
+
+ARTIFACT_RE = re.compile(r'^offer_letter_(?P<slug>.+?)(?P<signed>_signed)?\.(?P<ext>docx|pdf)$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS candidates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    profile TEXT NOT NULL,
+    slug TEXT NOT NULL,
+    name TEXT NOT NULL COLLATE NOCASE,
+    email TEXT COLLATE NOCASE,
+    data TEXT,
+    status TEXT NOT NULL,
+    generated_at REAL,
+    emailed_at REAL,
+    viewed_at REAL,
+    signed_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (profile, slug)
+);
+CREATE INDEX IF NOT EXISTS candidates_slug ON candidates (slug);
+CREATE INDEX IF NOT EXISTS candidates_name ON candidates (name);
+CREATE INDEX IF NOT EXISTS candidates_email ON candidates (email);
+CREATE INDEX IF NOT EXISTS candidates_status ON candidates (status, updated_at);
+CREATE INDEX IF NOT EXISTS candidates_profile ON candidates (profile, status, updated_at);
+CREATE TABLE IF NOT EXISTS artifacts (
+    candidate_id INTEGER NOT NULL REFERENCES candidates (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    PRIMARY KEY (candidate_id, kind)
+);
+"""
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def candidate_slug(name):
+    """File-name form of a candidate name, as used in output/ ('Jane Doe' -> 'Jane_Doe')"""
+    return name.strip().replace(' ', '_')
+
+
+class OfferStore:
+    """SQLite-backed candidate and artifact index"""
+
+    def __init__(self, db_path=STORE_DB):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA foreign_keys=ON')
+            self._db.executescript(SCHEMA)
+            bootstrapped = self._db.execute('PRAGMA user_version').fetchone()[0]
+        if not bootstrapped:
+            self.bootstrap()
+
+    # --- writes -------------------------------------------------------------
+
+    def _upsert_locked(self, profile, name, data=None):
+        """Candidate id for (profile, name), creating or updating the row"""
+        now = time.time()
+        slug = candidate_slug(name)
+        email = (data or {}).get('email') or None
+        self._db.execute(
+            'INSERT INTO candidates (profile, slug, name, email, data, status, created_at, updated_at)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+            ' ON CONFLICT (profile, slug) DO UPDATE SET'
+            ' name = excluded.name,'
+            ' email = COALESCE(excluded.email, email),'
+            ' data = COALESCE(excluded.data, data),'
+            ' updated_at = excluded.updated_at',
+            (profile, slug, name.strip(), email, json.dumps(data) if data else None, NEW, now, now),
+        )
+        return self._db.execute('SELECT id FROM candidates WHERE profile = ? AND slug = ?',
+                                (profile, slug)).fetchone()[0]
+
+    def _artifact_locked(self, candidate_id, kind, path):
+        path = Path(path)
+        try:
+            stat = path.stat()
+            size, mtime = stat.st_size, stat.st_mtime
+        except FileNotFoundError:
+            size = mtime = None
+        self._db.execute(
+            'INSERT OR REPLACE INTO artifacts (candidate_id, kind, path, size, mtime) VALUES (?, ?, ?, ?, ?)',
+            (candidate_id, kind, str(path), size, mtime),
+        )
+
+    def _advance_locked(self, candidate_id, status, at=None):
+        """Move a candidate forward to `status` (never backwards) and stamp the time"""
+        at = at or time.time()
+        ranks = ' '.join(f"WHEN '{name}' THEN {rank}" for name, rank in STATUS_RANK.items())
+        self._db.execute(
+            f'UPDATE candidates SET {status}_at = COALESCE({status}_at, ?), updated_at = ?,'
+            f' status = CASE WHEN (CASE status {ranks} END) < ? THEN ? ELSE status END WHERE id = ?',
+            (at, time.time(), STATUS_RANK[status], status, candidate_id),
+        )
+
+    def record_candidate(self, profile, data):
+        """Add or refresh a candidate's details; returns its id"""
+        with self._lock, self._db:
+            return self._upsert_locked(profile, data['name'], data)
+
+    def record_generated(self, profile, data, docx=None, pdf=None):
+        """A letter was rendered for this candidate"""
+        with self._lock, self._db:
+            candidate_id = self._upsert_locked(profile, data['name'], data)
+            for kind, path in (('docx', docx), ('pdf', pdf)):
+                if path:
+                    self._artifact_locked(candidate_id, kind, path)
+            self._advance_locked(candidate_id, GENERATED)
+        return candidate_id
+
+    def record_artifact(self, profile, name, kind, path):
+        """Attach a file (e.g. 'signed_pdf', 'signature') to a candidate"""
+        with self._lock, self._db:
+            self._artifact_locked(self._upsert_locked(profile, name), kind, path)
+
+    def advance(self, profile, name, status):
+        """Record a lifecycle step for an offer, if the candidate is known"""
+        with self._lock, self._db:
+            row = self._find_locked(profile, candidate_slug(name))
+            if row:
+                self._advance_locked(row['id'], status)
+            return row is not None
+
+    # --- reads --------------------------------------------------------------
+
+    def _find_locked(self, profile, slug):
+        # Letters from before profiles existed live in output/ itself (profile '')
+        return self._db.execute(
+            'SELECT * FROM candidates WHERE slug = ? AND profile IN (?, ?)'
+            ' ORDER BY profile = ? DESC LIMIT 1',
+            (slug, profile, '', profile),
+        ).fetchone()
+
+    def _artifacts_locked(self, candidate_ids):
+        found = {candidate_id: {} for candidate_id in candidate_ids}
+        if candidate_ids:
+            marks = ','.join('?' * len(candidate_ids))
+            for row in self._db.execute(f'SELECT * FROM artifacts WHERE candidate_id IN ({marks})',
+                                        list(candidate_ids)):
+                found[row['candidate_id']][row['kind']] = row['path']
+        return found
+
+    @staticmethod
+    def _to_dict(row, artifacts):
+        item = dict(row)
+        item['data'] = json.loads(item['data']) if item['data'] else {}
+        item['artifacts'] = artifacts
+        return item
+
+    def get(self, profile, name):
+        """Candidate with data and artifact paths, or None"""
+        with self._lock:
+            row = self._find_locked(profile, candidate_slug(name))
+            if row is None:
+                return None
+            return self._to_dict(row, self._artifacts_locked([row['id']])[row['id']])
+
+    def artifact(self, profile, name, kind):
+        """Path of one artifact, or None"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT a.path FROM candidates c JOIN artifacts a ON a.candidate_id = c.id'
+                ' WHERE c.slug = ? AND c.profile IN (?, ?) AND a.kind = ?'
+                ' ORDER BY c.profile = ? DESC LIMIT 1',
+                (candidate_slug(name), profile, '', kind, profile),
+            ).fetchone()
+        return Path(row['path']) if row else None
+
+    def list(self, profile=None, status=None, query=None, limit=100, offset=0):
+        """Candidates, most recently updated first; `query` is a name/email prefix"""
+        clauses, params = [], []
+        if profile is not None:
+            clauses.append('profile = ?')
+            params.append(profile)
+        if status:
+            clauses.append('status = ?')
+            params.append(status)
+        if query:
+            clauses.append('(name LIKE ? OR email LIKE ?)')
+            params += [f'{query}%', f'{query}%']
+        sql = 'SELECT * FROM candidates'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY updated_at DESC LIMIT ? OFFSET ?'
+        with self._lock:
+            rows = self._db.execute(sql, params + [limit, offset]).fetchall()
+            artifacts = self._artifacts_locked([row['id'] for row in rows])
+        return [self._to_dict(row, artifacts[row['id']]) for row in rows]
+
+    def letter_profiles(self, name):
+        """Profiles that have generated a letter for this candidate"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT profile FROM candidates WHERE slug = ? AND status != ? AND profile != ''",
+                (candidate_slug(name), NEW),
+            ).fetchall()
+        return [row['profile'] for row in rows]
+
+    def iter_artifacts(self, kinds, profile=None, since=None, until=None, signed_only=False,
+                       page_size=500):
+        """(candidate row, kind, path) for every matching file, fetched a page at a time
+
+        `since`/`until` bound generated_at (epoch seconds). Rows come in id
+        order, so the lock is held only while each page is read.
+        """
+        clauses, params = ['a.kind IN ({})'.format(','.join('?' * len(kinds)))], list(kinds)
+        if profile is not None:
+            clauses.append('c.profile = ?')
+            params.append(profile)
+        if since is not None:
+            clauses.append('c.generated_at >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('c.generated_at < ?')
+            params.append(until)
+        if signed_only:
+            clauses.append('c.status = ?')
+            params.append(SIGNED)
+        sql = ('SELECT c.id, c.profile, c.slug, c.name, c.status, a.kind, a.path'
+               ' FROM candidates c JOIN artifacts a ON a.candidate_id = c.id'
+               ' WHERE ' + ' AND '.join(clauses) +
+               ' AND (c.id > ? OR (c.id = ? AND a.kind > ?)) ORDER BY c.id, a.kind LIMIT ?')
+        last_id, last_kind = 0, ''
+        while True:
+            with self._lock:
+                rows = self._db.execute(sql, params + [last_id, last_id, last_kind, page_size]).fetchall()
+            for row in rows:
+                yield dict(row), row['kind'], Path(row['path'])
+            if len(rows) < page_size:
+                return
+            last_id, last_kind = rows[-1]['id'], rows[-1]['kind']
+
+    def counts(self):
+        """Number of candidates per lifecycle status"""
+        with self._lock:
+            rows = self._db.execute('SELECT status, COUNT(*) FROM candidates GROUP BY status').fetchall()
+        return {status: count for status, count in rows}
+
+    # --- bootstrap ----------------------------------------------------------
+
+    def bootstrap(self, data_dirs=DATA_DIRS, output_dir=OUTPUT_DIR):
+        """Import existing letters from output/ and candidate files from data/ (idempotent)"""
+        letters = candidates = 0
+        with self._lock, self._db:
+            output_dir = Path(output_dir)
+            if output_dir.is_dir():
+                folders = [('', output_dir)] + [(d.name, d) for d in output_dir.iterdir()
+                                                if d.is_dir() and not d.name.startswith('.')]
+                for profile, folder in folders:
+                    for path in folder.glob('offer_letter_*'):
+                        match = ARTIFACT_RE.match(path.name)
+                        if not match:
+                            continue
+                        signed = bool(match['signed'])
+                        kind = ('signed_' if signed else '') + match['ext']
+                        candidate_id = self._upsert_locked(profile, match['slug'].replace('_', ' '))
+                        self._artifact_locked(candidate_id, kind, path)
+                        mtime = path.stat().st_mtime
+                        self._advance_locked(candidate_id, SIGNED if signed else GENERATED, at=mtime)
+                        letters += 1
+
+            for data_dir in data_dirs:
+                for path in sorted(Path(data_dir).glob('*.json')):
+                    try:
+                        data = json.loads(path.read_text())
+                    except (OSError, ValueError):
+                        continue
+                    if not isinstance(data, dict) or not data.get('name'):
+                        continue
+                    # Attach details to letters already found for this name, else keep as a new candidate
+                    rows = self._db.execute('SELECT profile FROM candidates WHERE slug = ?',
+                                            (candidate_slug(data['name']),)).fetchall()
+                    for profile in [row['profile'] for row in rows] or ['']:
+                        self._upsert_locked(profile, data['name'], data)
+                    candidates += 1
+            self._db.execute('PRAGMA user_version = 1')
+        return letters, candidates
+
+    def rebuild(self):
+        """Forget everything and bootstrap again"""
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM artifacts')
+            self._db.execute('DELETE FROM candidates')
+        return self.bootstrap()
+
+
+def get_offer_store():
+    """Process-wide offer store"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = OfferStore()
+        return _store
+
+
+def main():
+    store = get_offer_store()
+    if '--rebuild' in sys.argv[1:]:
+        letters, candidates = store.rebuild()
+        print(f"🔄 Rebuilt from {letters} letter files and {candidates} candidate files")
+    print("📋 Offers by status:")
+    for status in STATUS_RANK:
+        print(f"  {status:<10} {store.counts().get(status, 0)}")
+
+
+if __name__ == '__main__':
+    main()
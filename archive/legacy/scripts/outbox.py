@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Durable Email Outbox
+Records offer emails in a local SQLite database and delivers them from a
+background dispatcher with exponential-backoff retries. Each send intent has an
+idempotency key, so repeating a request never mails the same offer twice.
+Per-account pacing comes from the pooled mailer (see mailer.py).
+
+Settings (environment):
+  OFFER_OUTBOX_DB            database path (default output/outbox.db)
+  OFFER_OUTBOX_WORKERS       concurrent deliveries (default 4)
+  OFFER_OUTBOX_MAX_ATTEMPTS  attempts before an email is marked failed (default 6)
+"""
+
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import metrics
+from mailer import get_mailer
+from offer_store import EMAILED, get_offer_store
+from profile_registry import get_registry
+from send_email import build_offer_message, credentials_configured
+
+OUTBOX_DB = Path(os.getenv('OFFER_OUTBOX_DB', 'output/outbox.db'))
+OUTBOX_WORKERS = int(os.getenv('OFFER_OUTBOX_WORKERS', '4'))
+MAX_ATTEMPTS = int(os.getenv('OFFER_OUTBOX_MAX_ATTEMPTS', '6'))
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+POLL_INTERVAL = 1.0
+# Pause after a dispatcher error (e.g. a locked database) before polling again
+DISPATCH_RETRY_SECONDS = 5.0
+# An email still 'sending' after this long was abandoned by a crashed process
+SENDING_TIMEOUT_SECONDS = 300
+
+PENDING, SENDING, SENT, FAILED = 'pending', 'sending', 'sent', 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    profile TEXT NOT NULL,
+    candidate TEXT NOT NULL,
+    pdf_path TEXT NOT NULL,
+    recipient TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+"""
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def idempotency_key(profile_name, candidate, pdf_path, recipient):
+    """Default key: same profile, candidate, recipient and PDF content means the same email"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([profile_name, candidate.get('name'), recipient or candidate.get('email')]).encode())
+    with open(pdf_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def backoff_delay(attempts):
+    """Seconds to wait before retry number `attempts` (exponential with jitter)"""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class Outbox:
+    """SQLite-backed queue of offer emails plus its dispatcher"""
+
+    def __init__(self, db_path=OUTBOX_DB, workers=OUTBOX_WORKERS):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self._db = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(SCHEMA)
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._dispatcher = None
+
+    def enqueue(self, profile_name, candidate, pdf_path, recipient=None, key=None):
+        """Record a send intent; returns the row (existing one if the key was seen before)
+
+        A repeated intent for an email that already failed queues it again with
+        fresh attempts; one that is pending, sending or sent is left alone.
+        """
+        key = key or idempotency_key(profile_name, candidate, pdf_path, recipient)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR IGNORE INTO outbox (idempotency_key, profile, candidate, pdf_path, recipient,'
+                ' status, next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, profile_name, json.dumps(candidate), str(pdf_path), recipient, PENDING, now, now, now),
+            )
+            self._db.execute(
+                'UPDATE outbox SET status = ?, attempts = 0, next_attempt_at = ?, last_error = NULL,'
+                ' candidate = ?, pdf_path = ?, recipient = ?, updated_at = ? WHERE idempotency_key = ? AND status = ?',
+                (PENDING, now, json.dumps(candidate), str(pdf_path), recipient, now, key, FAILED),
+            )
+            row = self._db.execute('SELECT * FROM outbox WHERE idempotency_key = ?', (key,)).fetchone()
+        self._wakeup.set()
+        return self._to_dict(row)
+
+    def get(self, outbox_id):
+        with self._lock:
+            row = self._db.execute('SELECT * FROM outbox WHERE id = ?', (outbox_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status=None, limit=100):
+        query = 'SELECT * FROM outbox'
+        params = ()
+        if status:
+            query += ' WHERE status = ?'
+            params = (status,)
+        query += ' ORDER BY id DESC LIMIT ?'
+        with self._lock:
+            rows = self._db.execute(query, params + (limit,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def counts(self):
+        """Number of emails per delivery state"""
+        with self._lock:
+            rows = self._db.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status').fetchall()
+        return {status: count for status, count in rows}
+
+    @staticmethod
+    def _to_dict(row):
+        item = dict(row)
+        item['candidate'] = json.loads(item['candidate'])
+        return item
+
+    def _claim(self, limit):
+        """Atomically mark up to `limit` due emails as sending
+
+        Several server processes may share the database, so an email left
+        mid-send is only retried (at-least-once) once it has timed out, never
+        while another live process may still be sending it.
+        """
+        now = time.time()
+        with self._lock, self._db:
+            return self._db.execute(
+                'UPDATE outbox SET status = ?, attempts = attempts + 1, updated_at = ?'
+                ' WHERE id IN (SELECT id FROM outbox WHERE (status = ? AND next_attempt_at <= ?)'
+                ' OR (status = ? AND updated_at <= ?) ORDER BY next_attempt_at LIMIT ?) RETURNING *',
+                (SENDING, now, PENDING, now, SENDING, now - SENDING_TIMEOUT_SECONDS, limit),
+            ).fetchall()
+
+    def _finish(self, row, error=None):
+        now = time.time()
+        if error is None:
+            status, next_attempt = SENT, row['next_attempt_at']
+        elif row['attempts'] >= MAX_ATTEMPTS:
+            status, next_attempt = FAILED, row['next_attempt_at']
+        else:
+            status, next_attempt = PENDING, now + backoff_delay(row['attempts'])
+        with self._lock, self._db:
+            self._db.execute(
+                'UPDATE outbox SET status = ?, next_attempt_at = ?, last_error = ?, updated_at = ? WHERE id = ?',
+                (status, next_attempt, str(error) if error else None, now, row['id']),
+            )
+        return status
+
+    def _deliver(self, row):
+        try:
+            profile = get_registry().get(row['profile'])
+            if not credentials_configured(profile):
+                raise ValueError(f"Email credentials not configured for {profile['company_name']}")
+            message = build_offer_message(json.loads(row['candidate']), row['pdf_path'], profile,
+                                          row['recipient'])
+            get_mailer().send(profile, message)
+        except Exception as e:
+            status = self._finish(row, e)
+            print(f"❌ Outbox #{row['id']} attempt {row['attempts']} failed ({status}): {e}")
+        else:
+            self._finish(row)
+            print(f"✅ Outbox #{row['id']} sent to {message['To']}")
+            try:
+                get_offer_store().advance(row['profile'], json.loads(row['candidate'])['name'], EMAILED)
+            except Exception as e:
+                print(f"⚠️  Could not update offer store: {e}")
+
+    def start(self):
+        """Start the background dispatcher (idempotent)"""
+        if self._dispatcher:
+            return self
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True, name='outbox-dispatcher')
+        self._dispatcher.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def _dispatch(self):
+        in_flight = threading.Semaphore(self.workers)
+
+        def delivered(_):
+            in_flight.release()
+            self._wakeup.set()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='outbox') as executor:
+            while not self._stop.is_set():
+                free = 0
+                while in_flight.acquire(blocking=False):
+                    free += 1
+                try:
+                    rows = self._claim(free) if free else []
+                    for _ in range(free - len(rows)):
+                        in_flight.release()
+                    free = 0
+                    for row in rows:
+                        future = executor.submit(self._deliver, row)
+                        future.add_done_callback(delivered)
+                except Exception as e:
+                    # e.g. "database is locked" while another server process writes; a dead
+                    # dispatcher would leave every email pending, so log, back off and go on
+                    for _ in range(free):
+                        in_flight.release()
+                    print(f"⚠️  Outbox dispatcher error: {e}")
+                    self._stop.wait(DISPATCH_RETRY_SECONDS)
+                    continue
+                if not rows:
+                    self._wakeup.wait(POLL_INTERVAL)
+                    self._wakeup.clear()
+
+def get_outbox():
+    """Process-wide outbox with its dispatcher running"""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox().start()
+            metrics.gauge('offer_outbox_emails', 'Outbox emails per delivery status', ('status',),
+                          read=_outbox.counts)
+        return _outbox
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Persistent LibreOffice Conversion Pool
+Keeps long-lived headless soffice workers, each with its own isolated user
+installation, so DOCX -> PDF conversions skip the cold start and can run in parallel.
+
+Workers talk to their listening soffice over the UNO bridge when the `uno`
+module is available (LibreOffice's python3-uno). Otherwise each worker runs a
+unoserver (which hosts soffice under LibreOffice's own Python) and converts
+through the out-of-process `unoconvert` client. If neither is installed,
+pooling is disabled: every job starts soffice cold via `--convert-to`, still on
+the worker's own profile so concurrent jobs never collide.
+
+Settings (environment):
+  OFFER_PDF_POOL_SIZE   number of workers (default 2)
+  OFFER_PDF_TIMEOUT     per-job timeout in seconds (default 60)
+  SOFFICE_BIN           soffice executable (default soffice)
+  UNOSERVER_BIN         unoserver executable (default unoserver)
+  UNOCONVERT_BIN        unoconvert executable (default unoconvert)
+"""
+
+import atexit
+import os
+import queue
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+import metrics
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:
+    uno = None
+
+SOFFICE_BIN = os.getenv('SOFFICE_BIN', 'soffice')
+UNOSERVER_BIN = os.getenv('UNOSERVER_BIN', 'unoserver')
+UNOCONVERT_BIN = os.getenv('UNOCONVERT_BIN', 'unoconvert')
+POOL_SIZE = int(os.getenv('OFFER_PDF_POOL_SIZE', '2'))
+JOB_TIMEOUT = float(os.getenv('OFFER_PDF_TIMEOUT', '60'))
+STARTUP_TIMEOUT = 30
+HEALTH_CHECK_INTERVAL = 10
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ConversionError(Exception):
+    """Raised when a document could not be converted to PDF"""
+
+
+def _backend():
+    """How workers reach soffice: 'uno' bridge, 'unoserver' client, or 'cold' starts"""
+    if uno is not None:
+        return 'uno'
+    if shutil.which(UNOSERVER_BIN) and shutil.which(UNOCONVERT_BIN):
+        return 'unoserver'
+    return 'cold'
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _uno_property(name, value):
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+class _Worker:
+    """One soffice process with an isolated user installation"""
+
+    def __init__(self, index, root, backend):
+        self.index = index
+        self.backend = backend
+        self.profile_dir = root / f'worker_{index}'
+        self.pipe_name = f'offer_pdf_{os.getpid()}_{index}'
+        self.port = None
+        self.process = None
+        self.client = None
+        self.desktop = None
+        self.busy_since = None
+        self.timed_out = False
+
+    def _base_args(self):
+        return [
+            SOFFICE_BIN, '--headless', '--invisible', '--nologo', '--norestore',
+            '--nodefault', '--nolockcheck',
+            f'-env:UserInstallation={self.profile_dir.resolve().as_uri()}',
+        ]
+
+    def start(self):
+        """Launch soffice and wait until it accepts work"""
+        self.stop()
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+
+        if self.backend == 'cold':
+            # No listener: initialise the isolated profile once so later cold starts skip first-run setup
+            subprocess.run(self._base_args() + ['--terminate_after_init'],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                           timeout=STARTUP_TIMEOUT)
+            return
+
+        if self.backend == 'unoserver':
+            self.port = _free_port()
+            # Own session (as for its clients), so a kill takes the soffice it spawned down with it
+            self.process = subprocess.Popen(
+                [UNOSERVER_BIN, '--interface', '127.0.0.1', '--port', str(self.port),
+                 '--uno-port', str(_free_port()), '--executable', shutil.which(SOFFICE_BIN),
+                 '--user-installation', self.profile_dir.resolve().as_uri()],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+            )
+            deadline = time.monotonic() + STARTUP_TIMEOUT
+            while not self._listening():
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise ConversionError(f'unoserver worker {self.index} failed to start')
+                time.sleep(0.2)
+            return
+
+        self.process = subprocess.Popen(
+            self._base_args() + [f'--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext('com.sun.star.bridge.UnoUrlResolver', local)
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            try:
+                ctx = resolver.resolve(f'uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext')
+                break
+            except Exception:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise ConversionError(f'soffice worker {self.index} failed to start')
+                time.sleep(0.2)
+        self.desktop = ctx.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', ctx)
+
+    def _listening(self):
+        try:
+            socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+            return True
+        except OSError:
+            return False
+
+    def kill(self):
+        """Kill the running soffice (and a unoserver's conversion client) without waiting"""
+        for process in (self.client, self.process):
+            if process and process.poll() is None:
+                if self.backend == 'unoserver':
+                    os.killpg(process.pid, signal.SIGKILL)
+                else:
+                    process.kill()
+
+    def stop(self):
+        """Terminate the soffice process (if any)"""
+        self.kill()
+        process, self.process, self.desktop = self.process, None, None
+        if process:
+            process.wait()
+
+    def healthy(self):
+        """True if the worker can accept a job right now"""
+        if self.backend == 'cold':
+            return self.profile_dir.exists()
+        if self.process is None or self.process.poll() is not None:
+            return False
+        if self.backend == 'unoserver':
+            return self._listening()
+        try:
+            self.desktop.getFrames()
+            return True
+        except Exception:
+            return False
+
+    def _run(self, args):
+        """Run a converter process the watchdog can kill; raises ConversionError on failure"""
+        process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                   start_new_session=self.backend == 'unoserver')
+        if self.backend == 'cold':
+            self.process = process
+        else:
+            self.client = process
+        _, stderr = process.communicate()
+        self.client = None
+        if self.backend == 'cold':
+            self.process = None
+        if process.returncode != 0 and not self.timed_out:
+            detail = stderr.decode(errors='replace').strip().splitlines()
+            raise ConversionError(f'{Path(args[0]).name} exited with status {process.returncode}'
+                                  + (f': {detail[-1]}' if detail else ''))
+
+    def convert(self, docx_path, pdf_path):
+        """Convert one document, writing pdf_path atomically"""
+        docx_path = Path(docx_path).resolve()
+        pdf_path = Path(pdf_path).resolve()
+        pdf_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with tempfile.TemporaryDirectory(dir=pdf_path.parent, prefix='.convert_') as tmp_dir:
+            tmp_pdf = Path(tmp_dir) / f'{docx_path.stem}.pdf'
+            if self.backend == 'cold':
+                self._run(self._base_args() + ['--convert-to', 'pdf', '--outdir', tmp_dir, str(docx_path)])
+            elif self.backend == 'unoserver':
+                self._run([UNOCONVERT_BIN, '--host', '127.0.0.1', '--port', str(self.port),
+                           '--convert-to', 'pdf', str(docx_path), str(tmp_pdf)])
+            else:
+                document = self.desktop.loadComponentFromURL(
+                    uno.systemPathToFileUrl(str(docx_path)), '_blank', 0,
+                    (_uno_property('Hidden', True), _uno_property('ReadOnly', True)),
+                )
+                try:
+                    document.storeToURL(uno.systemPathToFileUrl(str(tmp_pdf)),
+                                        (_uno_property('FilterName', 'writer_pdf_Export'),))
+                finally:
+                    document.close(True)
+
+            if not tmp_pdf.exists():
+                raise ConversionError(f'No PDF produced for {docx_path.name}')
+            os.replace(tmp_pdf, pdf_path)
+        return pdf_path
+
+
+class ConverterPool:
+    """A fixed-size pool of soffice workers fed from a shared job queue"""
+
+    def __init__(self, size=POOL_SIZE, job_timeout=JOB_TIMEOUT):
+        if shutil.which(SOFFICE_BIN) is None:
+            raise ConversionError(f'LibreOffice not found ({SOFFICE_BIN} is not in PATH)')
+
+        self.size = max(1, size)
+        self.job_timeout = job_timeout
+        self.backend = _backend()
+        if self.backend == 'cold':
+            print("⚠️  PDF pooling disabled: neither the uno module nor unoserver/unoconvert is available, "
+                  "so every conversion starts soffice cold")
+        self.root = Path(tempfile.mkdtemp(prefix='offer_pdf_pool_'))
+        self.jobs = queue.Queue()
+        self.workers = [_Worker(i, self.root, self.backend) for i in range(self.size)]
+        self.restarts = 0
+        self._stopped = threading.Event()
+
+        self._threads = [
+            threading.Thread(target=self._run_worker, args=(worker,), daemon=True,
+                             name=f'pdf-worker-{worker.index}')
+            for worker in self.workers
+        ]
+        self._threads.append(threading.Thread(target=self._watchdog, daemon=True, name='pdf-watchdog'))
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, docx_path, pdf_path):
+        """Queue a conversion and return a Future resolving to the PDF path"""
+        future = Future()
+        self.jobs.put((Path(docx_path), Path(pdf_path), future))
+        return future
+
+    def convert(self, docx_path, pdf_path):
+        """Convert and wait for the result"""
+        return self.submit(docx_path, pdf_path).result()
+
+    def queue_depth(self):
+        return self.jobs.qsize()
+
+    def in_flight(self):
+        return sum(1 for worker in self.workers if worker.busy_since is not None)
+
+    def _restart(self, worker):
+        self.restarts += 1
+        worker.start()
+
+    def _run_worker(self, worker):
+        try:
+            worker.start()
+        except Exception as e:
+            print(f"⚠️  PDF worker {worker.index} failed to start: {e}")
+
+        while not self._stopped.is_set():
+            try:
+                job = self.jobs.get(timeout=HEALTH_CHECK_INTERVAL)
+            except queue.Empty:
+                # Idle health check; the watchdog kills it if soffice hangs
+                worker.timed_out = False
+                worker.busy_since = time.monotonic()
+                ok = worker.healthy()
+                worker.busy_since = None
+                if not ok and not self._stopped.is_set():
+                    self._safe_restart(worker)
+                continue
+
+            if job is None:
+                break
+
+            docx_path, pdf_path, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            if not worker.healthy() and not self._safe_restart(worker):
+                future.set_exception(ConversionError(f'PDF worker {worker.index} is unavailable'))
+                continue
+
+            worker.timed_out = False
+            worker.busy_since = time.monotonic()
+            try:
+                with metrics.span('pdf_convert'):
+                    pdf = worker.convert(docx_path, pdf_path)
+                future.set_result(pdf)
+            except Exception as e:
+                if worker.timed_out:
+                    e = ConversionError(f'Conversion of {docx_path.name} timed out after {self.job_timeout:.0f}s')
+                future.set_exception(e if isinstance(e, ConversionError) else ConversionError(str(e)))
+                self._safe_restart(worker)
+            finally:
+                worker.busy_since = None
+
+        worker.stop()
+
+    def _safe_restart(self, worker):
+        try:
+            self._restart(worker)
+            return True
+        except Exception as e:
+            print(f"⚠️  PDF worker {worker.index} restart failed: {e}")
+            return False
+
+    def _watchdog(self):
+        """Kill workers whose current job (or health check) exceeds the timeout"""
+        while not self._stopped.wait(1):
+            now = time.monotonic()
+            for worker in self.workers:
+                started = worker.busy_since
+                if started is not None and now - started > self.job_timeout and not worker.timed_out:
+                    worker.timed_out = True
+                    worker.kill()
+
+    def shutdown(self):
+        """Stop all workers and remove their profiles"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        for _ in self.workers:
+            self.jobs.put(None)
+        for worker in self.workers:
+            worker.stop()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def get_pool():
+    """Process-wide converter pool, started on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConverterPool()
+            atexit.register(_pool.shutdown)
+            metrics.gauge('offer_pdf_conversions_in_flight', 'PDF conversions running now',
+                          read=_pool.in_flight)
+            metrics.gauge('offer_pdf_queue_depth', 'PDF conversions waiting for a worker',
+                          read=_pool.queue_depth)
+            metrics.counter('offer_pdf_worker_restarts_total', 'soffice workers restarted',
+                            read=lambda: _pool.restarts)
+            metrics.gauge('offer_pdf_pool_persistent', '1 if workers keep soffice running between jobs',
+                          read=lambda: int(_pool.backend != 'cold'))
+        return _pool
+
+
+def convert_to_pdf(docx_path, pdf_path):
+    """Convert a DOCX to PDF on the shared pool (raises ConversionError)"""
+    return get_pool().convert(docx_path, pdf_path)
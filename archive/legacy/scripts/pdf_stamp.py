@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Signature Stamping on Rendered PDFs
+Finds the "Signature:" line of a rendered offer letter once (right after the
+first PDF render) and records it next to the PDF. Signing then overlays the
+candidate's signature image and date onto the existing PDF at that anchor,
+so no DOCX edit or LibreOffice conversion is needed. The image starts after
+the label's measured width; a letter without a label is signed below its
+last line of text, or not at all if there is no room (StampError).
+"""
+
+import json
+import os
+import re
+import threading
+import zlib
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+
+from metrics import timed
+
+SIGNATURE_LABEL_RE = re.compile(r'(Candidate\s+)?Signature\s*:', re.I)
+SIGNATURE_WIDTH = 144      # points (2 inches)
+SIGNATURE_MAX_HEIGHT = 48  # points
+DATE_FONT_SIZE = 10
+LABEL_GAP = 6              # points between the label and the signature
+BOTTOM_MARGIN = 36         # lowest baseline for a date placed below the text
+
+
+class StampError(ValueError):
+    """Raised when a letter has no place to put the signature"""
+
+
+def anchor_path(pdf_path):
+    """Sidecar file holding the signature anchor of a PDF"""
+    pdf_path = Path(pdf_path)
+    return pdf_path.with_name(f'{pdf_path.stem}.anchor.json')
+
+
+def _load_font(font_dict):
+    """pypdf's model of a font resource (widths, ToUnicode map), or None if unavailable
+
+    pypdf only has it as a private class (pypdf.generic._font in 6.x), so any
+    other pypdf falls back to the font's own /Widths array.
+    """
+    try:
+        from pypdf.generic._font import Font
+    except ImportError:
+        return None
+    try:
+        return Font.from_font_resource(font_dict)
+    except Exception:
+        return None
+
+
+def _text_width(font_dict, text, font_size):
+    """Width in points of text set in a PDF font, from the font's own width table"""
+    font = _load_font(font_dict)
+    if font is not None:
+        # Width tables are keyed by character code; map the extracted text back through ToUnicode
+        codes = {unicode: code for code, unicode in font.character_map.items()
+                 if isinstance(code, str) and isinstance(unicode, str)}
+        return font.get_text_width(''.join(codes.get(char, char) for char in text)) * font_size / 1000
+
+    # Simple fonts list their glyph widths from /FirstChar on; assume a single-byte WinAnsi-like encoding
+    widths = font_dict.get('/Widths')
+    if widths is not None and '/FirstChar' in font_dict:
+        widths = [float(width) for width in widths.get_object()]
+        first = int(font_dict['/FirstChar'])
+        descriptor = font_dict.get('/FontDescriptor')
+        default = float((descriptor.get_object() if descriptor else {}).get('/MissingWidth', 500))
+        total = 0.0
+        for code in text.encode('cp1252', errors='replace'):
+            total += widths[code - first] if 0 <= code - first < len(widths) else default
+        return total * font_size / 1000
+    return len(text) * font_size * 0.5
+
+
+def find_signature_anchor(pdf_path):
+    """Locate the last "Signature:" label; returns {page, x, y, font_size, label_width} or None
+
+    Without a label the signature goes below the last line of text on the last
+    page, provided the signature and date fit above the bottom margin.
+    """
+    reader = PdfReader(str(pdf_path))
+    found = None
+    lowest = None
+    for page_index, page in enumerate(reader.pages):
+        hits = []
+        lines = []
+
+        def visit(text, cm, tm, font_dict, font_size):
+            if not text or not text.strip():
+                return
+            x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+            y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+            scale = (tm[0] ** 2 + tm[1] ** 2) ** 0.5 * (cm[0] ** 2 + cm[1] ** 2) ** 0.5 or 1
+            size = (font_size or 11) * scale
+            lines.append((y, x, size))
+            match = SIGNATURE_LABEL_RE.search(text)
+            if match:
+                # The chunk starts at x, so measure everything up to the end of the label
+                width = _text_width(font_dict, text[:match.end()], size) if font_dict else match.end() * size * 0.5
+                hits.append({'x': round(x, 2), 'y': round(y, 2), 'font_size': round(size, 2),
+                             'label_width': round(width, 2)})
+
+        page.extract_text(visitor_text=visit)
+        if hits:
+            found = dict(hits[-1], page=page_index)
+        if page_index == len(reader.pages) - 1 and lines:
+            lowest = min(lines)
+    if found or lowest is None:
+        return found
+
+    y, _, size = lowest
+    left = min(x for _, x, _ in lines)
+    anchor_y = y - size - SIGNATURE_MAX_HEIGHT
+    if anchor_y - 2 * size < BOTTOM_MARGIN:
+        return None
+    return {'x': round(left, 2), 'y': round(anchor_y, 2), 'font_size': round(size, 2), 'label_width': 0.0,
+            'page': len(reader.pages) - 1}
+
+
+@timed('anchor_record')
+def record_signature_anchor(pdf_path):
+    """Find the anchor of a freshly rendered PDF and store it beside the PDF"""
+    anchor = find_signature_anchor(pdf_path)
+    target = anchor_path(pdf_path)
+    tmp = target.with_name(f'.{target.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    tmp.write_text(json.dumps({'anchor': anchor}))
+    os.replace(tmp, target)
+    return anchor
+
+
+def load_signature_anchor(pdf_path):
+    """Recorded anchor of a PDF (detected now if it was never recorded); raises StampError if there is none"""
+    try:
+        anchor = json.loads(anchor_path(pdf_path).read_text())['anchor']
+        if anchor is not None and 'label_width' not in anchor:
+            # Recorded before labels were measured
+            raise KeyError('label_width')
+    except (FileNotFoundError, ValueError, KeyError):
+        anchor = record_signature_anchor(pdf_path)
+    if anchor is None:
+        raise StampError(f'{Path(pdf_path).name} has no signature line and no room below its text')
+    return anchor
+
+
+def _pdf_string(text):
+    data = text.encode('cp1252', errors='replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _image_objects(image):
+    """Image XObject plus its soft mask (None for 1-bit images, painted as a stencil mask)"""
+    width, height = image.size
+    if image.mode == '1':
+        # Black samples (0) are painted in the fill colour, white ones stay transparent
+        mask = (f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+                f'/ImageMask true /BitsPerComponent 1 /Filter /FlateDecode',
+                zlib.compress(image.tobytes()))
+        return mask, None
+    image = image.convert('RGBA')
+    gray = image.convert('L')
+    alpha = image.getchannel('A')
+    smask = (f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+             f'/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode',
+             zlib.compress(alpha.tobytes()))
+    picture = (f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+               f'/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /SMask 7 0 R',
+               zlib.compress(gray.tobytes()))
+    return picture, smask
+
+
+def _overlay_pdf(page_width, page_height, image, image_box, date_text, date_origin):
+    """A one-page PDF holding only the signature image and date, built directly"""
+    x, y, w, h = image_box
+    content = (f'q {w:.2f} 0 0 {h:.2f} {x:.2f} {y:.2f} cm /Sig Do Q\n'.encode()
+               + f'BT /F1 {DATE_FONT_SIZE} Tf {date_origin[0]:.2f} {date_origin[1]:.2f} Td '.encode()
+               + _pdf_string(date_text) + b' Tj ET\n')
+    picture, smask = _image_objects(image)
+
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        (f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.2f} {page_height:.2f}] '
+         f'/Resources << /XObject << /Sig 5 0 R >> /Font << /F1 6 0 R >> >> /Contents 4 0 R >>').encode(),
+        ('<<', content),
+        picture,
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+    ]
+    if smask:
+        objects.append(smask)
+
+    out = BytesIO()
+    out.write(b'%PDF-1.4\n')
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f'{number} 0 obj\n'.encode())
+        if isinstance(obj, tuple):
+            header, data = obj
+            out.write(f'{header} /Length {len(data)} >>\nstream\n'.encode())
+            out.write(data + b'\nendstream')
+        else:
+            out.write(obj)
+        out.write(b'\nendobj\n')
+    xref = out.tell()
+    out.write(f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode())
+    for offset in offsets:
+        out.write(f'{offset:010d} 00000 n \n'.encode())
+    out.write(f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode())
+    out.seek(0)
+    return out
+
+
+@timed('signed_render')
+def stamp_signature(pdf_path, signature_image, date_text, output_path, anchor=None):
+    """Overlay a signature image and date onto pdf_path at its anchor; writes output_path"""
+    anchor = anchor or load_signature_anchor(pdf_path)
+    image = signature_image if isinstance(signature_image, Image.Image) else Image.open(signature_image)
+
+    reader = PdfReader(str(pdf_path))
+    writer = PdfWriter(clone_from=reader)
+    page = writer.pages[anchor['page']]
+    box = page.mediabox
+
+    # Signature sits on the line right after the label (shrunk to fit the margin), date on the line below
+    left = anchor['x'] + anchor['label_width'] + (LABEL_GAP if anchor['label_width'] else 0)
+    room = float(box.right) - 36 - left
+    if room <= 0:
+        raise StampError(f'No room for the signature after the label in {Path(pdf_path).name}')
+    w = min(SIGNATURE_WIDTH, room)
+    h = min(SIGNATURE_MAX_HEIGHT, w * image.height / image.width)
+    w = h * image.width / image.height
+    image_box = (left, anchor['y'] - 4, w, h)
+    date_origin = (anchor['x'], anchor['y'] - 2 * anchor['font_size'])
+
+    overlay = PdfReader(_overlay_pdf(float(box.width), float(box.height), image, image_box,
+                                     f'Date: {date_text}', date_origin))
+    page.merge_page(overlay.pages[0])
+
+    output_path = Path(output_path)
+    tmp = output_path.with_name(f'.{output_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(tmp, 'wb') as f:
+        writer.write(f)
+    os.replace(tmp, output_path)
+    return output_path
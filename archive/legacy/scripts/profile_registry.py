@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Company Profile Registry
+Loads and validates every profiles/<name>/config.json once, pre-compiles each
+profile's template, and hands out read-only Profile objects. A background
+watcher reloads a profile atomically when its config or template changes.
+
+A profile may set "template_spec" to a letter spec (see native_render.py):
+its PDFs are then drawn natively instead of converted by LibreOffice, and
+"template_docx" becomes optional (the DOCX template is generated from the spec).
+"""
+
+import json
+import os
+import sys
+import threading
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import MappingProxyType
+
+from metrics import span
+
+PROFILES_DIR = Path(os.getenv('OFFER_PROFILES_DIR', 'profiles'))
+WATCH_INTERVAL = float(os.getenv('OFFER_PROFILES_WATCH_INTERVAL', '2'))
+
+REQUIRED_KEYS = {
+    'company_name': str,
+    'email': str,
+    'app_password': str,
+    'email_signature': str,
+    'template_docx': str,
+    'offer_validity_days': int,
+    'probation_months': int,
+}
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+class ProfileError(Exception):
+    """Raised for unknown or invalid profiles"""
+
+
+@dataclass(frozen=True)
+class Profile(Mapping):
+    """Immutable company profile; behaves like the config dict it was loaded from"""
+
+    name: str
+    config: Mapping
+    template_path: Path
+    template: object = field(repr=False, compare=False)
+    version: tuple = field(repr=False)
+    spec: object = field(default=None, repr=False, compare=False)
+
+    def __getitem__(self, key):
+        return self.config[key]
+
+    def __iter__(self):
+        return iter(self.config)
+
+    def __len__(self):
+        return len(self.config)
+
+    def __reduce__(self):
+        # Compiled templates hold lxml trees; other processes get the plain config
+        return dict, (dict(self.config),)
+
+
+def _file_version(path):
+    try:
+        stat = path.stat()
+        return (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        return None
+
+
+def _profile_version(config_path, template_path, spec):
+    return (_file_version(config_path), _file_version(template_path),
+            _file_version(spec.path) if spec else None)
+
+
+def _resolve_template(profile_dir, template_docx):
+    """Template paths are relative to the working directory, then the profile directory"""
+    path = Path(template_docx)
+    if not path.is_absolute() and not path.exists() and (profile_dir / path).exists():
+        path = profile_dir / path
+    return path.resolve()
+
+
+def load_profile_dir(profile_dir):
+    """Load, validate and compile one profile directory"""
+    # Imported here so tools that never load a profile skip python-docx and PIL
+    from native_render import SpecError, load_spec
+    from template_engine import load_template
+
+    profile_dir = Path(profile_dir)
+    config_path = profile_dir / 'config.json'
+    try:
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        raise ProfileError(f"Profile '{profile_dir.name}' has no config.json")
+    except json.JSONDecodeError as e:
+        raise ProfileError(f"Profile '{profile_dir.name}': invalid config.json ({e})")
+
+    for key, expected in REQUIRED_KEYS.items():
+        if key == 'template_docx' and key not in config and 'template_spec' in config:
+            continue
+        if key not in config:
+            raise ProfileError(f"Profile '{profile_dir.name}': missing '{key}'")
+        if not isinstance(config[key], expected):
+            raise ProfileError(f"Profile '{profile_dir.name}': '{key}' must be {expected.__name__}")
+
+    spec = None
+    if 'template_spec' in config:
+        try:
+            spec = load_spec(_resolve_template(profile_dir, config['template_spec']))
+        except SpecError as e:
+            raise ProfileError(f"Profile '{profile_dir.name}': {e}")
+        config['template_spec'] = str(spec.path)
+    if 'template_docx' in config:
+        template_path = _resolve_template(profile_dir, config['template_docx'])
+    else:
+        template_path = spec.template_docx()
+    if not template_path.exists():
+        raise ProfileError(f"Profile '{profile_dir.name}': template not found: {template_path}")
+    try:
+        template = load_template(template_path)
+    except Exception as e:
+        raise ProfileError(f"Profile '{profile_dir.name}': cannot compile {template_path} ({e})")
+
+    config = dict(config, template_docx=str(template_path))
+    return Profile(
+        name=profile_dir.name,
+        config=MappingProxyType(config),
+        template_path=template_path,
+        template=template,
+        version=_profile_version(config_path, template_path, spec),
+        spec=spec,
+    )
+
+
+class ProfileRegistry:
+    """All profiles under a directory, loaded up front and hot-reloaded on change"""
+
+    def __init__(self, root=PROFILES_DIR):
+        self.root = Path(root)
+        self._profiles = {}
+        self.errors = {}
+        self._watcher = None
+        self._stop = threading.Event()
+        self.reload()
+
+    def names(self):
+        return sorted(self._profiles)
+
+    def get(self, name):
+        """Return a profile by name (raises ProfileError)"""
+        try:
+            return self._profiles[name]
+        except KeyError:
+            # Report why a profile failed to load rather than just "not found"
+            raise ProfileError(self.errors.get(name, f"Profile '{name}' not found"))
+
+    def reload(self):
+        """Load new or changed profiles; invalid ones are reported and recorded in errors"""
+        current = self._profiles
+        profiles = {}
+        errors = {}
+        dirs = sorted(d for d in self.root.iterdir() if d.is_dir()) if self.root.is_dir() else []
+        for profile_dir in dirs:
+            existing = current.get(profile_dir.name)
+            if existing and existing.version == _profile_version(profile_dir / 'config.json',
+                                                                 existing.template_path, existing.spec):
+                profiles[profile_dir.name] = existing
+                continue
+            try:
+                with span('profile_load'):
+                    profiles[profile_dir.name] = load_profile_dir(profile_dir)
+                if existing:
+                    print(f"🔄 Reloaded profile: {profile_dir.name}")
+            except ProfileError as e:
+                if str(e) != self.errors.get(profile_dir.name):
+                    print(f"⚠️  {e}" + (" (keeping previous version)" if existing else ""))
+                errors[profile_dir.name] = str(e)
+                if existing:
+                    # Keep serving the last good version
+                    profiles[profile_dir.name] = existing
+        # Swap whole mappings at once so readers never see a partial reload
+        self._profiles = profiles
+        self.errors = errors
+
+    def start_watching(self, interval=WATCH_INTERVAL):
+        """Poll config and template files in the background and reload on change"""
+        if self._watcher:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), daemon=True,
+                                         name='profile-watcher')
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"⚠️  Profile reload failed: {e}")
+
+
+def get_registry():
+    """Process-wide registry, loaded on first use"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ProfileRegistry()
+        return _registry
+
+
+def load_profile(profile_name):
+    """Load company profile configuration (CLI helper: exits on error)"""
+    try:
+        return get_registry().get(profile_name)
+    except ProfileError as e:
+        print(f"❌ {e}")
+        if _registry is not None:
+            print(f"Available profiles: {', '.join(_registry.names())}")
+        sys.exit(1)
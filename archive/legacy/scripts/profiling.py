@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+On-Demand Profiling
+Wraps one request (or one CLI run) in cProfile plus a wall-clock stack sampler
+and writes <id>.pstats and <id>.collapsed (flame-graph input, one
+"frame;frame;frame count" line per stack) to the profile directory. Only the
+newest OFFER_PROFILE_KEEP profiles are kept.
+
+A request is profiled when it carries an "X-Offer-Profile: <token>" header or
+a "_profile=<token>" query parameter matching OFFER_PROFILE_TOKEN, or when it
+is picked by OFFER_PROFILE_SAMPLE. Without a token clients cannot turn
+profiling on.
+
+    python3 -m pstats output/profiles/<id>.pstats
+    flamegraph.pl output/profiles/<id>.collapsed > <id>.svg
+
+Settings (environment):
+  OFFER_PROFILE_SAMPLE       fraction of requests profiled without asking (default 0)
+  OFFER_PROFILE_TOKEN        secret that enables client-requested profiling (default unset: off)
+  OFFER_PROFILE_DIR          output directory (default output/profiles)
+  OFFER_PROFILE_KEEP         profiles retained (default 50)
+  OFFER_PROFILE_INTERVAL_MS  stack sampling interval (default 5)
+"""
+
+import cProfile
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+PROFILE_SAMPLE = float(os.getenv('OFFER_PROFILE_SAMPLE', '0'))
+PROFILE_TOKEN = os.getenv('OFFER_PROFILE_TOKEN', '')
+PROFILE_DIR = Path(os.getenv('OFFER_PROFILE_DIR', 'output/profiles'))
+PROFILE_KEEP = int(os.getenv('OFFER_PROFILE_KEEP', '50'))
+SAMPLE_INTERVAL = int(os.getenv('OFFER_PROFILE_INTERVAL_MS', '5')) / 1000
+
+PROFILE_HEADER = 'X-Offer-Profile'
+PROFILE_PARAM = '_profile'
+REQUEST_ID_HEADER = 'X-Request-ID'
+SAFE_ID_RE = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+_prune_lock = threading.Lock()
+
+
+def new_request_id(candidate=None):
+    """The caller's request ID if it is safe to use as a file name, else a fresh one"""
+    if candidate and SAFE_ID_RE.match(candidate) and not candidate.startswith('.'):
+        return candidate
+    return uuid.uuid4().hex
+
+
+def wanted(flag=None):
+    """Whether to profile a request given its header/query flag value"""
+    if flag:
+        # Profiling costs CPU and disk, so only holders of the configured token may ask for it
+        return bool(PROFILE_TOKEN) and hmac.compare_digest(flag.encode(), PROFILE_TOKEN.encode())
+    return PROFILE_SAMPLE > 0 and random.random() < PROFILE_SAMPLE
+
+
+def _frame_label(code):
+    return f'{Path(code.co_filename).stem}:{code.co_name}'
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer, counting collapsed stacks"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='profile-sampler')
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if labels:
+                self.stacks[';'.join(reversed(labels))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def _write_atomic(path, write):
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def prune(directory=PROFILE_DIR, keep=PROFILE_KEEP):
+    """Delete all but the newest `keep` profiles"""
+    with _prune_lock:
+        profiles = sorted(directory.glob('*.pstats'), key=lambda p: p.stat().st_mtime, reverse=True)
+        for old in profiles[keep:]:
+            for path in (old, old.with_suffix('.collapsed')):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+
+@contextmanager
+def profile(request_id, directory=PROFILE_DIR, keep=PROFILE_KEEP):
+    """Profile the calling thread for the duration of the block; yields the output stem"""
+    directory.mkdir(parents=True, exist_ok=True)
+    stem = directory / request_id
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already active (e.g. a concurrent request on 3.12+): sample only
+        profiler = None
+    sampler = StackSampler(threading.get_ident())
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        yield stem
+    finally:
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+        if profiler is not None:
+            profiler.disable()
+            _write_atomic(stem.with_suffix('.pstats'), profiler.dump_stats)
+        else:
+            # Keep the pair together so retention and lookups treat it as one profile
+            _write_atomic(stem.with_suffix('.pstats'), cProfile.Profile().dump_stats)
+        _write_atomic(stem.with_suffix('.collapsed'), lambda p: p.write_text(sampler.collapsed()))
+        print(f"⏱️  Profile {request_id}: {elapsed * 1000:.0f} ms -> {stem}.pstats")
+        prune(directory, keep)
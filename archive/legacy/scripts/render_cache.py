@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Content-addressed Render Cache
+Stores rendered DOCX/PDF pairs under a key derived from the template bytes,
+the resolved replacement map and the renderer version, so re-generating an
+identical letter is a file copy instead of a fill and a LibreOffice conversion.
+The cache directory is size-bounded with least-recently-used eviction.
+
+Settings (environment):
+  OFFER_RENDER_CACHE      set to 0 to disable
+  OFFER_RENDER_CACHE_DIR  cache directory (default output/.render_cache)
+  OFFER_RENDER_CACHE_MB   size bound in megabytes (default 512)
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import metrics
+
+CACHE_ENABLED = os.getenv('OFFER_RENDER_CACHE', '1') != '0'
+CACHE_DIR = Path(os.getenv('OFFER_RENDER_CACHE_DIR', 'output/.render_cache'))
+CACHE_MAX_BYTES = int(float(os.getenv('OFFER_RENDER_CACHE_MB', '512')) * 1024 * 1024)
+
+ARTIFACT_NAMES = {'docx': 'offer.docx', 'pdf': 'offer.pdf', 'anchor': 'anchor.json'}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def render_key(template_hash, replacements):
+    """Cache key for one letter"""
+    # Deferred: template_engine pulls in python-docx
+    from template_engine import RENDERER_VERSION
+    payload = json.dumps([RENDERER_VERSION, template_hash, sorted(replacements.items())],
+                         ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _atomic_copy(source, target):
+    target = Path(target)
+    tmp = target.with_name(f'.{target.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    shutil.copyfile(source, tmp)
+    os.replace(tmp, target)
+    return target
+
+
+class RenderCache:
+    """On-disk DOCX/PDF store with an in-memory LRU index"""
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # key -> total bytes, oldest use first
+        self._entries = OrderedDict()
+        self._size = 0
+        self._load_index()
+
+    def _entry_dir(self, key):
+        return self.root / key[:2] / key
+
+    def _load_index(self):
+        """Rebuild the LRU order from entry mtimes left by earlier processes"""
+        if not self.root.is_dir():
+            return
+        entries = []
+        for entry in self.root.glob('*/*'):
+            if entry.is_dir():
+                size = sum(f.stat().st_size for f in entry.iterdir() if f.is_file())
+                entries.append((entry.stat().st_mtime, entry.name, size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._size += size
+
+    def lookup(self, key, kind):
+        """Path of a cached artifact ('docx', 'pdf' or 'anchor'), or None on a miss"""
+        path = self._entry_dir(key) / ARTIFACT_NAMES[kind]
+        with self._lock:
+            if key in self._entries and path.exists():
+                self._entries.move_to_end(key)
+                os.utime(path.parent)
+                return path
+            return None
+
+    def record(self, hit):
+        """Count one letter as a hit (nothing rendered) or a miss; called once per render key"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def restore(self, key, kind, target):
+        """Copy a cached artifact to target; returns the target or None on a miss"""
+        path = self.lookup(key, kind)
+        if path is None:
+            return None
+        try:
+            return _atomic_copy(path, target)
+        except FileNotFoundError:
+            # Evicted by another process between lookup and copy
+            return None
+
+    def store(self, key, kind, source):
+        """Add an artifact to the cache and evict old entries past the size bound"""
+        entry_dir = self._entry_dir(key)
+        entry_dir.mkdir(parents=True, exist_ok=True)
+        target = entry_dir / ARTIFACT_NAMES[kind]
+        _atomic_copy(source, target)
+        size = target.stat().st_size
+
+        with self._lock:
+            previous = self._entries.pop(key, 0)
+            other = sum(f.stat().st_size for f in entry_dir.iterdir()
+                        if f.is_file() and f != target)
+            self._entries[key] = size + other
+            self._size += size + other - previous
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            self._size -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
+
+
+def get_render_cache():
+    """Process-wide render cache, or None when disabled"""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = RenderCache()
+            metrics.counter('offer_render_cache_hits_total', 'Letters served entirely from the render cache',
+                            read=lambda: _cache.hits)
+            metrics.counter('offer_render_cache_misses_total', 'Letters that had to be (partly) rendered',
+                            read=lambda: _cache.misses)
+            metrics.counter('offer_render_cache_evictions_total', 'Render cache entries evicted',
+                            read=lambda: _cache.evictions)
+            metrics.gauge('offer_render_cache_bytes', 'Render cache size on disk', read=lambda: _cache.stats()['bytes'])
+        return _cache
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Production Server Launcher
+Runs the signature service (asgi_server.py) under uvicorn. Each worker
+process has its own event loop, executors, job queue and LibreOffice pool;
+the offer store and the email outbox are shared through SQLite. Job progress
+(/api/jobs/...) lives in the process that took the job, so put several
+workers behind a proxy with sticky sessions, or keep one worker and raise
+OFFER_ASGI_IO_WORKERS.
+
+Under gunicorn, the equivalent is:
+  gunicorn asgi_server:app -k uvicorn.workers.UvicornWorker -w N -b 0.0.0.0:5001
+
+Usage: python3 run_server.py [--host 127.0.0.1] [--port 5001] [--workers N]
+
+Settings (environment):
+  OFFER_SERVER_HOST     bind address (default 127.0.0.1)
+  OFFER_SERVER_PORT     port (default 5001)
+  OFFER_SERVER_WORKERS  worker processes (default 1)
+"""
+
+import argparse
+import os
+import sys
+
+import uvicorn
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='offer.py serve', description='Run the signature server (ASGI)')
+    parser.add_argument('--host', default=os.getenv('OFFER_SERVER_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('OFFER_SERVER_PORT', '5001')))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('OFFER_SERVER_WORKERS', '1')))
+    args = parser.parse_args(argv)
+
+    print(f"🚀 Starting signature server on http://{args.host}:{args.port} "
+          f"({args.workers} worker{'s' if args.workers != 1 else ''})")
+    print("📝 Admin dashboard: /admin")
+    # An import string lets uvicorn import the app in each worker process
+    uvicorn.run('asgi_server:app', host=args.host, port=args.port, workers=max(1, args.workers),
+                lifespan='on', timeout_keep_alive=30)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
 """
 Profile-based Email Sender
-Sends offer letters using company-specific email credentials
+Sends offer letters using company-specific email credentials over pooled
+SMTP connections (see mailer.py)
 """
 
-import smtplib
 import json
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
@@ -12,39 +12,26 @@ from email.mime.text import MIMEText
 from email import encoders
 from pathlib import Path
 import sys
+from mailer import get_mailer
+from profile_registry import load_profile
 
-def load_profile(profile_name):
-    """Load company profile configuration"""
-    profile_path = Path('profiles') / profile_name / 'config.json'
-    
-    if not profile_path.exists():
-        print(f"❌ Profile '{profile_name}' not found!")
-        print(f"Available profiles: melange, urbanmistrii, decoarte")
-        sys.exit(1)
-    
-    with open(profile_path, 'r') as f:
-        return json.load(f)
+def credentials_configured(profile):
+    """True if the profile has a usable app password"""
+    if profile['app_password'] == "TO_BE_CONFIGURED":
+        print(f"❌ Email credentials not configured for {profile['company_name']}")
+        print(f"💡 Update the app_password in profiles/{profile['email'].split('@')[0]}/config.json")
+        return False
+    return True
 
-def send_offer_email(candidate_data_path, pdf_path, profile, recipient_override=None):
-    """Send offer letter PDF via email using profile credentials"""
-    
-    # Load candidate data
-    with open(candidate_data_path, 'r') as f:
-        data = json.load(f)
-    
+def build_offer_message(data, pdf_path, profile, recipient_override=None):
+    """Build the offer email with the PDF attached"""
     recipient_email = recipient_override if recipient_override else data.get('email')
     candidate_name = data.get('name')
     position = data.get('position')
     
     sender_email = profile['email']
-    sender_password = profile['app_password']
     company_name = profile['company_name']
     
-    if sender_password == "TO_BE_CONFIGURED":
-        print(f"❌ Email credentials not configured for {company_name}")
-        print(f"💡 Update the app_password in profiles/{profile['email'].split('@')[0]}/config.json")
-        return False
-    
     # Create email
     msg = MIMEMultipart()
     msg['From'] = sender_email
@@ -82,72 +69,120 @@ We are excited about the possibility of you joining {company_name} and contribut
         part.add_header('Content-Disposition', f'attachment; filename=Offer_Letter_{candidate_name.replace(" ", "_")}.pdf')
         msg.attach(part)
     
-    # Send email
+    return msg
+
+def send_offer_email(candidate, pdf_path, profile, recipient_override=None):
+    """Send offer letter PDF via email using profile credentials
+    
+    candidate is either the candidate data dict or the path of its JSON file.
+    """
+    
+    # Load candidate data
+    if isinstance(candidate, dict):
+        data = candidate
+    else:
+        with open(candidate, 'r') as f:
+            data = json.load(f)
+    
+    if not credentials_configured(profile):
+        return False
+    
+    msg = build_offer_message(data, pdf_path, profile, recipient_override)
+    
+    # Send email over a pooled, already-authenticated connection
     try:
-        print(f"📧 Connecting to Gmail SMTP server...")
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        
-        print(f"🔐 Logging in as {sender_email}...")
-        server.login(sender_email, sender_password)
+        print(f"📤 Sending email to {msg['To']} as {profile['email']}...")
+        get_mailer().send(profile, msg)
         
-        print(f"📤 Sending email to {recipient_email}...")
-        server.send_message(msg)
-        server.quit()
-        
-        print(f"✅ Email sent successfully to {candidate_name} ({recipient_email})")
+        print(f"✅ Email sent successfully to {data.get('name')} ({msg['To']})")
         return True
         
     except Exception as e:
         print(f"❌ Email failed: {e}")
         return False
 
-def main():
-    if len(sys.argv) < 3:
-        print("Usage: python3 send_email.py <profile> <candidate.json> [--to recipient@email.com]")
+def send_offer_batch(profile, offers):
+    """Send many offers through the profile's connection pool
+    
+    offers: iterable of (candidate data dict, pdf path, recipient override or None)
+    Returns a list of (candidate name, error or None) in the same order.
+    """
+    offers = list(offers)
+    if not credentials_configured(profile):
+        return [(data.get('name'), 'credentials not configured') for data, _, _ in offers]
+    
+    messages = [build_offer_message(data, pdf_path, profile, recipient)
+                for data, pdf_path, recipient in offers]
+    results = get_mailer().send_batch(profile, messages)
+    return [(data.get('name'), error) for (data, _, _), (_, error) in zip(offers, results)]
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    wants_help = '-h' in argv or '--help' in argv
+    if len(argv) < 2 or wants_help:
+        print("Usage: python3 offer.py send <profile> <candidate.json>... [--to recipient@email.com]")
         print("\nProfiles:")
         print("  melange      - The Melange Studio")
         print("  urbanmistrii - Urban Mistrii")
         print("  decoarte     - Deco Arte")
         print("\nExample:")
-        print("  python3 send_email.py melange examples/sample_candidate.json --to reviewer@email.com")
-        sys.exit(1)
+        print("  python3 offer.py send melange examples/sample_candidate.json --to reviewer@email.com")
+        print("  python3 offer.py send melange data/*.json")
+        sys.exit(0 if wants_help else 1)
     
-    profile_name = sys.argv[1]
-    candidate_file = sys.argv[2]
+    profile_name = argv[0]
     
     recipient_override = None
-    if '--to' in sys.argv:
+    args = list(argv[1:])
+    if '--to' in args:
         try:
-            recipient_override = sys.argv[sys.argv.index('--to') + 1]
+            recipient_override = args[args.index('--to') + 1]
         except IndexError:
             print("❌ Error: --to requires an email address")
             sys.exit(1)
+        del args[args.index('--to'):args.index('--to') + 2]
+    candidate_files = args
     
     # Load profile
     print(f"📋 Loading profile: {profile_name}")
     profile = load_profile(profile_name)
-    
-    # Load candidate data
-    with open(candidate_file, 'r') as f:
-        data = json.load(f)
-    
-    # Find PDF
-    candidate_name = data['name'].replace(' ', '_')
-    pdf_path = Path('output') / profile_name / f'offer_letter_{candidate_name}.pdf'
-    
-    if not pdf_path.exists():
-        print(f"❌ PDF not found: {pdf_path}")
-        print("💡 Generate the offer letter first using:")
-        print(f"   python3 generate_offer.py {profile_name} {candidate_file}")
-        sys.exit(1)
-    
-    print(f"📄 Found PDF: {pdf_path}")
     print(f"🏢 Company: {profile['company_name']}")
     if recipient_override:
         print(f"🎯 Overriding recipient: {recipient_override}")
     
-    send_offer_email(candidate_file, pdf_path, profile, recipient_override)
+    offers = []
+    for candidate_file in candidate_files:
+        # Load candidate data
+        with open(candidate_file, 'r') as f:
+            data = json.load(f)
+        
+        # Find PDF
+        candidate_name = data['name'].replace(' ', '_')
+        pdf_path = Path('output') / profile_name / f'offer_letter_{candidate_name}.pdf'
+        
+        if not pdf_path.exists():
+            print(f"❌ PDF not found: {pdf_path}")
+            print("💡 Generate the offer letter first using:")
+            print(f"   python3 generate_offer.py {profile_name} {candidate_file}")
+            sys.exit(1)
+        
+        print(f"📄 Found PDF: {pdf_path}")
+        offers.append((data, pdf_path, recipient_override))
+    
+    if len(offers) == 1:
+        sent = send_offer_email(offers[0][0], offers[0][1], profile, recipient_override)
+        sys.exit(0 if sent else 1)
+    
+    print(f"📧 Sending {len(offers)} offers...")
+    failed = 0
+    for name, error in send_offer_batch(profile, offers):
+        if error:
+            failed += 1
+            print(f"❌ {name}: {error}")
+        else:
+            print(f"✅ {name}")
+    print(f"\n🎉 {len(offers) - failed}/{len(offers)} offers sent")
+    sys.exit(1 if failed else 0)
 
 if __name__ == "__main__":
     main()
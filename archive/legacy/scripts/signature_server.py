@@ -4,18 +4,24 @@ Web server for digital signature collection
 Serves the signature interface and handles signature submission
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
+import functools
 import json
-import base64
+import time
 from pathlib import Path
-from PIL import Image
-import io
-from docx import Document
-import google.generativeai as genai
-import subprocess
-from generate_offer import generate_offer_internal, load_profile as load_company_profile
-from send_email import send_offer_email
+from batch_parse import MAX_BATCH_BYTES, BatchInputError, split_blurbs, stream_batch
+from candidate_parser import get_parser
+import metrics
+import profiling
+from jobs import QueueFull, get_job_queue
+from profile_registry import ProfileError, get_registry
+from offer_export import ExportError, export_allowed, export_offers, parse_day
+from offer_store import VIEWED, get_offer_store
+from outbox import PENDING, SENDING, SENT, get_outbox
+from http_files import pdf_response
+from signature_store import MAX_REQUEST_BYTES, SignatureError, SignatureTooLarge, decode_data_url, read_limited
+from signing import sign_offer
 
 app = Flask(__name__, 
             static_folder='web',
@@ -24,21 +30,35 @@ CORS(app)
 
 OUTPUT_DIR = Path('output')
 WEB_DIR = Path('web')
-EXAMPLES_DIR = Path('examples')
 
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Initialize Gemini
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-1.5-flash')
-else:
+# Let a front-end proxy (nginx/Apache) stream PDFs via X-Sendfile
+app.config['USE_X_SENDFILE'] = os.getenv('OFFER_X_SENDFILE') == '1'
+
+# Gemini is configured on the first /api/ai-parse call that needs it (candidate_parser.py)
+if not os.getenv("GEMINI_API_KEY"):
     print("⚠️  Warning: GEMINI_API_KEY not found in environment variables.")
-    model = None
+
+def profile_flag():
+    """Opt-in profiling flag from the request header or query string"""
+    return request.headers.get(profiling.PROFILE_HEADER) or request.args.get(profiling.PROFILE_PARAM)
+
+def profiled(view):
+    """Profile the wrapped view when asked to (see profiling.py); the ID comes back in X-Request-ID"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not profiling.wanted(profile_flag()):
+            return view(*args, **kwargs)
+        request_id = profiling.new_request_id(request.headers.get(profiling.REQUEST_ID_HEADER))
+        with profiling.profile(request_id):
+            response = app.make_response(view(*args, **kwargs))
+        response.headers[profiling.REQUEST_ID_HEADER] = request_id
+        return response
+    return wrapper
 
 @app.route('/')
 def index():
@@ -48,145 +68,264 @@ def index():
 def admin():
     return send_file(WEB_DIR / 'admin.html')
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Stage timings, counters and gauges in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/profiles')
 def get_profiles():
     """List available company profiles"""
     try:
-        profiles_dir = Path('profiles')
-        profiles = [d.name for d in profiles_dir.iterdir() if d.is_dir()]
-        return jsonify({'success': True, 'profiles': profiles})
+        return jsonify({'success': True, 'profiles': get_registry().names()})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/generate-offer', methods=['POST'])
 def generate_offer():
-    """Generate offer letter from web form data"""
+    """Queue offer generation from web form data; returns a job ID immediately"""
     try:
         data = request.json
         profile_name = data.get('profile')
         candidate_data = data.get('candidate')
         
-        if not profile_name or not candidate_data:
+        if not profile_name or not candidate_data or not candidate_data.get('name'):
             return jsonify({'success': False, 'message': 'Missing profile or candidate data'}), 400
-            
-        result = generate_offer_internal(profile_name, candidate_data)
+        
+        try:
+            get_registry().get(profile_name)
+        except ProfileError as e:
+            return jsonify({'success': False, 'message': str(e)}), 404
+        
+        try:
+            # The work happens on a job worker, so that is what gets profiled (named by job ID)
+            job = get_job_queue().submit(profile_name, candidate_data,
+                                         profiled=profiling.wanted(profile_flag()))
+        except QueueFull as e:
+            return jsonify({'success': False, 'message': f"Server busy: {e}"}), 503
         
         return jsonify({
             'success': True,
-            'message': f"Offer generated for {candidate_data['name']}",
+            'message': f"Offer queued for {candidate_data['name']}",
+            'job_id': job.id,
+            'profile_id': job.id if job.profiled else None,
+            'status_url': f"/api/jobs/{job.id}",
+            'events_url': f"/api/jobs/{job.id}/events",
+            'docx_url': f"/api/jobs/{job.id}/docx",
             'pdf_url': f"/api/offer-pdf/{candidate_data['name'].replace(' ', '_')}?profile={profile_name}"
-        })
+        }), 202
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Current stage of a generation job"""
+    job = get_job_queue().get(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    return jsonify({'success': True, **job.to_dict()})
+
+@app.route('/api/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-sent events: one event per stage change until the job finishes"""
+    jobs = get_job_queue()
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    
+    def stream():
+        stage = None
+        while True:
+            if job.stage != stage:
+                stage = job.stage
+                yield f"event: {stage}\ndata: {json.dumps(job.to_dict())}\n\n"
+                if job.done:
+                    return
+            elif jobs.wait_for_change(job, stage, timeout=15) == stage:
+                yield ": keep-alive\n\n"
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/jobs/<job_id>/docx')
+def get_job_docx(job_id):
+    """Serve the filled DOCX as soon as it exists (before the PDF is ready)"""
+    job = get_job_queue().get(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    if job.docx is None:
+        return jsonify({'success': False, 'message': f'DOCX not ready (stage: {job.stage})'}), 409
+    return send_file(job.docx, as_attachment=True, download_name=job.docx.name)
+
 @app.route('/api/ai-parse', methods=['POST'])
 def ai_parse():
-    """Use Gemini to parse unstructured candidate info from a prompt"""
+    """Parse unstructured candidate info: local patterns first, Gemini for the rest"""
     try:
         data = request.json
         prompt = data.get('prompt')
         
         if not prompt:
             return jsonify({'success': False, 'message': 'No prompt provided'}), 400
-            
-        sys_instruction = """
-        Extract candidate information from the following text and return it in JSON format.
-        Fields to extract:
-        - name: Full name
-        - email: Email address
-        - phone: Phone number
-        - position: Job title/role
-        - start_date: Joining date (e.g. 5 January, 2026)
-        - salary: Monthly salary (numeric or range)
-        - test_date: Interview date
-        
-        If a field is not found, leave it as an empty string. Output ONLY the JSON.
-        """
         
-        response = model.generate_content(f"{sys_instruction}\n\nCandidate Text: {prompt}")
-        
-        # Clean the response to ensure it's valid JSON
-        text = response.text.strip()
-        if text.startswith('```json'):
-            text = text[7:]
-        if text.endswith('```'):
-            text = text[:-3]
-        text = text.strip()
-            
-        parsed_data = json.loads(text)
-        return jsonify({'success': True, 'data': parsed_data})
+        result = get_parser().parse(prompt)
+        if result['error']:
+            print(f"AI Error (using local fields only): {result['error']}")
+        return jsonify({'success': True, 'data': result['data'], 'sources': result['sources'],
+                        'warning': result['error']})
         
     except Exception as e:
         print(f"AI Error: {e}")
         return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/ai-parse/batch', methods=['POST'])
+def ai_parse_batch():
+    """Parse many candidate blurbs (TSV/CSV, JSON list, JSONL); streams one NDJSON line per item"""
+    if request.content_length and request.content_length > MAX_BATCH_BYTES:
+        return jsonify({'success': False, 'message': 'Batch too large'}), 413
+    try:
+        # Chunked bodies carry no Content-Length, so the limit is enforced while reading too
+        texts = split_blurbs(read_limited(request.stream, MAX_BATCH_BYTES), request.mimetype)
+    except SignatureTooLarge:
+        return jsonify({'success': False, 'message': 'Batch too large'}), 413
+    except BatchInputError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    def stream():
+        for item in stream_batch(texts):
+            yield json.dumps(item) + '\n'
+    
+    return Response(stream(), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def queue_offer_email(data, idempotency_key=None):
+    """Validate a send-email request and queue the letter; returns (body, status)"""
+    profile_name = data.get('profile')
+    candidate_name = data.get('candidate_name')
+    candidate_email = data.get('candidate_email') # Optional override
+    
+    if not profile_name or not candidate_name:
+        return {'success': False, 'message': 'Missing profile or candidate name'}, 400
+        
+    try:
+        get_registry().get(profile_name)
+    except ProfileError as e:
+        return {'success': False, 'message': str(e)}, 404
+    
+    # Letter and stored details come from the offer store; request details win
+    record = get_offer_store().get(profile_name, candidate_name)
+    pdf_path = record and record['artifacts'].get('pdf')
+    
+    if not pdf_path or not Path(pdf_path).exists():
+        return {'success': False, 'message': f"No PDF for {candidate_name}. Generate it first."}, 404
+    
+    candidate = data.get('candidate') or record['data']
+    if not candidate:
+        candidate = {
+            "name": record['name'],
+            "email": candidate_email or record['email'],
+            "position": "Selected Position" # Fallback
+        }
+    
+    entry = get_outbox().enqueue(profile_name, candidate, pdf_path, recipient=candidate_email,
+                                 key=idempotency_key)
+    
+    # A repeat of an email that already went out is not sent again
+    messages = {
+        PENDING: f"Email to {candidate_name} queued",
+        SENDING: f"Email to {candidate_name} is being sent",
+        SENT: f"Email to {candidate_name} was already sent",
+    }
+    return {
+        'success': True,
+        'message': messages.get(entry['status'], f"Email to {candidate_name} is {entry['status']}"),
+        'outbox_id': entry['id'],
+        'status': entry['status'],
+        'status_url': f"/api/outbox/{entry['id']}"
+    }, 200 if entry['status'] == SENT else 202
+
 @app.route('/api/send-email', methods=['POST'])
 def send_email():
-    """Send generated offer letter via email"""
+    """Queue the generated offer letter for email delivery"""
     try:
-        data = request.json
-        profile_name = data.get('profile')
-        candidate_name = data.get('candidate_name')
-        candidate_email = data.get('candidate_email') # Optional override
-        
-        if not profile_name or not candidate_name:
-            return jsonify({'success': False, 'message': 'Missing profile or candidate name'}), 400
-            
-        profile = load_company_profile(profile_name)
-        
-        # Load candidate data to get correct name format and email
-        name_clean = candidate_name.replace(' ', '_')
-        pdf_path = OUTPUT_DIR / profile_name / f'offer_letter_{name_clean}.pdf'
-        
-        if not pdf_path.exists():
-            return jsonify({'success': False, 'message': f"PDF not found at {pdf_path}. Generate it first."}), 404
-            
-        # We need the JSON file path for send_offer_email
-        # For web-generated offers, we might not have a JSON file yet, or we can create a temporary one
-        # Alternatively, refactor send_offer_email to take data directly
-        
-        # Let's check if the json exists in examples/
-        candidate_file = EXAMPLES_DIR / f"{name_clean.lower()}.json"
-        
-        # If it doesn't exist, we'll create a minimal one for the email script
-        if not candidate_file.exists():
-            candidate_file = Path(f"/tmp/{name_clean.lower()}.json")
-            with open(candidate_file, 'w') as f:
-                json.dump({
-                    "name": candidate_name,
-                    "email": candidate_email,
-                    "position": "Selected Position" # Fallback
-                }, f)
-
-        success = send_offer_email(str(candidate_file), pdf_path, profile, recipient_override=candidate_email)
-        
-        if success:
-            return jsonify({'success': True, 'message': f"Email sent to {candidate_name}"})
-        else:
-            return jsonify({'success': False, 'message': "Failed to send email. Check logs."}), 500
-            
+        body, status = queue_offer_email(request.json, request.headers.get('Idempotency-Key'))
+        return jsonify(body), status
     except Exception as e:
         import traceback
         print(traceback.format_exc())
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/outbox')
+def list_outbox():
+    """Recent emails, optionally filtered by ?status=pending|sending|sent|failed"""
+    outbox = get_outbox()
+    return jsonify({
+        'success': True,
+        'counts': outbox.counts(),
+        'emails': outbox.list(status=request.args.get('status'))
+    })
+
+@app.route('/api/outbox/<int:outbox_id>')
+def get_outbox_entry(outbox_id):
+    """Delivery state of one queued email"""
+    entry = get_outbox().get(outbox_id)
+    if not entry:
+        return jsonify({'success': False, 'message': 'Email not found'}), 404
+    return jsonify({'success': True, 'email': entry})
+
+@app.route('/api/candidates')
+def list_candidates():
+    """Indexed candidate listing: ?profile=&status=&q=<name/email prefix>&limit=&offset="""
+    store = get_offer_store()
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    candidates = store.list(profile=request.args.get('profile'), status=request.args.get('status'),
+                            query=request.args.get('q'), limit=limit,
+                            offset=request.args.get('offset', 0, type=int))
+    return jsonify({'success': True, 'counts': store.counts(), 'candidates': candidates})
+
+@app.route('/api/candidates/<profile_name>/<candidate_name>')
+def get_candidate(profile_name, candidate_name):
+    """One candidate with its lifecycle timestamps and files"""
+    candidate = get_offer_store().get(profile_name, candidate_name)
+    if candidate is None:
+        return jsonify({'success': False, 'message': 'Candidate not found'}), 404
+    return jsonify({'success': True, 'candidate': candidate})
+
+@app.route('/api/export')
+def export_letters():
+    """Stream a ZIP of generated letters
+
+    Query: profile, since/until (YYYY-MM-DD, generation date), signed_only=1,
+    include=docx,signed for the DOCX and signed copies. Requires the
+    OFFER_EXPORT_TOKEN secret in an X-Offer-Export-Token header (or ?token=)."""
+    token = request.headers.get('X-Offer-Export-Token') or request.args.get('token')
+    if not export_allowed(token):
+        return jsonify({'success': False, 'message': 'Export not permitted'}), 403
+    try:
+        include = set(filter(None, request.args.get('include', '').split(',')))
+        profile_name = request.args.get('profile') or None
+        chunks = export_offers(profile=profile_name,
+                               since=parse_day(request.args.get('since')),
+                               until=parse_day(request.args.get('until'), end=True),
+                               signed_only=request.args.get('signed_only') == '1',
+                               docx='docx' in include, signed='signed' in include)
+    except ExportError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    response = Response(stream_with_context(chunks), mimetype='application/zip', direct_passthrough=True)
+    response.headers.set('Content-Disposition', 'attachment',
+                         filename=f"offers_{profile_name or 'all'}_{time.strftime('%Y%m%d')}.zip")
+    return response
+
 @app.route('/api/offer-preview/<candidate_name>')
 def get_offer_preview(candidate_name):
     """Get offer letter preview data"""
     try:
         profile_name = request.args.get('profile', 'melange')
         
-        # Load candidate data
-        # We try to find the candidate data in examples/ or in profile-specific dirs if they exist
-        candidate_file = EXAMPLES_DIR / f'sample_candidate.json' # Default fallback
-        
-        # Optional: search for specific candidate json if needed
-        # For now, we'll keep using the sample or look for one matching name
-        potential_candidate_file = EXAMPLES_DIR / f'{candidate_name.lower()}.json'
-        if potential_candidate_file.exists():
-            candidate_file = potential_candidate_file
-            
-        with open(candidate_file, 'r') as f:
-            data = json.load(f)
+        candidate = get_offer_store().get(profile_name, candidate_name)
+        if candidate is None:
+            return jsonify({'success': False, 'message': f'Candidate {candidate_name} not found'}), 404
+        data = candidate['data'] or {'name': candidate['name']}
         
         return jsonify({
             'success': True,
@@ -203,96 +342,56 @@ def get_offer_preview(candidate_name):
 
 @app.route('/api/offer-pdf/<candidate_name>')
 def get_offer_pdf(candidate_name):
-    """Serve the unsigned PDF"""
+    """Serve the unsigned PDF
+
+    Only the signing page's request (view=candidate) counts as the candidate
+    viewing the offer; admin previews use the same route without it."""
     try:
         profile_name = request.args.get('profile', 'melange')
-        pdf_file = OUTPUT_DIR / profile_name / f'offer_letter_{candidate_name}.pdf'
+        store = get_offer_store()
+        pdf_file = store.artifact(profile_name, candidate_name, 'pdf')
         
-        if not pdf_file.exists():
-            # Try root output dir just in case
-            pdf_file = OUTPUT_DIR / f'offer_letter_{candidate_name}.pdf'
-            
-        if pdf_file.exists():
-            return send_file(pdf_file, mimetype='application/pdf')
-        else:
-            return jsonify({'success': False, 'message': f'PDF not found at {pdf_file}'}), 404
+        response = pdf_response([pdf_file] if pdf_file else [])
+        if response is None:
+            return jsonify({'success': False, 'message': f'PDF for {candidate_name} not found'}), 404
+        if response.status_code == 200 and request.args.get('view') == 'candidate':
+            store.advance(profile_name, candidate_name, VIEWED)
+        return response
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/submit-signature', methods=['POST'])
+@profiled
 def submit_signature():
-    """Handle signature submission and create signed PDF"""
+    """Handle signature submission and create signed PDF
+
+    Accepts a JSON body with a data URL, a multipart "signature" file, or a raw
+    image/* body (candidate, profile and date then come from the query string)."""
     try:
-        data = request.json
-        candidate_name = data.get('candidate', 'Mariya_Fatima')
-        profile_name = data.get('profile', 'melange')
-        signature_data = data.get('signature', '')
-        signature_date = data.get('date', '')
-        
-        # Decode base64 signature image
-        signature_base64 = signature_data.split(',')[1] if ',' in signature_data else signature_data
-        signature_bytes = base64.b64decode(signature_base64)
+        if request.content_length and request.content_length > MAX_REQUEST_BYTES:
+            return jsonify({'success': False, 'message': 'Signature upload too large'}), 413
         
-        # Save signature image to output dir
-        profile_output_dir = OUTPUT_DIR / profile_name
-        profile_output_dir.mkdir(exist_ok=True, parents=True)
-        
-        sig_image_path = profile_output_dir / f'signature_{candidate_name}.png'
-        with open(sig_image_path, 'wb') as f:
-            f.write(signature_bytes)
-        
-        # Path to the unsigned DOCX
-        docx_path = profile_output_dir / f'offer_letter_{candidate_name}.docx'
-        
-        if not docx_path.exists():
-            # Try checking the root output dir
-            docx_path = OUTPUT_DIR / f'offer_letter_{candidate_name}.docx'
-            
-        if not docx_path.exists():
-             return jsonify({'success': False, 'message': f'Source DOCX not found at {docx_path}'}), 404
-             
-        signed_docx_path = profile_output_dir / f'offer_letter_{candidate_name}_signed.docx'
-        
-        # Copy and add signature to DOCX
-        doc = Document(docx_path)
-        
-        # Find the signature placeholder or just add to the end
-        found_placeholder = False
-        for paragraph in doc.paragraphs:
-            if 'Signature:' in paragraph.text or 'Candidate Signature' in paragraph.text:
-                # Add some space
-                p = doc.add_paragraph()
-                # Add signature image
-                run = p.add_run()
-                run.add_picture(str(sig_image_path), width=Inches(2))
-                # Add date
-                doc.add_paragraph(f'Date: {signature_date}')
-                found_placeholder = True
-                break
-        
-        if not found_placeholder:
-            # If no placeholder, just add at the end
-            doc.add_paragraph('\nCandidate Signature:')
-            doc.add_picture(str(sig_image_path), width=Inches(2))
-            doc.add_paragraph(f'Date: {signature_date}')
-            
-        doc.save(signed_docx_path)
-        
-        # Convert to PDF
-        subprocess.run([
-            'soffice',
-            '--headless',
-            '--convert-to', 'pdf',
-            '--outdir', str(profile_output_dir),
-            str(signed_docx_path)
-        ], check=True)
+        if request.mimetype.startswith('image/'):
+            data = request.args
+            signature_bytes = read_limited(request.stream)
+        elif request.files:
+            data = request.form
+            upload = request.files.get('signature')
+            if upload is None:
+                raise SignatureError('No signature provided')
+            signature_bytes = read_limited(upload.stream)
+        else:
+            data = json.loads(read_limited(request.stream, MAX_REQUEST_BYTES) or b'{}')
+            signature_bytes = decode_data_url(data.get('signature', ''))
         
-        return jsonify({
-            'success': True,
-            'message': 'Signature submitted successfully',
-            'signed_pdf_url': f'/api/signed-pdf/{candidate_name}?profile={profile_name}'
-        })
+        body, status = sign_offer(data, signature_bytes)
+        return jsonify(body), status
         
+    except SignatureTooLarge as e:
+        return jsonify({'success': False, 'message': str(e)}), 413
+    except ValueError as e:
+        # SignatureError or a malformed JSON body
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         import traceback
         print(traceback.format_exc())
@@ -303,25 +402,33 @@ def get_signed_pdf(candidate_name):
     """Serve the signed PDF"""
     try:
         profile_name = request.args.get('profile', 'melange')
-        pdf_file = OUTPUT_DIR / profile_name / f'offer_letter_{candidate_name}_signed.pdf'
+        pdf_file = get_offer_store().artifact(profile_name, candidate_name, 'signed_pdf')
         
-        if pdf_file.exists():
-            return send_file(pdf_file, 
-                           mimetype='application/pdf',
-                           as_attachment=True,
-                           download_name=f'offer_letter_{candidate_name}_signed.pdf')
-        else:
+        response = pdf_response([pdf_file] if pdf_file else [], as_attachment=True,
+                                download_name=f'offer_letter_{candidate_name}_signed.pdf')
+        if response is None:
             return jsonify({'success': False, 'message': 'Signed PDF not found'}), 404
+        return response
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
-if __name__ == '__main__':
+def startup():
+    """Process start-up shared by the debug server and the ASGI server (asgi_server.py)"""
     # Ensure output directory exists
     OUTPUT_DIR.mkdir(exist_ok=True)
     
+    # Load and validate every profile up front, then pick up edits without a restart
+    get_registry().start_watching()
+    get_offer_store()
+    get_outbox()
+
+if __name__ == '__main__':
+    startup()
+    
     print("🚀 Starting signature collection server...")
     print("📝 Open http://localhost:5001 in your browser")
     print("✍️  Candidates can sign their offer letters digitally!")
+    print("💡 Development server; use run_server.py in production")
     
     # Check if templates and output exist
     if not (OUTPUT_DIR / 'melange').exists():
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Signature Ingestion
+Reads signature uploads with a hard size limit, normalizes them with PIL
+(whitespace cropped, downscaled to print resolution, reduced to a 1-bit PNG)
+and stores them content-addressed, so resubmitting the same signature reuses
+one small file.
+
+Settings (environment):
+  OFFER_MAX_SIGNATURE_KB  largest accepted signature image (default 2048)
+  OFFER_SIGNATURE_DIR     store directory (default output/signatures)
+"""
+
+import base64
+import binascii
+import hashlib
+import os
+import threading
+from io import BytesIO
+from pathlib import Path
+
+from metrics import timed
+
+MAX_SIGNATURE_BYTES = int(os.getenv('OFFER_MAX_SIGNATURE_KB', '2048')) * 1024
+# Room for base64 (4/3) plus the other JSON fields of a data-URL submission
+MAX_REQUEST_BYTES = MAX_SIGNATURE_BYTES * 4 // 3 + 64 * 1024
+SIGNATURE_DIR = Path(os.getenv('OFFER_SIGNATURE_DIR', 'output/signatures'))
+
+# Signatures are stamped 2in wide; 300 dpi is plenty for print
+MAX_SIZE = (600, 200)
+MAX_PIXELS = 25_000_000
+INK_THRESHOLD = 160
+PADDING = 4
+CHUNK_SIZE = 64 * 1024
+
+
+class SignatureError(ValueError):
+    """Raised for a missing, oversized or undecodable signature"""
+
+
+class SignatureTooLarge(SignatureError):
+    """Raised when a signature exceeds MAX_SIGNATURE_BYTES"""
+
+
+def read_limited(stream, limit=MAX_SIGNATURE_BYTES):
+    """Read a stream in chunks, failing as soon as it grows past `limit` bytes"""
+    buffer = BytesIO()
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if buffer.tell() + len(chunk) > limit:
+            raise SignatureTooLarge(f'Signature larger than {limit // 1024} KB')
+        buffer.write(chunk)
+    return buffer.getvalue()
+
+
+def decode_data_url(data, limit=MAX_SIGNATURE_BYTES):
+    """Bytes of a base64 data URL (or bare base64), size-checked before decoding"""
+    if not data:
+        raise SignatureError('No signature provided')
+    encoded = data.split(',', 1)[1] if data.startswith('data:') else data
+    if len(encoded) * 3 // 4 > limit:
+        raise SignatureTooLarge(f'Signature larger than {limit // 1024} KB')
+    try:
+        return base64.b64decode(encoded, validate=True)
+    except binascii.Error as e:
+        # Fixed messages: the decoder's own text describes internals, not the upload
+        raise SignatureError('Invalid signature encoding') from e
+
+
+def normalize_signature(raw):
+    """Crop, downscale and binarize a signature image; returns PNG bytes"""
+    # PIL loads with the first signature, not with every importer of this module
+    from PIL import Image, ImageOps
+    try:
+        image = Image.open(BytesIO(raw))
+        if image.width * image.height > MAX_PIXELS:
+            raise SignatureTooLarge(f'Signature image is {image.width}x{image.height} pixels')
+        image.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise SignatureError('Unreadable signature image (expected PNG, JPEG or another common format)') from e
+
+    # Transparent canvas exports: flatten onto white before looking at ink
+    image = image.convert('RGBA')
+    page = Image.new('RGBA', image.size, (255, 255, 255, 255))
+    gray = Image.alpha_composite(page, image).convert('L')
+
+    ink = ImageOps.invert(gray).point(lambda v: 255 if v > 255 - INK_THRESHOLD else 0)
+    bbox = ink.getbbox()
+    if bbox is None:
+        raise SignatureError('Signature is empty')
+    left, top, right, bottom = bbox
+    gray = gray.crop((max(0, left - PADDING), max(0, top - PADDING),
+                      min(gray.width, right + PADDING), min(gray.height, bottom + PADDING)))
+
+    gray.thumbnail(MAX_SIZE, Image.LANCZOS)
+    bilevel = gray.point(lambda v: 255 if v > INK_THRESHOLD else 0).convert('1', dither=Image.NONE)
+
+    out = BytesIO()
+    bilevel.save(out, 'PNG', optimize=True)
+    return out.getvalue()
+
+
+def store_signature(png):
+    """Save normalized PNG bytes under their SHA-256; returns the stored path"""
+    digest = hashlib.sha256(png).hexdigest()
+    path = SIGNATURE_DIR / digest[:2] / f'{digest}.png'
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp.write_bytes(png)
+        os.replace(tmp, path)
+    return path
+
+
+@timed('signature_decode')
+def ingest_signature(raw):
+    """Normalize and store an uploaded signature; returns the stored path"""
+    if len(raw) > MAX_SIGNATURE_BYTES:
+        raise SignatureTooLarge(f'Signature larger than {MAX_SIGNATURE_BYTES // 1024} KB')
+    return store_signature(normalize_signature(raw))
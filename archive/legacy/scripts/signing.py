@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Offer Signing
+Stores a candidate's signature and stamps it onto their rendered offer PDF
+(see signature_store.py and pdf_stamp.py), then marks the offer signed. Used
+by both servers and by `offer sign` for signatures collected on paper or by
+email.
+
+Usage: python3 signing.py <profile> <Candidate_Name> <signature.png> [--date TEXT]
+"""
+
+import argparse
+import sys
+
+from offer_store import SIGNED, get_offer_store
+
+
+def sign_offer(data, signature_bytes):
+    """Store a signature and stamp it onto the candidate's PDF; returns (body, status)
+
+    Raises SignatureError (a ValueError) or SignatureTooLarge for a bad signature."""
+    # PIL and pypdf load with the first signature
+    from pdf_stamp import StampError, stamp_signature
+    from signature_store import ingest_signature
+
+    candidate_name = data.get('candidate', 'Mariya_Fatima')
+    profile_name = data.get('profile', 'melange')
+    signature_date = data.get('date', '')
+
+    # Cropped 1-bit copy, shared by identical submissions
+    sig_image_path = ingest_signature(signature_bytes)
+
+    store = get_offer_store()
+    pdf_path = store.artifact(profile_name, candidate_name, 'pdf')
+    if pdf_path is None or not pdf_path.exists():
+         return {'success': False, 'message': f'Offer PDF for {candidate_name} not found'}, 404
+
+    signed_pdf_path = pdf_path.with_name(f'{pdf_path.stem}_signed.pdf')
+
+    # Overlay signature and date at the anchor recorded when the PDF was rendered
+    try:
+        stamp_signature(pdf_path, sig_image_path, signature_date, signed_pdf_path)
+    except StampError as e:
+        return {'success': False, 'message': str(e)}, 409
+    store.record_artifact(profile_name, candidate_name, 'signature', sig_image_path)
+    store.record_artifact(profile_name, candidate_name, 'signed_pdf', signed_pdf_path)
+    store.advance(profile_name, candidate_name, SIGNED)
+
+    return {
+        'success': True,
+        'message': 'Signature submitted successfully',
+        'signed_pdf_url': f'/api/signed-pdf/{candidate_name}?profile={profile_name}'
+    }, 200
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='offer.py sign', description="Stamp a signature onto a candidate's offer letter")
+    parser.add_argument('profile')
+    parser.add_argument('candidate', help='candidate name (spaces or underscores)')
+    parser.add_argument('signature', help='signature image (PNG, JPEG, ...)')
+    parser.add_argument('--date', default='', help='date printed under the signature')
+    args = parser.parse_args(argv)
+
+    from signature_store import SignatureError, read_limited
+    try:
+        with open(args.signature, 'rb') as f:
+            signature_bytes = read_limited(f)
+        body, status = sign_offer({'candidate': args.candidate, 'profile': args.profile, 'date': args.date},
+                                  signature_bytes)
+    except (OSError, SignatureError) as e:
+        print(f"❌ {e}")
+        return 1
+    if status != 200:
+        print(f"❌ {body['message']}")
+        return 1
+    print(f"✅ Signed: {get_offer_store().artifact(args.profile, args.candidate, 'signed_pdf')}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
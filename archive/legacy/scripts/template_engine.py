@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Compiled Offer Letter Templates
+Parses a DOCX template once, merges placeholders that Word split across runs,
+and records the text node (slot) holding every {{...}} placeholder so each
+letter is a direct write into known slots instead of a full document scan.
+
+Rendering works on the ZIP package directly: only the XML parts that contain
+placeholders are re-serialized; every other member (images, fonts, styles) is
+copied into the output byte-for-byte without being decompressed (on Python
+versions whose zipfile internals are known; others copy via the public API).
+"""
+
+import copy
+import hashlib
+import os
+import re
+import shutil
+import sys
+import threading
+import zipfile
+from pathlib import Path
+
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.oxml.ns import qn
+from lxml import etree
+
+from metrics import span, timed
+
+# Bump whenever a change here (or in PDF conversion) alters rendered output;
+# it is part of every render cache key
+RENDERER_VERSION = 2
+
+PLACEHOLDER_RE = re.compile(r'\{\{[^{}]+\}\}')
+
+# Parts that carry letter text: body (incl. tables and text boxes), headers, footers
+TEXT_PART_TYPES = (CT.WML_DOCUMENT_MAIN, CT.WML_HEADER, CT.WML_FOOTER)
+CONTENT_TYPES_PART = '[Content_Types].xml'
+CT_OVERRIDE = '{http://schemas.openxmlformats.org/package/2006/content-types}Override'
+
+W_P = qn('w:p')
+W_T = qn('w:t')
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+
+# Raw member copies use zipfile internals that are unchanged across these versions;
+# any other interpreter copies through the public API instead
+RAW_COPY_VERSIONS = ((3, 8), (3, 14))
+ZIP_INTERNALS = ('fp', 'filelist', 'NameToInfo', 'start_dir', '_didModify')
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _text_part_names(package):
+    """Member names of every part in the package that can contain placeholders"""
+    content_types = etree.fromstring(package.read(CONTENT_TYPES_PART))
+    return [
+        override.get('PartName').lstrip('/')
+        for override in content_types.iter(CT_OVERRIDE)
+        if override.get('ContentType') in TEXT_PART_TYPES
+    ]
+
+
+def _raw_copy_supported(target):
+    """True if the running zipfile matches the internals _copy_member_raw relies on"""
+    low, high = RAW_COPY_VERSIONS
+    return low <= sys.version_info[:2] <= high and all(hasattr(target, name) for name in ZIP_INTERNALS)
+
+
+def _copy_member(source, target, info):
+    """Copy a member through the public API (decompressed and compressed again)"""
+    copied = zipfile.ZipInfo(info.filename, info.date_time)
+    copied.compress_type = info.compress_type
+    copied.external_attr = info.external_attr
+    with source.open(info) as src, target.open(copied, 'w') as dst:
+        shutil.copyfileobj(src, dst, 1 << 16)
+
+
+def _copy_member_raw(source, target, info):
+    """Copy a member's compressed bytes from one open ZipFile into another"""
+    source.fp.seek(info.header_offset)
+    header = source.fp.read(zipfile.sizeFileHeader)
+    name_length = int.from_bytes(header[26:28], 'little')
+    extra_length = int.from_bytes(header[28:30], 'little')
+    source.fp.seek(info.header_offset + zipfile.sizeFileHeader + name_length + extra_length)
+
+    copied = copy.copy(info)
+    copied.flag_bits &= ~0x08  # sizes and CRC are known, no trailing data descriptor
+    copied.header_offset = target.fp.tell()
+    target.fp.write(copied.FileHeader())
+
+    remaining = info.compress_size
+    while remaining:
+        chunk = source.fp.read(min(remaining, 1 << 16))
+        if not chunk:
+            raise zipfile.BadZipFile(f'Truncated member {info.filename}')
+        target.fp.write(chunk)
+        remaining -= len(chunk)
+
+    # zipfile has no public raw-copy API; register the entry so close() writes its
+    # central directory record
+    target.filelist.append(copied)
+    target.NameToInfo[copied.filename] = copied
+    target.start_dir = target.fp.tell()
+    target._didModify = True
+
+
+@timed('save')
+def write_package(template_path, rendered_parts, output_path):
+    """Write a DOCX with rendered_parts replaced and every other member copied raw"""
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(f'.{output_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        with zipfile.ZipFile(template_path) as source, \
+                zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as target:
+            copy_member = _copy_member_raw if _raw_copy_supported(target) else _copy_member
+            for info in source.infolist():
+                if info.filename in rendered_parts:
+                    target.writestr(zipfile.ZipInfo(info.filename, info.date_time),
+                                    rendered_parts[info.filename], zipfile.ZIP_DEFLATED)
+                else:
+                    copy_member(source, target, info)
+        # Atomic so readers never see a half-written letter
+        os.replace(tmp_path, output_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return output_path
+
+
+def _own_text_nodes(paragraph):
+    """Text nodes belonging to this paragraph (not to a nested text box paragraph)"""
+    return [
+        t for t in paragraph.iter(W_T)
+        if next(t.iterancestors(W_P)) is paragraph
+    ]
+
+
+def _merge_split_placeholders(nodes):
+    """Move every placeholder into the text node where it starts"""
+    texts = [t.text or '' for t in nodes]
+    full_text = ''.join(texts)
+    if '{{' not in full_text:
+        return False
+
+    # Offset of each node's first character within the paragraph text
+    starts = []
+    offset = 0
+    for text in texts:
+        starts.append(offset)
+        offset += len(text)
+
+    def locate(pos):
+        for i in range(len(texts) - 1, -1, -1):
+            if starts[i] <= pos and (texts[i] or i == 0):
+                return i
+        return 0
+
+    # Right to left so the offsets of earlier matches stay valid
+    for match in reversed(list(PLACEHOLDER_RE.finditer(full_text))):
+        first = locate(match.start())
+        last = locate(match.end() - 1)
+        if first == last:
+            continue
+        texts[first] = texts[first][:match.start() - starts[first]] + match.group()
+        for i in range(first + 1, last):
+            texts[i] = ''
+        texts[last] = texts[last][match.end() - starts[last]:]
+
+    for node, text in zip(nodes, texts):
+        if node.text != text:
+            node.text = text
+    return True
+
+
+class CompiledTemplate:
+    """A parsed DOCX template with a precomputed placeholder slot index"""
+
+    def __init__(self, template_path):
+        self.path = Path(template_path)
+        self.parts = {}
+        self.slots = []
+        self.placeholders = set()
+        self._lock = threading.Lock()
+        with open(self.path, 'rb') as f:
+            self.content_hash = hashlib.sha256(f.read()).hexdigest()
+
+        with zipfile.ZipFile(self.path) as package:
+            for name in _text_part_names(package):
+                root = etree.fromstring(package.read(name))
+                if self._compile_part(root):
+                    self.parts[name] = root
+
+    def _compile_part(self, root):
+        """Index the slots of one XML part; returns True if it has any"""
+        slot_count = len(self.slots)
+        for paragraph in root.iter(W_P):
+            nodes = _own_text_nodes(paragraph)
+            if not nodes or not _merge_split_placeholders(nodes):
+                continue
+            for node in nodes:
+                text = node.text or ''
+                if '{{' not in text:
+                    continue
+                # Alternating literal / placeholder segments, placeholders at odd indexes
+                segments = re.split(r'(\{\{[^{}]+\}\})', text)
+                if len(segments) == 1:
+                    continue
+                node.set(XML_SPACE, 'preserve')
+                self.slots.append((node, segments))
+                self.placeholders.update(segments[1::2])
+        return len(self.slots) > slot_count
+
+    def fill(self, replacements):
+        """Write replacement values into every slot (unknown placeholders are kept)"""
+        for node, segments in self.slots:
+            node.text = ''.join(
+                str(replacements.get(segment, segment)) if i % 2 else segment
+                for i, segment in enumerate(segments)
+            )
+
+    def render(self, replacements, output_path):
+        """Fill the template and write the letter to output_path"""
+        with self._lock, span('fill'):
+            self.fill(replacements)
+            rendered = {
+                name: etree.tostring(root, encoding='UTF-8', standalone=True)
+                for name, root in self.parts.items()
+            }
+        return write_package(self.path, rendered, output_path)
+
+
+def load_template(template_path):
+    """Return the compiled template for a path, recompiling if the file changed"""
+    path = Path(template_path).resolve()
+    stat = path.stat()
+    version = (stat.st_mtime_ns, stat.st_size)
+
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached and cached[0] == version:
+            return cached[1]
+
+    with span('template_load'):
+        compiled = CompiledTemplate(path)
+    with _cache_lock:
+        _cache[path] = (version, compiled)
+    return compiled
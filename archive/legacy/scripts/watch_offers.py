@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Offer Watch Mode
+Keeps generated letters in step with their inputs. Every letter depends on
+its profile's config.json, its template (DOCX or letter spec) and the
+candidate's JSON file; the watcher polls those files, waits for edits to
+settle (debounce), works out which letters a change touches and regenerates
+only those, in parallel. Outputs are replaced atomically, so the server never
+serves a half-written letter. Signed offers are never regenerated.
+
+Letters are the ones already in the offer store; a new candidate file gets a
+letter for the profile named in its "profile" key, or for --profile.
+
+Usage: python3 watch_offers.py [--data DIR]... [--profile NAME] [--interval 1]
+                               [--debounce 0.5] [--workers N] [--once]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from generate_offer import generate_offer_internal, offer_docx_path
+from offer_store import DATA_DIRS, NEW, SIGNED, candidate_slug, get_offer_store
+from profile_registry import ProfileError, get_registry
+
+DEFAULT_WORKERS = int(os.getenv('OFFER_JOB_WORKERS', '4'))
+
+
+def _version(path):
+    try:
+        stat = path.stat()
+        return (stat.st_mtime_ns, stat.st_size)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+class OfferWatcher:
+    """Dependency tracking between profile files, candidate files and letters"""
+
+    def __init__(self, data_dirs=DATA_DIRS, default_profile=None, workers=DEFAULT_WORKERS):
+        self.data_dirs = [Path(d) for d in data_dirs]
+        self.default_profile = default_profile
+        self.workers = max(1, workers)
+        self.registry = get_registry()
+        self.store = get_offer_store()
+        # path -> (stat version, content digest, parsed data or None)
+        self.candidates = {}
+        # path -> stat version, for every profile config / template / spec
+        self.profile_files = {}
+        self._initialized = False
+        self.scan()
+
+    # --- inputs -------------------------------------------------------------
+
+    def profile_inputs(self):
+        """{input path: profile name} for every loaded profile"""
+        inputs = {}
+        for name in self.registry.names():
+            profile = self.registry.get(name)
+            inputs[self.registry.root / name / 'config.json'] = name
+            inputs[profile.template_path] = name
+            if profile.spec is not None:
+                inputs[profile.spec.path] = name
+        return inputs
+
+    def _read_candidate(self, path):
+        try:
+            raw = path.read_bytes()
+        except FileNotFoundError:
+            return None, None
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            # Usually an editor mid-save; the next settled change will be picked up
+            data = None
+        if not isinstance(data, dict) or not data.get('name'):
+            data = None
+        return hashlib.sha256(raw).hexdigest(), data
+
+    def scan(self):
+        """Changed inputs since the last scan: (changed profile names, changed candidate data)"""
+        changed_files = {path for path, version in self.profile_files.items() if _version(path) != version}
+        if changed_files or self._profiles_dir_changed():
+            self.registry.reload()
+        inputs = self.profile_inputs()
+        profiles = {inputs[path] for path in changed_files if path in inputs}
+        if self._initialized:
+            # New profiles, or a config edit that points at a different template
+            profiles |= {name for path, name in inputs.items() if path not in self.profile_files}
+        self.profile_files = {path: _version(path) for path in inputs}
+
+        changed_candidates = []
+        seen = set()
+        for directory in self.data_dirs:
+            for path in sorted(directory.glob('*.json')) if directory.is_dir() else []:
+                seen.add(path)
+                version = _version(path)
+                previous = self.candidates.get(path)
+                if previous and previous[0] == version:
+                    continue
+                digest, data = self._read_candidate(path)
+                if previous and previous[1] == digest:
+                    # Touched or rewritten with identical content
+                    self.candidates[path] = (version, digest, previous[2])
+                    continue
+                self.candidates[path] = (version, digest, data)
+                if data is not None and (previous is not None or self._initialized):
+                    changed_candidates.append(data)
+        for path in set(self.candidates) - seen:
+            del self.candidates[path]
+        self._initialized = True
+        return profiles, changed_candidates
+
+    def _profiles_dir_changed(self):
+        root = self.registry.root
+        names = {d.name for d in root.iterdir() if d.is_dir()} if root.is_dir() else set()
+        return names != set(self.registry.names()) | set(self.registry.errors)
+
+    def candidate_files(self):
+        """{slug: candidate data} for every readable candidate file"""
+        return {candidate_slug(data['name']): data
+                for _, _, data in self.candidates.values() if data is not None}
+
+    # --- dependencies -------------------------------------------------------
+
+    def letters_for_profile(self, profile_name):
+        """{(profile, slug): data} of every unsigned letter a profile has generated"""
+        files = self.candidate_files()
+        letters = {}
+        for row in self.store.list(profile=profile_name, limit=-1):
+            if row['status'] in (NEW, SIGNED):
+                continue
+            # The candidate file is the source of truth; web-form letters use the stored data
+            data = files.get(row['slug']) or row['data']
+            if data.get('name'):
+                letters[(profile_name, row['slug'])] = data
+        return letters
+
+    def letters_for_candidate(self, data):
+        """{(profile, slug): data} of the letters a candidate file feeds"""
+        profiles = set(self.store.letter_profiles(data['name']))
+        if data.get('profile'):
+            profiles.add(data['profile'])
+        if not profiles and self.default_profile:
+            profiles.add(self.default_profile)
+        slug = candidate_slug(data['name'])
+        letters = {}
+        for profile_name in profiles:
+            row = self.store.get(profile_name, data['name'])
+            if row and row['profile'] == profile_name and row['status'] == SIGNED:
+                print(f"⏭️  {profile_name}/{data['name']}: already signed, not regenerated")
+                continue
+            letters[(profile_name, slug)] = data
+        return letters
+
+    def affected(self, profiles, candidates):
+        """The minimal set of letters to regenerate for a batch of changes"""
+        letters = {}
+        for profile_name in profiles:
+            letters.update(self.letters_for_profile(profile_name))
+        for data in candidates:
+            letters.update(self.letters_for_candidate(data))
+        return letters
+
+    def stale(self):
+        """Letters whose DOCX is missing or older than any of their inputs (startup catch-up)"""
+        inputs = self.profile_inputs()
+        files = {candidate_slug(data['name']): path
+                 for path, (_, _, data) in self.candidates.items() if data is not None}
+        letters = {}
+        for profile_name in self.registry.names():
+            newest = max((path.stat().st_mtime for path, name in inputs.items()
+                          if name == profile_name and path.exists()), default=0)
+            for key, data in self.letters_for_profile(profile_name).items():
+                docx = offer_docx_path(profile_name, data)
+                source = files.get(key[1])
+                needed = max(newest, source.stat().st_mtime if source else 0)
+                if not docx.exists() or docx.stat().st_mtime < needed:
+                    letters[key] = data
+        return letters
+
+    # --- regeneration -------------------------------------------------------
+
+    def regenerate(self, letters):
+        """Regenerate letters in parallel; returns the number that failed"""
+        if not letters:
+            return 0
+
+        def run(item):
+            (profile_name, _), data = item
+            try:
+                generate_offer_internal(profile_name, data)
+                return None
+            except ProfileError as e:
+                return f"{e}"
+            except Exception as e:
+                return f"{profile_name}/{data['name']}: {e}"
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='offer-watch') as executor:
+            errors = [error for error in executor.map(run, letters.items()) if error]
+        for error in errors:
+            print(f"❌ {error}")
+        names = ', '.join(f'{profile}/{slug}' for profile, slug in sorted(letters))
+        print(f"🔄 Regenerated {len(letters) - len(errors)}/{len(letters)} letter(s) "
+              f"in {time.perf_counter() - started:.2f}s: {names}")
+        return len(errors)
+
+    def run(self, interval=1.0, debounce=0.5):
+        """Poll forever, regenerating affected letters once changes have settled"""
+        pending_profiles, pending_candidates = set(), []
+        last_change = None
+        while True:
+            time.sleep(interval)
+            try:
+                profiles, candidates = self.scan()
+            except Exception as e:
+                print(f"⚠️  Scan failed: {e}")
+                continue
+            if profiles or candidates:
+                pending_profiles |= profiles
+                pending_candidates += candidates
+                last_change = time.monotonic()
+                continue
+            if last_change is not None and time.monotonic() - last_change >= debounce:
+                self.regenerate(self.affected(pending_profiles, pending_candidates))
+                pending_profiles, pending_candidates = set(), []
+                last_change = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Regenerate offer letters when their inputs change')
+    parser.add_argument('--data', action='append', help='candidate JSON directory (repeatable)')
+    parser.add_argument('--profile', help='profile for new candidate files without a "profile" key')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between polls')
+    parser.add_argument('--debounce', type=float, default=0.5, help='quiet seconds before regenerating')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--once', action='store_true', help='only bring stale letters up to date, then exit')
+    args = parser.parse_args(argv)
+
+    watcher = OfferWatcher(args.data or DATA_DIRS, args.profile, args.workers)
+    print(f"👀 Watching {len(watcher.profile_files)} profile file(s) and "
+          f"{len(watcher.candidates)} candidate file(s)")
+    failed = watcher.regenerate(watcher.stale())
+    if args.once:
+        return 1 if failed else 0
+    try:
+        watcher.run(args.interval, args.debounce)
+    except KeyboardInterrupt:
+        print("\n👋 Stopped watching")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -40,6 +40,26 @@ document.addEventListener('DOMContentLoaded', () => {
         logContainer.scrollTop = logContainer.scrollHeight;
     }
 
+    // Follow a generation job until its PDF is ready (or it fails)
+    function waitForJob(job) {
+        return new Promise((resolve) => {
+            const events = new EventSource(job.events_url);
+            events.addEventListener('filled', () => addLog('Letter filled, converting to PDF...', 'info'));
+            events.addEventListener('converted', () => {
+                events.close();
+                resolve(job);
+            });
+            events.addEventListener('failed', (event) => {
+                events.close();
+                resolve({ success: false, message: JSON.parse(event.data).error });
+            });
+            events.onerror = () => {
+                events.close();
+                resolve({ success: false, message: 'Lost connection to job status' });
+            };
+        });
+    }
+
     // Generate Offer
     btnGenerate.addEventListener('click', async () => {
         if (!offerForm.checkValidity()) {
@@ -73,7 +93,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 })
             });
 
-            const result = await response.json();
+            const queued = await response.json();
+            const result = queued.success ? await waitForJob(queued) : queued;
             if (result.success) {
                 addLog(`Success! PDF generated.`, 'success');
                 currentPdfUrl = result.pdf_url;
@@ -112,13 +133,14 @@ document.addEventListener('DOMContentLoaded', () => {
                 body: JSON.stringify({
                     profile: profileSelect.value,
                     candidate_name: currentCandidateData.name,
-                    candidate_email: currentCandidateData.email
+                    candidate_email: currentCandidateData.email,
+                    candidate: currentCandidateData
                 })
             });
 
             const result = await response.json();
             if (result.success) {
-                addLog(`Email sent successfully to ${currentCandidateData.name}!`, 'success');
+                addLog(`Email to ${currentCandidateData.name} queued for delivery.`, 'success');
             } else {
                 addLog(`Failed to send email: ${result.message}`, 'error');
             }
@@ -163,6 +185,9 @@ document.addEventListener('DOMContentLoaded', () => {
                 if (data.salary) document.getElementById('salary').value = data.salary;
                 if (data.test_date) document.getElementById('test_date').value = data.test_date;
 
+                if (result.warning) {
+                    addLog(`AI unavailable, filled recognised fields only: ${result.warning}`, 'info');
+                }
                 addLog('Form filled by AI! Please review and click Generate.', 'success');
             } else {
                 addLog(`AI Parsing failed: ${result.message}`, 'error');
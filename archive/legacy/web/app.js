@@ -101,7 +101,7 @@ loadOfferPreview();
 // View full PDF
 document.getElementById('viewFullPdf').addEventListener('click', () => {
     const { candidate, profile } = getUrlParams();
-    window.open(`/api/offer-pdf/${candidate}?profile=${profile}`, '_blank');
+    window.open(`/api/offer-pdf/${candidate}?profile=${profile}&view=candidate`, '_blank');
 });
 
 // Submit signature
@@ -118,21 +118,21 @@ submitButton.addEventListener('click', async () => {
             throw new Error('Please provide your signature');
         }
 
-        // Convert canvas to image
-        const signatureData = signaturePad.toDataURL('image/png');
+        // Upload the canvas as a raw PNG (no base64 inflation)
+        const signatureBlob = await new Promise(resolve => canvas.toBlob(resolve, 'image/png'));
         const { candidate, profile } = getUrlParams();
+        const params = new URLSearchParams({
+            candidate: candidate,
+            profile: profile,
+            date: dateInput.value
+        });
 
-        const response = await fetch('/api/submit-signature', {
+        const response = await fetch(`/api/submit-signature?${params}`, {
             method: 'POST',
             headers: {
-                'Content-Type': 'application/json'
+                'Content-Type': 'image/png'
             },
-            body: JSON.stringify({
-                candidate: candidate,
-                profile: profile,
-                signature: signatureData,
-                date: dateInput.value
-            })
+            body: signatureBlob
         });
 
         const result = await response.json();